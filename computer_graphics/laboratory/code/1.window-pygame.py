@@ -6,17 +6,23 @@
 Для wibdwos можно брать отсюда http://www.lfd.uci.edu/~gohlke/pythonlibs/
 """
 
+import sys
+
 import pygame
 from pygame.locals import *
 
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+from frame_stats import FrameStats
+from profiling import profiler
+from text_overlay import TextOverlay
+
 
 class Controller(object):
     """Основной класс для создания окна и запуска цикла рендеринга"""
 
-    def __init__(self, w=800, h=600, name="Lab", frame_rate=60):
+    def __init__(self, w=800, h=600, name="Lab", frame_rate=60, context=None, overlay=False):
         """Конструктор нашего класса
 
         Принимает параметры размера окна, название окна и ограничение количества кадров всекунду
@@ -27,11 +33,22 @@ class Controller(object):
         self.frame_rate = frame_rate
         self.screen = None  # ссылка на созданное коно
         self.clock = None  # вспомогательный объект для контроля FPS
+        self.context = context  # контекст без окна (headless.OffscreenContext), None - обычное окно
+        self.stats = FrameStats()  # статистика кадров, snapshot() - для внешних инструментов
+        self.show_overlay = overlay  # статистика текстом поверх сцены
+        self.overlay = None  # TextOverlay, создается в init
 
     def init(self):
         """Создание окна, инициализация"""
-        self.screen = pygame.display.set_mode((self.w, self.h), HWSURFACE | OPENGL | DOUBLEBUF | RESIZABLE)
-        pygame.display.set_caption(self.name)
+        if self.context is None:
+            self.screen = pygame.display.set_mode((self.w, self.h), HWSURFACE | OPENGL | DOUBLEBUF | RESIZABLE)
+            pygame.display.set_caption(self.name)
+        else:
+            # без окна и дисплея: рисуем в буфер кадра (FBO) offscreen-контекста
+            self.context.init(self.w, self.h)
+        if self.show_overlay:
+            # атлас глифов загружается в GPU, поэтому только после создания контекста
+            self.overlay = TextOverlay()
         glEnable(GL_DEPTH_TEST)
         self.clock = pygame.time.Clock()
 
@@ -39,26 +56,38 @@ class Controller(object):
         """Обратока цикла рендеринга pygame"""
         # задаем максимальное количество кадров в секунду
         self.clock.tick(self.frame_rate)
-        # считываем все произошедшие событие
-        for event in pygame.event.get():
-            # обробатываем выход из приложения
-            if event.type == QUIT:
-                self.quit()
-                return
-            if event.type == KEYUP and event.key == K_ESCAPE:
-                self.quit()
-                return
-            # обрабатываем изменение размера окна
-            if event.type == VIDEORESIZE:
-                self.reshape(*event.size)
-            # обработка события
-            self.event(event)
+        profiler.next_frame()
+        self.stats.add(self.clock.get_time())
+        # считываем все произошедшие событие (без окна их нет)
+        with profiler.scope('events'):
+            events = pygame.event.get() if self.context is None else ()
+            for event in events:
+                # обробатываем выход из приложения
+                if event.type == QUIT:
+                    self.quit()
+                    return
+                if event.type == KEYUP and event.key == K_ESCAPE:
+                    self.quit()
+                    return
+                # обрабатываем изменение размера окна
+                if event.type == VIDEORESIZE:
+                    self.reshape(*event.size)
+                # обработка события
+                self.event(event)
         # что-то рисуем
-        self.render()
+        with profiler.scope('render'):
+            self.render()
         # показываем в залоговке окна FPS
-        self.fps()
+        with profiler.scope('fps'):
+            self.fps()
+        if self.context is not None:
+            # без окна: кадр остается в буфере кадра, его можно считать context.read()
+            with profiler.scope('swap'):
+                self.context.swap()
+            return
         # смена кадров, т.к. мы используем DOUBLEBUF ражим
-        pygame.display.flip()
+        with profiler.scope('flip'):
+            pygame.display.flip()
 
     def quit(self):
         """Выход из приложения, закрытие окна"""
@@ -80,8 +109,17 @@ class Controller(object):
         pass
 
     def fps(self):
-        """Рисуем текущий FPS"""
-        pygame.display.set_caption("%s FPS: %s" % (self.name, self.clock.get_fps()))
+        """Рисуем текущий FPS: заголовок окна обновляется не чаще двух раз в секунду"""
+        if self.stats.due():
+            if self.context is None:
+                pygame.display.set_caption("%s FPS: %.1f" % (self.name, self.stats.fps))
+            if self.overlay is not None:
+                text = self.stats.format()
+                if profiler.enabled:
+                    text += '\n' + profiler.report()
+                self.overlay.set_text(text)
+        if self.overlay is not None:
+            self.overlay.render(self.w, self.h)
 
     def run(self):
         """Запуск приложения"""
@@ -94,5 +132,9 @@ class Controller(object):
 
 
 if __name__ == '__main__':
-    main = Controller()
+    # с ключом --profile время фаз кадра пишется в trace.json (chrome://tracing)
+    if '--profile' in sys.argv:
+        profiler.enable('trace.json')
+    # с ключом --stats статистика кадров рисуется поверх сцены
+    main = Controller(overlay='--stats' in sys.argv)
     main.run()
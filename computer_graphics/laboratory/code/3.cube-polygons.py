@@ -5,12 +5,19 @@
 *Задание: использовать glDrawElements вместо glBegin|glEnd
 """
 
+import sys
+
 import pygame
 from pygame.locals import *
 
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+from buffers import MeshBuffer
+from frame_stats import FrameStats
+from profiling import profiler
+from text_overlay import TextOverlay
+
 
 class Camera(object):
     """Класс для управления камерой
@@ -29,8 +36,11 @@ class Camera(object):
 
 class Cube(object):
     """Класс для создание и отрисовки куба"""
-    def __init__(self):
-        """Заполняем массивы вершин и полигонов"""
+    def __init__(self, retained=False):
+        """Заполняем массивы вершин и полигонов
+
+        retained - рисовать через VBO|IBO и glDrawElements вместо glBegin|glEnd
+        """
         self.verticies = (
             (1, -1, -1),  #0
             (1, 1, -1),   #1
@@ -58,11 +68,20 @@ class Cube(object):
             (0.0, 0.0, 1.0),
             (1.0, 0.0, 1.0),
         )
+        self.retained = retained
+        self.buffer = None
+        if self.retained:
+            # упаковываем геометрию в буферы один раз
+            self.buffer = MeshBuffer.from_faces(self.verticies, self.faces, colors=self.colors).upload()
 
     def render(self):
         """Рисуем куб ввиде полигонов, добавляем цвет"""
         glMatrixMode(GL_MODELVIEW)
         glRotatef(1, 3, 1, 1)
+        if self.retained:
+            # вся геометрия рисуется одним вызовом glDrawElements
+            self.buffer.render(uv=False, color=True)
+            return
         glBegin(GL_QUADS)
         for fi, faces in enumerate(self.faces):
             glColor3fv(self.colors[fi])
@@ -74,7 +93,7 @@ class Cube(object):
 class Controller(object):
     """Основной класс для создания окна и запуска цикла рендеринга"""
 
-    def __init__(self, w=800, h=600, name="Lab", frame_rate=60):
+    def __init__(self, w=800, h=600, name="Lab", frame_rate=60, retained=False, context=None, overlay=False):
         """Конструктор нашего класса
 
         Принимает параметры размера окна, название окна и ограничение количества кадров всекунду
@@ -85,43 +104,67 @@ class Controller(object):
         self.frame_rate = frame_rate
         self.screen = None  # ссылка на созданное коно
         self.clock = None  # вспомогательный объект для контроля FPS
+        self.context = context  # контекст без окна (headless.OffscreenContext), None - обычное окно
+        self.stats = FrameStats()  # статистика кадров, snapshot() - для внешних инструментов
+        self.show_overlay = overlay  # статистика текстом поверх сцены
+        self.overlay = None  # TextOverlay, создается в init
         self.cube = None
+        self.retained = retained  # режим отрисовки куба (VBO или glBegin|glEnd)
         self.camera = Camera(w, h)
 
     def init(self):
         """Создание окна, инициализация"""
-        self.screen = pygame.display.set_mode((self.w, self.h), HWSURFACE | OPENGL | DOUBLEBUF | RESIZABLE)
-        pygame.display.set_caption(self.name)
+        if self.context is None:
+            self.screen = pygame.display.set_mode((self.w, self.h), HWSURFACE | OPENGL | DOUBLEBUF | RESIZABLE)
+            pygame.display.set_caption(self.name)
+        else:
+            # без окна и дисплея: рисуем в буфер кадра (FBO) offscreen-контекста
+            self.context.init(self.w, self.h)
+        if self.show_overlay:
+            # атлас глифов загружается в GPU, поэтому только после создания контекста
+            self.overlay = TextOverlay()
         glEnable(GL_DEPTH_TEST)
         glDepthFunc(GL_LESS)
         self.clock = pygame.time.Clock()
-        self.cube = Cube()
+        self.cube = Cube(self.retained)
         self.camera.init()
 
     def loop_step(self):
         """Обратока цикла рендеринга pygame"""
         # задаем максимальное количество кадров в секунду
         self.clock.tick(self.frame_rate)
-        # считываем все произошедшие событие
-        for event in pygame.event.get():
-            # обробатываем выход из приложения
-            if event.type == QUIT:
-                self.quit()
-                return
-            if event.type == KEYUP and event.key == K_ESCAPE:
-                self.quit()
-                return
-            # обрабатываем изменение размера окна
-            if event.type == VIDEORESIZE:
-                self.reshape(*event.size)
-            # обработка события
-            self.event(event)
+        profiler.next_frame()
+        self.stats.add(self.clock.get_time())
+        # считываем все произошедшие событие (без окна их нет)
+        with profiler.scope('events'):
+            events = pygame.event.get() if self.context is None else ()
+            for event in events:
+                # обробатываем выход из приложения
+                if event.type == QUIT:
+                    self.quit()
+                    return
+                if event.type == KEYUP and event.key == K_ESCAPE:
+                    self.quit()
+                    return
+                # обрабатываем изменение размера окна
+                if event.type == VIDEORESIZE:
+                    self.reshape(*event.size)
+                # обработка события
+                self.event(event)
         # что-то рисуем
-        self.render()
+        with profiler.scope('render'):
+            self.render()
         # показываем в залоговке окна FPS
-        self.fps()
+        with profiler.scope('fps'):
+            self.fps()
+        if self.context is not None:
+            # без окна: кадр остается в буфере кадра, его можно считать context.read()
+            with profiler.scope('swap'):
+                self.context.swap()
+            return
         # смена кадров, т.к. мы используем DOUBLEBUF ражим
-        pygame.display.flip()
+        with profiler.scope('flip'):
+            pygame.display.flip()
 
     def quit(self):
         """Выход из приложения, закрытие окна"""
@@ -143,8 +186,17 @@ class Controller(object):
         pass
 
     def fps(self):
-        """Рисуем текущий FPS"""
-        pygame.display.set_caption("%s FPS: %s" % (self.name, self.clock.get_fps()))
+        """Рисуем текущий FPS: заголовок окна обновляется не чаще двух раз в секунду"""
+        if self.stats.due():
+            if self.context is None:
+                pygame.display.set_caption("%s FPS: %.1f" % (self.name, self.stats.fps))
+            if self.overlay is not None:
+                text = self.stats.format()
+                if profiler.enabled:
+                    text += '\n' + profiler.report()
+                self.overlay.set_text(text)
+        if self.overlay is not None:
+            self.overlay.render(self.w, self.h)
 
     def run(self):
         """Запуск приложения"""
@@ -158,9 +210,15 @@ class Controller(object):
         # Включаем сглаживание
         glEnable(GL_POLYGON_SMOOTH)
         # Рисуем куб
-        self.cube.render()
+        with profiler.scope('Cube.render'):
+            self.cube.render()
 
 
 if __name__ == '__main__':
-    main = Controller()
+    # с ключом --profile время фаз кадра пишется в trace.json (chrome://tracing)
+    if '--profile' in sys.argv:
+        profiler.enable('trace.json')
+    # с ключом --vbo куб рисуется через буферы, удобно для сравнения скорости
+    # с ключом --stats статистика кадров рисуется поверх сцены
+    main = Controller(retained='--vbo' in sys.argv, overlay='--stats' in sys.argv)
     main.run()
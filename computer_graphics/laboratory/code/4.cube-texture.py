@@ -9,14 +9,23 @@ PIL
 *Задание: использовать glDrawElements вместо glBegin|glEnd
 """
 
+import sys
+
 import pygame
 from pygame.locals import *
 
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+from buffers import MeshBuffer
+from frame_stats import FrameStats
+from profiling import profiler
+from text_overlay import TextOverlay
+import textures
+from texture_cache import TextureCache
+from texture_loader import TextureLoader
+
 import PIL.Image as Image
-import numpy
 
 
 class Camera(object):
@@ -42,9 +51,9 @@ class TextureHelper(object):
 
         # открываем файл и преобразуем в массив байт
         img = Image.open(filename)
-        img_data = numpy.array(list(img.getdata()), numpy.uint8)
-        # альтернативный способ без numpy
-        # img_data = img.tobytes('raw', 'RGB', 0, -1)
+        # сразу из буфера PIL, без списка пикселей; строки перевернуты, как ожидает OpenGL
+        img_data = textures.image_to_array(img)
+        gl_format = textures.GL_FORMATS[img_data.shape[2]]
 
         # создаем текстуру (id)
         texture_id = glGenTextures(1)
@@ -63,9 +72,11 @@ class TextureHelper(object):
         glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
 
         # записываем данные текстуры в OpenGL память (GPU)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, img.size[0], img.size[1], 0, GL_RGB, GL_UNSIGNED_BYTE, img_data)
+        glTexImage2D(GL_TEXTURE_2D, 0, gl_format, img.size[0], img.size[1], 0, gl_format, GL_UNSIGNED_BYTE, img_data)
         # эта функция работает в OpenGL 1.4
-        # gluBuild2DMipmaps(GL_TEXTURE_2D, GL_RGB, img.size[0], img.size[1], GL_RGB, GL_UNSIGNED_BYTE, img_data)
+        # gluBuild2DMipmaps(GL_TEXTURE_2D, gl_format, img.size[0], img.size[1], gl_format, GL_UNSIGNED_BYTE, img_data)
+        # без GLU: levels = textures.build_mipmaps(img_data), затем glTexImage2D для каждого уровня,
+        # см. textures.upload_levels (так загружает Cube через TextureCache)
 
         # сбрасываем текстуру
         glBindTexture(GL_TEXTURE_2D, 0)
@@ -80,8 +91,12 @@ class TextureHelper(object):
 
 class Cube(object):
     """Класс для создание и отрисовки куба"""
-    def __init__(self):
-        """Заполняем массивы вершин и полигонов"""
+    def __init__(self, retained=False, texture_cache=None):
+        """Заполняем массивы вершин и полигонов
+
+        retained - рисовать через VBO|IBO и glDrawElements вместо glBegin|glEnd
+        texture_cache - общий кэш текстур (TextureCache), без него текстура загружается заново
+        """
         self.verticies = (
             (1, -1, -1),   # 0
             (1, 1, -1),    # 1
@@ -117,13 +132,33 @@ class Cube(object):
             ((0, 0), (1, 0), (1, 1), (0, 1)),
             ((0, 0), (1, 0), (1, 1), (0, 1))
         )
-        self.texture_id = TextureHelper.load('wall.jpg')
+        self.texture = None
+        if texture_cache is None:
+            self.texture_id = TextureHelper.load('wall.jpg')
+        else:
+            # одинаковые текстуры декодируются и загружаются в GPU один раз
+            # при фоновой загрузке сначала выдается заглушка, id подменится позже
+            # mip-уровни строятся на CPU (textures.build_mipmaps), без них уменьшенная текстура рябит
+            self.texture = texture_cache.acquire('wall.jpg', mipmaps=True)
+        self.retained = retained
+        self.buffer = None
+        if self.retained:
+            # упаковываем геометрию в буферы один раз
+            self.buffer = MeshBuffer.from_faces(self.verticies, self.faces, self.uvs, self.colors).upload()
 
     def render(self):
         """Рисуем куб в виде полигонов, добавляем текстуру"""
-        TextureHelper.render(self.texture_id)
+        if self.texture is not None:
+            # id текстуры из кэша меняется, когда заканчивается фоновая загрузка
+            self.texture_id = self.texture.texture_id
+        with profiler.scope('TextureHelper.render'):
+            TextureHelper.render(self.texture_id)
         glMatrixMode(GL_MODELVIEW)
         glRotatef(1, 3, 1, 1)
+        if self.retained:
+            # вся геометрия рисуется одним вызовом glDrawElements
+            self.buffer.render()
+            return
         glBegin(GL_QUADS)
         for fi, faces in enumerate(self.faces):
             # убираем цвет, можно включить, тогда будет наложение
@@ -137,7 +172,7 @@ class Cube(object):
 class Controller(object):
     """Основной класс для создания окна и запуска цикла рендеринга"""
 
-    def __init__(self, w=800, h=600, name="Lab", frame_rate=60):
+    def __init__(self, w=800, h=600, name="Lab", frame_rate=60, retained=False, context=None, overlay=False):
         """Конструктор нашего класса
 
         Принимает параметры размера окна, название окна и ограничение количества кадров в секунду
@@ -148,46 +183,76 @@ class Controller(object):
         self.frame_rate = frame_rate
         self.screen = None  # ссылка на созданное окно
         self.clock = None  # вспомогательный объект для контроля FPS
+        self.context = context  # контекст без окна (headless.OffscreenContext), None - обычное окно
+        self.stats = FrameStats()  # статистика кадров, snapshot() - для внешних инструментов
+        self.show_overlay = overlay  # статистика текстом поверх сцены
+        self.overlay = None  # TextOverlay, создается в init
         self.cube = None
+        self.retained = retained  # режим отрисовки куба (VBO или glBegin|glEnd)
+        self.texture_loader = TextureLoader()  # декодирует текстуры в фоновых потоках
+        self.texture_cache = TextureCache(loader=self.texture_loader)  # общий кэш текстур для всех объектов
         self.camera = Camera(w, h)
 
     def init(self):
         """Создание окна, инициализация"""
-        self.screen = pygame.display.set_mode((self.w, self.h), HWSURFACE | OPENGL | DOUBLEBUF | RESIZABLE)
-        pygame.display.set_caption(self.name)
+        if self.context is None:
+            self.screen = pygame.display.set_mode((self.w, self.h), HWSURFACE | OPENGL | DOUBLEBUF | RESIZABLE)
+            pygame.display.set_caption(self.name)
+        else:
+            # без окна и дисплея: рисуем в буфер кадра (FBO) offscreen-контекста
+            self.context.init(self.w, self.h)
+        if self.show_overlay:
+            # атлас глифов загружается в GPU, поэтому только после создания контекста
+            self.overlay = TextOverlay()
         glEnable(GL_DEPTH_TEST)
         glDepthFunc(GL_LESS)
         self.clock = pygame.time.Clock()
-        self.cube = Cube()
+        self.cube = Cube(self.retained, self.texture_cache)
         self.camera.init()
 
     def loop_step(self):
         """Обработка цикла рендеринга pygame"""
         # задаем максимальное количество кадров в секунду
         self.clock.tick(self.frame_rate)
-        # считываем все произошедшие событие
-        for event in pygame.event.get():
-            # обрабатываем выход из приложения
-            if event.type == QUIT:
-                self.quit()
-                return
-            if event.type == KEYUP and event.key == K_ESCAPE:
-                self.quit()
-                return
-            # обрабатываем изменение размера окна
-            if event.type == VIDEORESIZE:
-                self.reshape(*event.size)
-            # обработка события
-            self.event(event)
+        profiler.next_frame()
+        self.stats.add(self.clock.get_time())
+        # считываем все произошедшие событие (без окна их нет)
+        with profiler.scope('events'):
+            events = pygame.event.get() if self.context is None else ()
+            for event in events:
+                # обрабатываем выход из приложения
+                if event.type == QUIT:
+                    self.quit()
+                    return
+                if event.type == KEYUP and event.key == K_ESCAPE:
+                    self.quit()
+                    return
+                # обрабатываем изменение размера окна
+                if event.type == VIDEORESIZE:
+                    self.reshape(*event.size)
+                # обработка события
+                self.event(event)
+        # загружаем в GPU готовые текстуры, не больше бюджета времени на кадр
+        with profiler.scope('textures'):
+            self.texture_loader.pump()
         # что-то рисуем
-        self.render()
+        with profiler.scope('render'):
+            self.render()
         # показываем в заголовке окна FPS
-        self.fps()
+        with profiler.scope('fps'):
+            self.fps()
+        if self.context is not None:
+            # без окна: кадр остается в буфере кадра, его можно считать context.read()
+            with profiler.scope('swap'):
+                self.context.swap()
+            return
         # смена кадров, т.к. мы используем DOUBLEBUF ражим
-        pygame.display.flip()
+        with profiler.scope('flip'):
+            pygame.display.flip()
 
     def quit(self):
         """Выход из приложения, закрытие окна"""
+        self.texture_loader.shutdown()
         pygame.quit()
         quit()
 
@@ -206,8 +271,17 @@ class Controller(object):
         pass
 
     def fps(self):
-        """Рисуем текущий FPS"""
-        pygame.display.set_caption("%s FPS: %s" % (self.name, self.clock.get_fps()))
+        """Рисуем текущий FPS: заголовок окна обновляется не чаще двух раз в секунду"""
+        if self.stats.due():
+            if self.context is None:
+                pygame.display.set_caption("%s FPS: %.1f" % (self.name, self.stats.fps))
+            if self.overlay is not None:
+                text = self.stats.format()
+                if profiler.enabled:
+                    text += '\n' + profiler.report()
+                self.overlay.set_text(text)
+        if self.overlay is not None:
+            self.overlay.render(self.w, self.h)
 
     def run(self):
         """Запуск приложения"""
@@ -221,9 +295,15 @@ class Controller(object):
         # Включаем сглаживание
         glEnable(GL_POLYGON_SMOOTH)
         # Рисуем куб
-        self.cube.render()
+        with profiler.scope('Cube.render'):
+            self.cube.render()
 
 
 if __name__ == '__main__':
-    main = Controller()
+    # с ключом --profile время фаз кадра пишется в trace.json (chrome://tracing)
+    if '--profile' in sys.argv:
+        profiler.enable('trace.json')
+    # с ключом --vbo куб рисуется через буферы, удобно для сравнения скорости
+    # с ключом --stats статистика кадров рисуется поверх сцены
+    main = Controller(retained='--vbo' in sys.argv, overlay='--stats' in sys.argv)
     main.run()
@@ -5,100 +5,31 @@
 Задание: по клавишам переключаться между текстурой и цветом, менять фильтры текстуры и прочее
 """
 
+import os
+import sys
+
 import pygame
 from pygame.locals import *
 
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+from buffers import MeshBuffer
+from camera import CameraOrbit, CameraInertial
+from events import Dispatcher, EventBatch
+from frame_stats import FrameStats
+from profiling import profiler
+from text_overlay import TextOverlay
+import textures
+from texture_cache import TextureCache
+from texture_loader import TextureLoader
+import transforms
+
 try:
     import PIL.Image as Image
 except ImportError as err:
     import Image
 
-import numpy
-import math
-
-
-class CameraOrbit(object):
-    """Камера для вращения по сфере вокруг центра модели|сцены"""
-
-    def __init__(self, w, h, radius_min=4, radius_max=20, move_button=1, speed=0.01):
-        self.w = w
-        self.h = h
-        self.radius_min = radius_min
-        self.radius_max = radius_max
-        self.move_button = move_button  # по умолчанию используем правую клавишу мыши
-        self.speed = speed  # фактор скорости изменения
-        self.mouse_states = {self.move_button: 0}  # состояние нажатия клавиши
-        self.mouse_coords = {self.move_button: (0, 0)}  # координаты нажатия клавиши мыши
-        self.data = {}
-
-    def init(self, pos=(0, 0, -5), target=(0, 0, 0), fov=45, near=0.1, far=50.0, forwards=(0, 0, 1), up=(0, 1, 0)):
-        """Задаем все необходимые начальные параметры камеры"""
-        self.data['pos'] = list(pos)
-        self.data['forwards'] = forwards
-        self.data['target'] = target
-        self.data['up'] = up
-        self.data['fov'] = fov
-        self.data['start'] = near
-        self.data['end'] = far
-        self.data['r'] = math.sqrt(numpy.dot(pos, pos))
-        self.data['theta'] = math.acos(pos[2] / self.data['r'])
-        if pos[0] != 0:
-            self.data['phi'] = math.atan(pos[1] / pos[0])
-        else:
-            self.data['phi'] = 0
-
-    def update(self):
-        """Обновляем положение камеры"""
-        self.data['pos'][0] = self.data['r'] * math.sin(self.data['theta']) * math.cos(self.data['phi'])
-        self.data['pos'][1] = self.data['r'] * math.sin(self.data['theta']) * math.sin(self.data['phi'])
-        self.data['pos'][2] = self.data['r'] * math.cos(self.data['theta'])
-        glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        gluPerspective(self.data['fov'], self.w / self.h, self.data['start'], self.data['end'])
-        gluLookAt(self.data['pos'][0], self.data['pos'][1], self.data['pos'][2], 0, 0, 0, 0, 0, 1)
-
-    def event(self, e):
-        """Обрабатываем нажатия клавиш мыши"""
-        if (e.type == MOUSEBUTTONDOWN and e.button == 1):
-            # если нажали на левую клавишу мыши, то запоминаем координаты и состояние нажатия
-            self.mouse_coords[e.button] = e.pos
-            self.mouse_states[e.button] = 1
-        elif (e.type == MOUSEBUTTONUP and e.button == 1):
-            # если отпустили левую клавишу мыши, то сбрасываем координаты и состояние
-            self.mouse_coords[e.button] = (0, 0)
-            self.mouse_states[e.button] = 0
-        elif (e.type == MOUSEMOTION and self.mouse_states[1]):
-            # при движение мыши и при зажатой левой кнопке мыши вращаем камеру
-            self.mouse_move(*e.pos)
-
-    def mouse_move(self, x, y):
-        """Меняем параметры камеры в зависимости от положения мыши"""
-        # считываем модификаторы, например ctrl
-        mod = pygame.key.get_mods()
-        # вычисляем сдвих между текущими координатми и теми что были при нажатии
-        dx = self.mouse_coords[self.move_button][0] - x
-        dy = self.mouse_coords[self.move_button][1] - y
-        # обновляем координаты
-        self.mouse_coords[self.move_button] = (x, y)
-        # если зажат CRTL, то меняем радиус (приближаем/удаляем)
-        if mod & KMOD_LCTRL:
-            self.data['r'] += self.speed * dy
-            if self.data['r'] < self.radius_min:
-                self.data['r'] = self.radius_min
-            if self.data['r'] > self.radius_max:
-                self.data['r'] = self.radius_max
-        else:
-            # иначе меняем углы
-            self.data['phi'] += self.speed * dx
-            self.data['theta'] += self.speed * dy
-            if self.data['theta'] > math.pi:
-                self.data['theta'] = math.pi
-            if self.data['theta'] <= 0:
-                self.data['theta'] = 1e-5
-
 
 class Camera(object):
     """Класс для управления камерой
@@ -123,7 +54,9 @@ class TextureHelper(object):
 
         # открываем файл и преобразуем в массив байт
         img = Image.open(filename)
-        img_data = numpy.array(list(img.getdata()), numpy.uint8)
+        # сразу из буфера PIL, без списка пикселей; строки перевернуты, как ожидает OpenGL
+        img_data = textures.image_to_array(img)
+        gl_format = textures.GL_FORMATS[img_data.shape[2]]
 
         # создаем текстуру (id)
         texture_id = glGenTextures(1)
@@ -142,7 +75,7 @@ class TextureHelper(object):
         glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
 
         # записываем данные текстуры в OpenGL память (GPU)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, img.size[0], img.size[1], 0, GL_RGB, GL_UNSIGNED_BYTE, img_data)
+        glTexImage2D(GL_TEXTURE_2D, 0, gl_format, img.size[0], img.size[1], 0, gl_format, GL_UNSIGNED_BYTE, img_data)
 
         # сбрасываем текстуру
         glBindTexture(GL_TEXTURE_2D, 0)
@@ -157,8 +90,12 @@ class TextureHelper(object):
 
 class Cube(object):
     """Класс для создание и отрисовки куба"""
-    def __init__(self):
-        """Заполняем массивы вершин и полигонов"""
+    def __init__(self, retained=False, texture_cache=None):
+        """Заполняем массивы вершин и полигонов
+
+        retained - рисовать через VBO|IBO и glDrawElements вместо glBegin|glEnd
+        texture_cache - общий кэш текстур (TextureCache), без него текстура загружается заново
+        """
         self.verticies = (
             (1, -1, -1),   # 0
             (1, 1, -1),    # 1
@@ -194,37 +131,99 @@ class Cube(object):
             ((0, 0), (1, 0), (1, 1), (0, 1)),
             ((0, 0), (1, 0), (1, 1), (0, 1))
         )
-        self.texture_id = TextureHelper.load('wall.jpg')
+        self.texture = None
+        if texture_cache is None:
+            self.texture_id = TextureHelper.load('wall.jpg')
+        else:
+            # одинаковые текстуры декодируются и загружаются в GPU один раз
+            # при фоновой загрузке сначала выдается заглушка, id подменится позже
+            # mip-уровни строятся на CPU (textures.build_mipmaps), без них уменьшенная текстура рябит
+            self.texture = texture_cache.acquire('wall.jpg', mipmaps=True)
+        self.retained = retained
+        self.buffer = None
+        if self.retained:
+            # упаковываем геометрию в буферы один раз
+            self.buffer = MeshBuffer.from_faces(self.verticies, self.faces, self.uvs, self.colors).upload()
         self.enable_rotation = True
+        self.textured = True  # текстура или цвета граней
+        # фильтры уменьшения, между которыми переключаемся; mip-уровни есть только у текстур из кэша,
+        # и textures.upload_levels уже выставил им GL_LINEAR_MIPMAP_LINEAR - с него и начинаем
+        self.filters = (GL_LINEAR, GL_NEAREST)
+        if self.texture is not None:
+            self.filters = (GL_LINEAR_MIPMAP_LINEAR, GL_NEAREST_MIPMAP_NEAREST) + self.filters
+        self.filter = 0
+        self.applied_filter = None  # (id текстуры, фильтр), выставленные в OpenGL
+        # угол накапливается числом, матрица модели строится заново (без накопления ошибок в драйвере)
+        self.angle = 0.0
 
     def render(self):
         """Рисуем куб в виде полигонов, добавляем текстуру"""
-        TextureHelper.render(self.texture_id)
+        if self.texture is not None:
+            # id текстуры из кэша меняется, когда заканчивается фоновая загрузка
+            self.texture_id = self.texture.texture_id
+        if self.textured:
+            with profiler.scope('TextureHelper.render'):
+                TextureHelper.render(self.texture_id)
+            self.apply_filter()
+            glColor3f(1.0, 1.0, 1.0)
+        else:
+            glDisable(GL_TEXTURE_2D)
         glMatrixMode(GL_MODELVIEW)
         if self.enable_rotation:
-            glRotatef(1, 3, 1, 1)
+            self.angle += 1
+        # OpenGL хранит матрицы по столбцам, поэтому транспонируем
+        glLoadMatrixf(transforms.rotate(self.angle, 3, 1, 1).T)
+        if self.retained:
+            # вся геометрия рисуется одним вызовом glDrawElements
+            self.buffer.render(uv=self.textured, color=not self.textured)
+            return
         glBegin(GL_QUADS)
         for fi, faces in enumerate(self.faces):
-            # убираем цвет, можно включить, тогда будет наложение
-            # glColor3fv(self.colors[fi])
+            # цвет включается вместо текстуры, иначе будет наложение
+            if not self.textured:
+                glColor3fv(self.colors[fi])
             for vi, vertex in enumerate(faces):
                 glTexCoord2fv(self.uvs[fi][vi])
                 glVertex3fv(self.verticies[vertex])
         glEnd()
 
-    def event(self, e):
-        # добавляем обработку клавиши пробел
-        if (e.type == KEYUP and e.key == 32):  # Space
-            self.enable_rotation = not self.enable_rotation
+    def apply_filter(self):
+        """Выставляет фильтр уменьшения текущей текстуре, только если он поменялся"""
+        if self.texture is not None and not self.texture.loaded:
+            # у заглушки нет mip-уровней
+            return
+        applied = (self.texture_id, self.filters[self.filter])
+        if applied != self.applied_filter:
+            # текстура из кэша общая, фильтр поменяется у всех объектов с ней
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, applied[1])
+            self.applied_filter = applied
+
+    def subscribe(self, dispatcher):
+        """Регистрируем действия куба с клавишами по умолчанию, их можно переназначить"""
+        dispatcher.action('toggle_rotation', self.toggle_rotation, 'keyup:space')
+        dispatcher.action('toggle_texture', self.toggle_texture, 'keyup:t')
+        dispatcher.action('next_filter', self.next_filter, 'keyup:f')
+
+    def toggle_rotation(self, e):
+        self.enable_rotation = not self.enable_rotation
+
+    def toggle_texture(self, e):
+        self.textured = not self.textured
+
+    def next_filter(self, e):
+        self.filter = (self.filter + 1) % len(self.filters)
 
 
 class Controller(object):
     """Основной класс для создания окна и запуска цикла рендеринга"""
 
-    def __init__(self, w=800, h=600, name="Lab", frame_rate=60):
+    def __init__(self, w=800, h=600, name="Lab", frame_rate=60, retained=False, inertial=False,
+                 bindings='bindings.json', context=None, overlay=False):
         """Конструктор нашего класса
 
         Принимает параметры размера окна, название окна и ограничение количества кадров в секунду
+        inertial - камера с инерцией, вращается простым перемещением мыши (CameraInertial)
+        bindings - файл привязок клавиш (events.Dispatcher.load_bindings), читается, если есть
         """
         self.w = w
         self.h = h
@@ -232,48 +231,86 @@ class Controller(object):
         self.frame_rate = frame_rate
         self.screen = None  # ссылка на созданное окно
         self.clock = None  # вспомогательный объект для контроля FPS
+        self.context = context  # контекст без окна (headless.OffscreenContext), None - обычное окно
+        self.stats = FrameStats()  # статистика кадров, snapshot() - для внешних инструментов
+        self.show_overlay = overlay  # статистика текстом поверх сцены
+        self.overlay = None  # TextOverlay, создается в init
         self.cube = None
-        self.camera = CameraOrbit(w, h)
+        self.retained = retained  # режим отрисовки куба (VBO или glBegin|glEnd)
+        self.texture_loader = TextureLoader()  # декодирует текстуры в фоновых потоках
+        self.texture_cache = TextureCache(loader=self.texture_loader)  # общий кэш текстур для всех объектов
+        self.events = EventBatch()  # события кадра, без объекта на каждое движение мыши
+        self.dispatcher = Dispatcher()  # события получают только подписанные на них обработчики
+        self.bindings = bindings
+        if inertial:
+            self.camera = CameraInertial(w, h, follow=True)
+        else:
+            self.camera = CameraOrbit(w, h)
 
     def init(self):
         """Создание окна, инициализация"""
-        self.screen = pygame.display.set_mode((self.w, self.h), HWSURFACE | OPENGL | DOUBLEBUF | RESIZABLE)
-        pygame.display.set_caption(self.name)
+        if self.context is None:
+            self.screen = pygame.display.set_mode((self.w, self.h), HWSURFACE | OPENGL | DOUBLEBUF | RESIZABLE)
+            pygame.display.set_caption(self.name)
+        else:
+            # без окна и дисплея: рисуем в буфер кадра (FBO) offscreen-контекста
+            self.context.init(self.w, self.h)
+        if self.show_overlay:
+            # атлас глифов загружается в GPU, поэтому только после создания контекста
+            self.overlay = TextOverlay()
         glEnable(GL_DEPTH_TEST)
         glDepthFunc(GL_LESS)
         self.clock = pygame.time.Clock()
-        self.cube = Cube()
+        self.cube = Cube(self.retained, self.texture_cache)
         self.camera.init()
+        # обрабатываем выход из приложения и изменение размера окна
+        self.dispatcher.action('quit', lambda e: self.quit(), 'quit', 'keyup:escape')
+        self.dispatcher.subscribe(VIDEORESIZE, lambda e: self.reshape(*e.size))
+        self.camera.subscribe(self.dispatcher)
+        self.cube.subscribe(self.dispatcher)
+        if self.bindings is not None and os.path.exists(self.bindings):
+            self.dispatcher.load_bindings(self.bindings)
 
     def loop_step(self):
         """Обработка цикла рендеринга pygame"""
-        # задаем максимальное количество кадров в секунду
-        self.clock.tick(self.frame_rate)
-        # считываем все произошедшие событие
-        for event in pygame.event.get():
-            # обробатываем выход из приложения
-            if event.type == QUIT:
-                self.quit()
-                return
-            if event.type == KEYUP and event.key == K_ESCAPE:
-                self.quit()
-                return
-            # обрабатываем изменение размера окна
-            if event.type == VIDEORESIZE:
-                self.reshape(*event.size)
-            # обработка события
-            self.event(event)
-        # обновляем камеру
-        self.camera.update()
+        # задаем максимальное количество кадров в секунду, dt - время прошлого кадра в мс
+        dt = self.clock.tick(self.frame_rate)
+        profiler.next_frame()
+        self.stats.add(self.clock.get_time())
+        # считываем все произошедшие событие, движения мыши подряд сливаются в одно
+        # без окна событий нет
+        with profiler.scope('events'):
+            events = self.events.poll() if self.context is None else ()
+            for event in events:
+                # обработка события
+                self.event(event)
+        with profiler.scope('camera'):
+            # инерционная камера продвигается фиксированными шагами, независимо от FPS
+            self.camera.advance(dt / 1000.0)
+            # обновляем камеру, матрицы загружаем в фиксированный конвейер, только если они изменились
+            if self.camera.update():
+                self.camera.load_matrices()
+        # загружаем в GPU готовые текстуры, не больше бюджета времени на кадр
+        with profiler.scope('textures'):
+            self.texture_loader.pump()
         # что-то рисуем
-        self.render()
+        with profiler.scope('render'):
+            self.render()
         # показываем в заголовке окна FPS
-        self.fps()
+        with profiler.scope('fps'):
+            self.fps()
+        if self.context is not None:
+            # без окна: кадр остается в буфере кадра, его можно считать context.read()
+            with profiler.scope('swap'):
+                self.context.swap()
+            return
         # смена кадров, т.к. мы используем DOUBLEBUF режим
-        pygame.display.flip()
+        with profiler.scope('flip'):
+            pygame.display.flip()
 
     def quit(self):
         """Выход из приложения, закрытие окна"""
+        self.texture_loader.shutdown()
         pygame.quit()
         quit()
 
@@ -284,23 +321,34 @@ class Controller(object):
 
     def reshape(self, width, height):
         """Обрабатываем изменение размера окна"""
-        self.w = self.camera.w = width
-        self.h = self.camera.h = height
+        self.w = width
+        self.h = height
+        # проекция камеры пересчитается только здесь, а не каждый кадр
+        self.camera.resize(width, height)
 
     def event(self, e):
-        """Обрабатываем события"""
-        self.camera.event(e)
-        self.cube.event(e)
+        """Обрабатываем события: поиск обработчиков по таблице (тип, клавиша|кнопка)"""
+        self.dispatcher.dispatch(e)
 
     def fps(self):
-        """Рисуем текущий FPS"""
-        pygame.display.set_caption("%s FPS: %s" % (self.name, self.clock.get_fps()))
+        """Рисуем текущий FPS: заголовок окна обновляется не чаще двух раз в секунду"""
+        if self.stats.due():
+            if self.context is None:
+                pygame.display.set_caption("%s FPS: %.1f" % (self.name, self.stats.fps))
+            if self.overlay is not None:
+                text = self.stats.format()
+                if profiler.enabled:
+                    text += '\n' + profiler.report()
+                self.overlay.set_text(text)
+        if self.overlay is not None:
+            self.overlay.render(self.w, self.h)
 
     def run(self):
         """Запуск приложения"""
         self.init()
         #  выставляем начальное положение камеры
         self.camera.update()
+        self.camera.load_matrices()
         self.loop()
 
     def render(self):
@@ -310,9 +358,17 @@ class Controller(object):
         # Включаем сглаживание
         glEnable(GL_POLYGON_SMOOTH)
         # Рисуем куб
-        self.cube.render()
+        with profiler.scope('Cube.render'):
+            self.cube.render()
 
 
 if __name__ == '__main__':
-    main = Controller()
+    # с ключом --profile время фаз кадра пишется в trace.json (chrome://tracing)
+    if '--profile' in sys.argv:
+        profiler.enable('trace.json')
+    # с ключом --vbo куб рисуется через буферы, удобно для сравнения скорости
+    # с ключом --inertia камера вращается с инерцией при движении мыши
+    # клавиши: пробел - вращение, t - текстура|цвет, f - фильтр текстуры (переназначаются в bindings.json)
+    # с ключом --stats статистика кадров рисуется поверх сцены
+    main = Controller(retained='--vbo' in sys.argv, inertial='--inertia' in sys.argv, overlay='--stats' in sys.argv)
     main.run()
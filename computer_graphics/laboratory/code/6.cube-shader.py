@@ -5,102 +5,38 @@
 
 """
 
+import sys
+
 import pygame
 from pygame.locals import *
 
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+from buffers import MeshBuffer
+from camera import CameraOrbit
+from culling import SceneCuller
+from events import Dispatcher, EventBatch
+from frame_stats import FrameStats
+import mesh_loader
+from profiling import profiler
+from render_queue import RenderQueue
+from scene import Scene
+from text_overlay import TextOverlay
+import textures
+from texture_cache import TextureCache
+from texture_loader import TextureLoader
+from shaders import Program, ProgramCache, ReloadableProgram
+
 try:
     import PIL.Image as Image
 except ImportError as err:
     import Image
 
 import numpy
-import math
 import os
 
 
-class CameraOrbit(object):
-    """Камера для вращения по сфере вокруг центра модели|сцены"""
-
-    def __init__(self, w, h, radius_min=4, radius_max=20, move_button=1, speed=0.01):
-        self.w = w
-        self.h = h
-        self.radius_min = radius_min
-        self.radius_max = radius_max
-        self.move_button = move_button  # по умолчанию используем правую клавишу мыши
-        self.speed = speed  # фактор скорости изменения
-        self.mouse_states = {self.move_button: 0}  # состояние нажатия клавиши
-        self.mouse_coords = {self.move_button: (0, 0)}  # координаты нажатия клавиши мыши
-        self.data = {}
-
-    def init(self, pos=(0, 0, -5), target=(0, 0, 0), fov=45, near=0.1, far=50.0, forwards=(0, 0, 1), up=(0, 1, 0)):
-        """Задаем все необходимые начальные параметры камеры"""
-        self.data['pos'] = list(pos)
-        self.data['forwards'] = forwards
-        self.data['target'] = target
-        self.data['up'] = up
-        self.data['fov'] = fov
-        self.data['start'] = near
-        self.data['end'] = far
-        self.data['r'] = math.sqrt(numpy.dot(pos, pos))
-        self.data['theta'] = math.acos(pos[2] / self.data['r'])
-        if pos[0] != 0:
-            self.data['phi'] = math.atan(pos[1] / pos[0])
-        else:
-            self.data['phi'] = 0
-
-    def update(self):
-        """Обновляем положение камеры"""
-        self.data['pos'][0] = self.data['r'] * math.sin(self.data['theta']) * math.cos(self.data['phi'])
-        self.data['pos'][1] = self.data['r'] * math.sin(self.data['theta']) * math.sin(self.data['phi'])
-        self.data['pos'][2] = self.data['r'] * math.cos(self.data['theta'])
-        glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        gluPerspective(self.data['fov'], self.w / self.h, self.data['start'], self.data['end'])
-        gluLookAt(self.data['pos'][0], self.data['pos'][1], self.data['pos'][2], 0, 0, 0, 0, 0, 1)
-
-    def event(self, e):
-        """Обрабатываем нажатия клавиш мыши"""
-        if (e.type == MOUSEBUTTONDOWN and e.button == 1):
-            # если нажали на левую клавишу мыши, то запоминаем координаты и состояние нажатия
-            self.mouse_coords[e.button] = e.pos
-            self.mouse_states[e.button] = 1
-        elif (e.type == MOUSEBUTTONUP and e.button == 1):
-            # если отпустили левую клавишу мыши, то сбрасываем координты и состояние
-            self.mouse_coords[e.button] = (0, 0)
-            self.mouse_states[e.button] = 0
-        elif (e.type == MOUSEMOTION and self.mouse_states[1]):
-            # при движение мыши и при зажатой левой кнопке мыши вращаем камеру
-            self.mouse_move(*e.pos)
-
-    def mouse_move(self, x, y):
-        """Меняем параметры камеры в зависимости от положения мыши"""
-        # считываем модификаторы, например ctrl
-        mod = pygame.key.get_mods()
-        # вычисляем сдвих между текущими координатми и теми что были при нажатии
-        dx = self.mouse_coords[self.move_button][0] - x
-        dy = self.mouse_coords[self.move_button][1] - y
-        # обновляем координаты
-        self.mouse_coords[self.move_button] = (x, y)
-        # если зажат CRTL, то меняем радиус (приближаем-удаляем)
-        if mod & KMOD_LCTRL:
-            self.data['r'] += self.speed * dy
-            if self.data['r'] < self.radius_min:
-                self.data['r'] = self.radius_min
-            if self.data['r'] > self.radius_max:
-                self.data['r'] = self.radius_max
-        else:
-            # иначе меняем углы
-            self.data['phi'] += self.speed * dx
-            self.data['theta'] += self.speed * dy
-            if self.data['theta'] > math.pi:
-                self.data['theta'] = math.pi
-            if self.data['theta'] <= 0:
-                self.data['theta'] = 1e-5
-
-
 class Camera(object):
     """Класс для управления камерой
 
@@ -124,7 +60,9 @@ class TextureHelper(object):
 
         # открываем файл и преобразуем в массив байт
         img = Image.open(filename)
-        img_data = numpy.array(list(img.getdata()), numpy.uint8)
+        # сразу из буфера PIL, без списка пикселей; строки перевернуты, как ожидает OpenGL
+        img_data = textures.image_to_array(img)
+        gl_format = textures.GL_FORMATS[img_data.shape[2]]
 
         # создаем текстуру (id)
         texture_id = glGenTextures(1)
@@ -143,15 +81,24 @@ class TextureHelper(object):
         glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
 
         # записываем данные текстуры в OpenGL память (GPU)
-        glTexImage2D(GL_TEXTURE_2D, 0, 3, img.size[0], img.size[1], 0, GL_RGB, GL_UNSIGNED_BYTE, img_data)
+        glTexImage2D(GL_TEXTURE_2D, 0, gl_format, img.size[0], img.size[1], 0, gl_format, GL_UNSIGNED_BYTE, img_data)
 
         # сбрасываем текстуру
         glBindTexture(GL_TEXTURE_2D, 0)
         return texture_id
 
     @staticmethod
-    def render(texture_id):
-        """Устанавливает текстуру для отображения"""
+    def render(texture_id, state=None):
+        """Устанавливает текстуру для отображения
+
+        state - кэш состояния (render_queue.GLState): уже установленное повторно не вызывается
+        """
+        if state is not None:
+            state.enable(GL_TEXTURE_2D)
+            state.active_texture(GL_TEXTURE0)
+            state.bind_texture(GL_TEXTURE_2D, texture_id)
+            state.load_identity(GL_TEXTURE)
+            return
         glEnable(GL_TEXTURE_2D)
         glActiveTexture(GL_TEXTURE0)
         glBindTexture(GL_TEXTURE_2D, texture_id)
@@ -187,8 +134,17 @@ class ShaderHelper(object):
 
 class Cube(object):
     """Класс для создание и отрисовки куба"""
-    def __init__(self):
-        """Заполняем массивы вершин и полигонов"""
+    def __init__(self, retained=False, texture_cache=None, program_cache=None, hot_reload=False, mipmaps=True,
+                 mesh=None):
+        """Заполняем массивы вершин и полигонов
+
+        retained - рисовать через VBO|IBO и glDrawElements вместо glBegin|glEnd
+        texture_cache - общий кэш текстур (TextureCache), без него текстура загружается заново
+        program_cache - общий кэш шейдерных программ (ProgramCache), без него шейдеры компилируются заново
+        hot_reload - пересобирать программу при изменении vertex.glsl|fragment.glsl
+        mipmaps - текстура с mip-уровнями (False - другая текстура из того же файла, без них)
+        mesh - файл модели (OBJ или .mesh, см. mesh_loader) вместо куба, рисуется только через буферы
+        """
         self.verticies = (
             (1, -1, -1),   # 0
             (1, 1, -1),    # 1
@@ -224,65 +180,148 @@ class Cube(object):
             ((0, 0), (1, 0), (1, 1), (0, 1)),
             ((0, 0), (1, 0), (1, 1), (0, 1))
         )
-        self.texture_id = TextureHelper.load('wall.jpg')
+        self.texture = None
+        if texture_cache is None:
+            self.texture_id = TextureHelper.load('wall.jpg')
+        else:
+            # одинаковые текстуры декодируются и загружаются в GPU один раз
+            # при фоновой загрузке сначала выдается заглушка, id подменится позже
+            # mip-уровни строятся на CPU (textures.build_mipmaps), без них уменьшенная текстура рябит
+            self.texture = texture_cache.acquire('wall.jpg', mipmaps=mipmaps)
+            # пока загрузка не закончилась - id заглушки, bind обновит его (нужен и для ключа RenderQueue)
+            self.texture_id = self.texture.texture_id
+        # коробка для отсечения с запасом: vertex.glsl сдвигает вершины еще на 1 по каждой оси
+        self.bounds = ((-2.0, -2.0, -2.0), (2.0, 2.0, 2.0))
+        self.retained = retained or mesh is not None
+        self.buffer = None
+        if mesh is not None:
+            # разобранный OBJ кэшируется в .meshcache и в следующий раз открывается через memmap
+            self.buffer, data = mesh_loader.load_buffer(mesh, cache_dir='.meshcache')
+            low, high = data.bounds
+            self.bounds = (tuple((low - 1.0).tolist()), tuple((high + 1.0).tolist()))
+        elif self.retained:
+            # упаковываем геометрию в буферы один раз
+            self.buffer = MeshBuffer.from_faces(self.verticies, self.faces, self.uvs, self.colors).upload()
         self.enable_rotation = True
+        # матрица модели считается на CPU: угол накапливается числом, а не поворотами матрицы драйвера
+        self.angle = 0.0
+        # время для шейдера складывается из длительностей кадров, а не берется из системных часов,
+        # поэтому с имитированными часами (bench_labs.py) кадры повторяются
+        self.time = 0.0
 
         # создаем шейдеры и программу для куба
-        self.shaders = [ShaderHelper.create_shader('vertex.glsl'), ShaderHelper.create_shader('fragment.glsl', GL_FRAGMENT_SHADER)]
-        self.program = ShaderHelper.create_program(self.shaders)
+        self.shader_reloader = None
+        if hot_reload:
+            # за файлами следит фоновый поток, новая программа подменяется в render
+            self.shader_reloader = ReloadableProgram([('vertex.glsl', GL_VERTEX_SHADER), ('fragment.glsl', GL_FRAGMENT_SHADER)], program_cache)
+            self.program = self.shader_reloader.program
+        elif program_cache is None:
+            self.shaders = [ShaderHelper.create_shader('vertex.glsl'), ShaderHelper.create_shader('fragment.glsl', GL_FRAGMENT_SHADER)]
+            self.program = Program(ShaderHelper.create_program(self.shaders))
+        else:
+            # одинаковые программы собираются один раз, с бинарным кэшем - один раз за все запуски
+            self.program = program_cache.load([('vertex.glsl', GL_VERTEX_SHADER), ('fragment.glsl', GL_FRAGMENT_SHADER)])
 
-        # устанавливаем переменные шейдера
-        glUseProgram(self.program)
-        resolution_loc = glGetUniformLocation(self.program, "resolution")
-        glUniform2f(resolution_loc, 300, 224)
+        # устанавливаем переменные шейдера, расположения найдены один раз после линковки (Program)
+        self.program.use()
+        self.program.set("resolution", 300, 224)
+        self.program.set("direction", 5, 0)
+        glUseProgram(0)
 
-        direction_loc = glGetUniformLocation(self.program, "direction")
-        glUniform2f(direction_loc, 5, 0)
+    def update(self, time, node=None):
+        """Анимация куба: время шейдера и поворот узла сцены node
 
+        time - длительность прошлого кадра в миллисекундах
+        """
+        self.time += 0.001 * time
+        if self.enable_rotation and node is not None:
+            self.angle += 1
+            # поворот задается узлу целиком, мировые матрицы пересчитает Scene.update
+            node.set_rotation(self.angle, 3, 1, 1)
+
+    def render(self, camera, model):
+        """Рисуем куб ввиде полигонов, добавляем текстуру
+
+        Матрицы камеры (camera.projection, camera.view) и модели (мировая матрица узла сцены)
+        передаются в шейдер как uniform. Много кубов лучше рисовать через RenderQueue:
+        она вызывает bind один раз на группу одинаковых кубов и draw для каждого
+        """
+        self.bind(None, camera)
+        self.draw(model)
         glUseProgram(0)
 
-    def render(self, time):
-        """Рисуем куб ввиде полигонов, добавляем текстуру"""
-        TextureHelper.render(self.texture_id)
-        glMatrixMode(GL_MODELVIEW)
-        if self.enable_rotation:
-            glRotatef(1, 3, 1, 1)
+    def bind(self, state, camera):
+        """Текстура, программа и общие для всех кубов uniform (время, матрицы камеры)
+
+        state - кэш состояния OpenGL (render_queue.GLState) или None
+        """
+        if self.texture is not None:
+            # id текстуры из кэша меняется, когда заканчивается фоновая загрузка
+            self.texture_id = self.texture.texture_id
+        with profiler.scope('TextureHelper.render'):
+            TextureHelper.render(self.texture_id, state)
 
         # включаем программу для применения шейдеров
-        glUseProgram(self.program)
+        if self.shader_reloader is not None:
+            # если шейдеры изменились, здесь получим пересобранную программу (или старую при ошибке)
+            self.program = self.shader_reloader.update()
+        if state is None:
+            self.program.use()
+        else:
+            state.use_program(self.program.id)
 
-        # передаем в шейдер вреся и uv координаты
-        time_loc = glGetUniformLocation(self.program, "time")
-        glUniform1f(time_loc, 0.001*pygame.time.get_ticks())
+        # передаем в шейдер время и uv координаты, без поиска расположения по имени каждый кадр
+        self.program.set("time", self.time)
+        # неизменившиеся матрицы (например, проекция) повторно не отправляются
+        self.program.set("projection", camera.projection)
+        self.program.set("view", camera.view)
 
-        uv_shader_index = glGetAttribLocation(self.program, "uv")
+    def draw(self, model):
+        """Рисуем куб с матрицей модели, программа и текстура уже установлены (bind)"""
+        self.program.set("model", model)
 
-        glBegin(GL_QUADS)
-        for fi, faces in enumerate(self.faces):
-            # убираем цвет, можно включить, тогда будет наложение
-            # glColor3fv(self.colors[fi])
-            for vi, vertex in enumerate(faces):
-                # теперь uv координаты передаем в шейдер
-                glVertexAttrib2fv(uv_shader_index, self.uvs[fi][vi])
-                # glTexCoord2fv(self.uvs[fi][vi])
-                glVertex3fv(self.verticies[vertex])
-        glEnd()
+        uv_shader_index = self.program.attrib("uv")
 
-        glUseProgram(0)
+        if self.retained:
+            # вершины и uv берутся из буфера, вся геометрия рисуется одним вызовом
+            position_index = self.program.attrib("position")
+            self.buffer.render_attribs(position_index, uv_shader_index)
+        else:
+            glBegin(GL_QUADS)
+            for fi, faces in enumerate(self.faces):
+                # убираем цвет, можно включить, тогда будет наложение
+                # glColor3fv(self.colors[fi])
+                for vi, vertex in enumerate(faces):
+                    # теперь uv координаты передаем в шейдер
+                    glVertexAttrib2fv(uv_shader_index, self.uvs[fi][vi])
+                    # glTexCoord2fv(self.uvs[fi][vi])
+                    glVertex3fv(self.verticies[vertex])
+            glEnd()
 
-    def event(self, e):
-        # добавляем обработку клавиши пробел
-        if (e.type == KEYUP and e.key == 32):  # Space
-            self.enable_rotation = not self.enable_rotation
+    def subscribe(self, dispatcher):
+        """Регистрируем действия куба с клавишами по умолчанию, их можно переназначить"""
+        dispatcher.action('toggle_rotation', self.toggle_rotation, 'keyup:space')
+
+    def toggle_rotation(self, e):
+        self.enable_rotation = not self.enable_rotation
 
 
 class Controller(object):
     """Основной класс для создания окна и запуска цикла рендеринга"""
 
-    def __init__(self, w=800, h=600, name="Lab", frame_rate=60):
+    def __init__(self, w=800, h=600, name="Lab", frame_rate=60, retained=False, hot_reload=False,
+                 bindings='bindings.json', context=None, overlay=False, satellites=0, culling=True, batching=True,
+                 sort=True, mesh=None):
         """Конструктор нашего класса
 
         Принимает параметры размера окна, название окна и ограничение количества кадров всекунду
+        satellites - сколько маленьких кубов добавить в сцену дочерними узлами основного куба
+        culling - не рисовать объекты вне поля зрения камеры (culling.SceneCuller)
+        batching - рисовать через очередь (render_queue.RenderQueue) без повторных смен состояния,
+            False - каждый объект своим render, как раньше
+        sort - в очереди сортировать объекты по программе, текстуре и глубине
+        mesh - файл модели (OBJ или .mesh) вместо основного куба, масштабируется под размер куба
+        bindings - файл привязок клавиш (events.Dispatcher.load_bindings), читается, если есть
         """
         self.w = w
         self.h = h
@@ -290,48 +329,109 @@ class Controller(object):
         self.frame_rate = frame_rate
         self.screen = None  # ссылка на созданное коно
         self.clock = None  # вспомогательный объект для контроля FPS
+        self.context = context  # контекст без окна (headless.OffscreenContext), None - обычное окно
+        self.stats = FrameStats()  # статистика кадров, snapshot() - для внешних инструментов
+        self.show_overlay = overlay  # статистика текстом поверх сцены
+        self.overlay = None  # TextOverlay, создается в init
         self.cube = None
+        self.satellite_cubes = ()  # кубы для маленьких кубов: с текстурой основного и с другой текстурой
+        self.scene = None  # граф сцены (scene.Scene), рисуются все его объекты
+        self.cube_node = None  # узел основного куба
+        self.satellites = satellites
+        self.mesh = mesh
+        self.culling = culling
+        self.culler = None  # отсечение по пирамиде видимости, создается в init вместе со сценой
+        self.queue = RenderQueue() if batching else None
+        self.sort = sort
+        self.retained = retained  # режим отрисовки куба (VBO или glBegin|glEnd)
+        self.hot_reload = hot_reload  # пересобирать шейдеры при изменении файлов
+        self.texture_loader = TextureLoader()  # декодирует текстуры в фоновых потоках
+        self.texture_cache = TextureCache(loader=self.texture_loader)  # общий кэш текстур для всех объектов
+        self.program_cache = ProgramCache(binary_dir='.shadercache')  # общий кэш шейдерных программ
+        self.events = EventBatch()  # события кадра, без объекта на каждое движение мыши
+        self.dispatcher = Dispatcher()  # события получают только подписанные на них обработчики
+        self.bindings = bindings
         self.camera = CameraOrbit(w, h)
 
     def init(self):
         """Создание окна, инициализация"""
-        self.screen = pygame.display.set_mode((self.w, self.h), HWSURFACE | OPENGL | DOUBLEBUF | RESIZABLE)
-        pygame.display.set_caption(self.name)
+        if self.context is None:
+            self.screen = pygame.display.set_mode((self.w, self.h), HWSURFACE | OPENGL | DOUBLEBUF | RESIZABLE)
+            pygame.display.set_caption(self.name)
+        else:
+            # без окна и дисплея: рисуем в буфер кадра (FBO) offscreen-контекста
+            self.context.init(self.w, self.h)
+        if self.show_overlay:
+            # атлас глифов загружается в GPU, поэтому только после создания контекста
+            self.overlay = TextOverlay()
         glEnable(GL_DEPTH_TEST)
         glDepthFunc(GL_LESS)
         self.clock = pygame.time.Clock()
-        self.cube = Cube()
+        self.cube = Cube(self.retained, self.texture_cache, self.program_cache, self.hot_reload, mesh=self.mesh)
+        # сцена: основной куб в корне, маленькие кубы - его дочерние узлы и вращаются вместе с ним
+        self.scene = Scene()
+        self.cube_node = self.scene.add(drawable=self.cube)
+        if self.mesh is not None:
+            # модель в своих координатах: уменьшаем|увеличиваем до куба [-1, 1] (с запасом на сдвиг шейдера)
+            fit = 2.0 / max(numpy.abs(self.cube.bounds).max(), 1e-6)
+            self.cube_node.set_scale(fit, fit, fit)
+        if self.satellites:
+            self.add_satellites(self.satellites)
+        if self.culling:
+            self.culler = SceneCuller(self.scene)
         self.camera.init()
+        # обрабатываем выход из приложения и изменение размера окна
+        self.dispatcher.action('quit', lambda e: self.quit(), 'quit', 'keyup:escape')
+        self.dispatcher.subscribe(VIDEORESIZE, lambda e: self.reshape(*e.size))
+        self.camera.subscribe(self.dispatcher)
+        self.cube.subscribe(self.dispatcher)
+        if self.bindings is not None and os.path.exists(self.bindings):
+            self.dispatcher.load_bindings(self.bindings)
 
     def loop_step(self):
         """Обратока цикла рендеринга pygame"""
         # задаем максимальное количество кадров в секунду
         self.clock.tick(self.frame_rate)
-        # считываем все произошедшие событие
-        for event in pygame.event.get():
-            # обробатываем выход из приложения
-            if event.type == QUIT:
-                self.quit()
-                return
-            if event.type == KEYUP and event.key == K_ESCAPE:
-                self.quit()
-                return
-            # обрабатываем изменение размера окна
-            if event.type == VIDEORESIZE:
-                self.reshape(*event.size)
-            # обработка события
-            self.event(event)
+        profiler.next_frame()
+        self.stats.add(self.clock.get_time())
+        # считываем все произошедшие событие, движения мыши подряд сливаются в одно
+        # без окна событий нет
+        with profiler.scope('events'):
+            events = self.events.poll() if self.context is None else ()
+            for event in events:
+                # обработка события
+                self.event(event)
         # обновляем камеру
-        self.camera.update()
+        with profiler.scope('camera'):
+            self.camera.update()
+        # анимация и пересчет мировых матриц только измененных узлов сцены
+        with profiler.scope('scene'):
+            self.cube.update(self.clock.get_time(), self.cube_node)
+            for cube in self.satellite_cubes:
+                if cube is not self.cube:
+                    cube.update(self.clock.get_time())
+            self.scene.update()
+        # загружаем в GPU готовые текстуры, не больше бюджета времени на кадр
+        with profiler.scope('textures'):
+            self.texture_loader.pump()
         # что-то рисуем
-        self.render()
+        with profiler.scope('render'):
+            self.render()
         # показываем в залоговке окна FPS
-        self.fps()
+        with profiler.scope('fps'):
+            self.fps()
+        if self.context is not None:
+            # без окна: кадр остается в буфере кадра, его можно считать context.read()
+            with profiler.scope('swap'):
+                self.context.swap()
+            return
         # смена кадров, т.к. мы используем DOUBLEBUF ражим
-        pygame.display.flip()
+        with profiler.scope('flip'):
+            pygame.display.flip()
 
     def quit(self):
         """Выход из приложения, закрытие окна"""
+        self.texture_loader.shutdown()
         pygame.quit()
         quit()
 
@@ -342,17 +442,27 @@ class Controller(object):
 
     def reshape(self, width, height):
         """Обрабатываем изменение размера окна"""
-        self.w = self.camera.w = width
-        self.h = self.camera.h = height
+        self.w = width
+        self.h = height
+        # проекция камеры пересчитается только здесь, а не каждый кадр
+        self.camera.resize(width, height)
 
     def event(self, e):
-        """Обрабатываем события"""
-        self.camera.event(e)
-        self.cube.event(e)
+        """Обрабатываем события: поиск обработчиков по таблице (тип, клавиша|кнопка)"""
+        self.dispatcher.dispatch(e)
 
     def fps(self):
-        """Рисуем текущий FPS"""
-        pygame.display.set_caption("%s FPS: %s" % (self.name, self.clock.get_fps()))
+        """Рисуем текущий FPS: заголовок окна обновляется не чаще двух раз в секунду"""
+        if self.stats.due():
+            if self.context is None:
+                pygame.display.set_caption("%s FPS: %.1f" % (self.name, self.stats.fps))
+            if self.overlay is not None:
+                text = self.stats.format()
+                if profiler.enabled:
+                    text += '\n' + profiler.report()
+                self.overlay.set_text(text)
+        if self.overlay is not None:
+            self.overlay.render(self.w, self.h)
 
     def run(self):
         """Запуск приложения"""
@@ -367,10 +477,59 @@ class Controller(object):
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         # Включаем сглаживание
         glEnable(GL_POLYGON_SMOOTH)
-        # Рисуем куб
-        self.cube.render(self.clock.get_time())
+        # Отсекаем объекты вне поля зрения камеры
+        visible = None
+        if self.culler is not None:
+            with profiler.scope('cull'):
+                visible = self.culler.visible(self.camera.projection @ self.camera.view)
+                self.stats.counters.update(self.culler.counters())
+        # Рисуем видимые объекты сцены
+        with profiler.scope('Cube.render'):
+            if self.queue is None:
+                for drawable, model in self.scene.items(visible):
+                    drawable.render(self.camera, model)
+            else:
+                # объекты сортируются по ключу состояния, одинаковые рисуются подряд
+                self.queue.submit_scene(self.scene, visible, self.camera)
+                self.queue.flush(self.camera, self.sort)
+                self.stats.counters.update(self.queue.counters())
+
+    def add_satellites(self, count, radius=2.5, size=0.15):
+        """Добавляет count маленьких кубов, равномерно расставленных по сфере вокруг основного"""
+        # точки спирали Фибоначчи на сфере
+        i = numpy.arange(count) + 0.5
+        theta = numpy.arccos(1.0 - 2.0 * i / count)
+        phi = numpy.pi * (1.0 + 5 ** 0.5) * i
+        positions = radius * numpy.stack((numpy.sin(theta) * numpy.cos(phi), numpy.sin(theta) * numpy.sin(phi),
+                                          numpy.cos(theta)), 1)
+        # кубы через один с другой текстурой: в порядке сцены текстура меняется на каждом кубе
+        if not self.satellite_cubes:
+            # с --mesh основной объект - модель в своем размере, а маленькие остаются кубами [-1, 1]
+            cube = self.cube
+            if self.mesh is not None:
+                cube = Cube(self.retained, self.texture_cache, self.program_cache, self.hot_reload)
+            self.satellite_cubes = (cube, Cube(self.retained, self.texture_cache, self.program_cache, self.hot_reload,
+                                               mipmaps=False))
+        drawables = [self.satellite_cubes[i % 2] for i in range(count)]
+        # масштаб родителя умножается на свой, поэтому размер задается относительно основного куба
+        fit = self.scene.scales[self.cube_node.index, 0]
+        self.scene.add_many(count, self.cube_node, positions / fit, scales=size / fit, drawable=drawables)
 
 
 if __name__ == '__main__':
-    main = Controller()
+    # с ключом --profile время фаз кадра пишется в trace.json (chrome://tracing)
+    if '--profile' in sys.argv:
+        profiler.enable('trace.json')
+    # с ключом --vbo куб рисуется через буферы, удобно для сравнения скорости
+    # с ключом --watch изменения vertex.glsl|fragment.glsl применяются без перезапуска
+    # с ключом --stats статистика кадров рисуется поверх сцены
+    # с ключом --satellites N вокруг куба вращаются еще N маленьких кубов (узлы графа сцены)
+    # с ключом --no-cull рисуются все объекты, даже вне поля зрения камеры
+    # с ключом --mesh model.obj вместо куба рисуется модель (разбор OBJ кэшируется в .meshcache)
+    # с ключом --no-batch каждый объект рисуется отдельно со всеми сменами состояния, --no-sort - без сортировки
+    satellites = int(sys.argv[sys.argv.index('--satellites') + 1]) if '--satellites' in sys.argv else 0
+    mesh = sys.argv[sys.argv.index('--mesh') + 1] if '--mesh' in sys.argv else None
+    main = Controller(retained='--vbo' in sys.argv, hot_reload='--watch' in sys.argv, overlay='--stats' in sys.argv,
+                      satellites=satellites, culling='--no-cull' not in sys.argv,
+                      batching='--no-batch' not in sys.argv, sort='--no-sort' not in sys.argv, mesh=mesh)
     main.run()
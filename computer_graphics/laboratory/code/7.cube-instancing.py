@@ -0,0 +1,350 @@
+"""
+Рисуем много кубов одним вызовом: аппаратное дублирование (instancing)
+
+Геометрия куба, шейдеры и текстуры загружаются один раз, а матрица модели, цвет
+и слой массива текстур задаются для каждого куба в буфере экземпляров (instancing.InstanceBuffer).
+Каждый кадр поворачивается только часть кубов, и в GPU отправляются только их данные.
+
+Задание: изменить расстановку кубов (сфера, спираль), добавить масштаб экземпляра, сравнить
+скорость с отрисовкой каждого куба отдельным вызовом (python bench_instancing.py)
+
+"""
+
+import ctypes
+import math
+import os
+import sys
+
+import pygame
+from pygame.locals import *
+
+from OpenGL.GL import *
+from OpenGL.GLU import *
+
+from buffers import MeshBuffer
+from camera import CameraOrbit
+from events import Dispatcher, EventBatch
+from frame_stats import FrameStats
+from instancing import InstanceBuffer, PALETTE
+from profiling import profiler
+from text_overlay import TextOverlay
+import textures
+from shaders import ProgramCache
+import transforms
+
+import numpy
+
+
+class Cubes(object):
+    """Класс для создания и отрисовки count кубов, расставленных сеткой"""
+
+    SPACING = 3.0  # расстояние между центрами кубов
+
+    def __init__(self, count=10000, animate=0.125, program_cache=None):
+        """Заполняем массивы вершин и полигонов одного куба и данные всех экземпляров
+
+        animate - доля кубов, поворачиваемых за кадр (0 - кубы неподвижны, 1 - все кубы каждый кадр)
+        """
+        self.verticies = (
+            (1, -1, -1),   # 0
+            (1, 1, -1),    # 1
+            (-1, 1, -1),   # 2
+            (-1, -1, -1),  # 3
+            (1, -1, 1),    # 4
+            (1, 1, 1),     # 5
+            (-1, -1, 1),   # 6
+            (-1, 1, 1)     # 7
+        )
+        self.faces = (
+            (1, 2, 7, 5),
+            (4, 6, 3, 0),
+            (5, 7, 6, 4),
+            (0, 3, 2, 1),
+            (7, 2, 3, 6),
+            (1, 5, 4, 0)
+        )
+        self.uvs = (((0, 0), (1, 0), (1, 1), (0, 1)),) * len(self.faces)
+        # геометрия одна на все кубы
+        self.buffer = MeshBuffer.from_faces(self.verticies, self.faces, self.uvs).upload()
+
+        # слои массива текстур: стена и ее варианты одного размера
+        wall = textures.load_image('wall.jpg')
+        layers = [wall, wall[..., ::-1], wall[::-1], numpy.repeat(wall.mean(axis=2, keepdims=True).astype(numpy.uint8), 3, 2)]
+        self.texture_id = textures.upload_array(layers)
+
+        if program_cache is None:
+            program_cache = ProgramCache()
+        self.program = program_cache.load([('instanced_vertex.glsl', GL_VERTEX_SHADER),
+                                           ('instanced_fragment.glsl', GL_FRAGMENT_SHADER)])
+        self.program.use()
+        self.program.set("textures", 0)
+        glUseProgram(0)
+
+        # расставляем кубы по сетке side x side x side с центром в начале координат
+        self.count = count
+        self.side = max(int(math.ceil(count ** (1.0 / 3.0) - 1e-9)), 1)
+        index = numpy.arange(count)
+        grid = numpy.stack((index % self.side, index // self.side % self.side, index // self.side ** 2), 1)
+        self.positions = ((grid - (self.side - 1) / 2.0) * self.SPACING).astype(numpy.float32)
+        # у каждого куба своя ось и скорость вращения
+        rng = numpy.random.default_rng(0)
+        self.axes = rng.normal(size=(count, 3)) + 1e-6
+        self.speeds = rng.uniform(30.0, 120.0, count)  # градусов в секунду
+        # время складывается из длительностей кадров, с имитированными часами кадры повторяются
+        self.time = 0.0
+
+        self.instances = InstanceBuffer(count)
+        self.instances.append(self.models(0, count), PALETTE[index % len(PALETTE)], index % len(layers))
+
+        self.enable_rotation = animate > 0
+        self.chunk = max(int(count * animate), 1)  # кубов на кадр
+        self.cursor = 0  # с какого куба продолжить поворот в следующем кадре
+
+    @property
+    def radius(self):
+        """Радиус сферы, в которую помещаются все кубы"""
+        return self.side * self.SPACING * math.sqrt(3) / 2.0 + 2.0
+
+    def models(self, start, stop):
+        """Матрицы моделей кубов [start, stop) для текущего времени, векторно"""
+        models = transforms.rotate_batch(self.speeds[start:stop] * self.time, self.axes[start:stop])
+        models[:, :3, 3] = self.positions[start:stop]
+        return models
+
+    def animate(self, time):
+        """Поворачиваем очередную часть кубов, в GPU уйдут только их данные
+
+        time - длительность прошлого кадра в миллисекундах
+        """
+        self.time += 0.001 * time
+        if not self.enable_rotation:
+            return
+        start = self.cursor
+        stop = min(start + self.chunk, self.count)
+        self.instances.update(start, self.models(start, stop))
+        self.cursor = 0 if stop >= self.count else stop
+
+    def render(self, camera):
+        """Рисуем все кубы одним вызовом"""
+        self.instances.upload()
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D_ARRAY, self.texture_id)
+
+        self.program.use()
+        self.program.set("projection", camera.projection)
+        self.program.set("view", camera.view)
+        bound = self.instances.bind(self.program.attrib("instance_model"), self.program.attrib("instance_color"),
+                                    self.program.attrib("instance_layer"))
+        self.buffer.render_attribs(self.program.attrib("position"), self.program.attrib("uv"),
+                                   instances=len(self.instances))
+        self.instances.unbind(bound)
+        glUseProgram(0)
+        glBindTexture(GL_TEXTURE_2D_ARRAY, 0)
+
+    def render_each(self, camera):
+        """Для сравнения: каждый куб отдельным вызовом glDrawElements
+
+        Атрибуты экземпляра не читаются из буфера, а задаются постоянными значениями перед каждым кубом.
+        """
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D_ARRAY, self.texture_id)
+        self.program.use()
+        self.program.set("projection", camera.projection)
+        self.program.set("view", camera.view)
+        model_loc = self.program.attrib("instance_model")
+        color_loc = self.program.attrib("instance_color")
+        layer_loc = self.program.attrib("instance_layer")
+        position_loc, uv_loc = self.program.attrib("position"), self.program.attrib("uv")
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffer.vbo)
+        glEnableVertexAttribArray(position_loc)
+        glVertexAttribPointer(position_loc, 3, GL_FLOAT, GL_FALSE, MeshBuffer.STRIDE, None)
+        glEnableVertexAttribArray(uv_loc)
+        glVertexAttribPointer(uv_loc, 2, GL_FLOAT, GL_FALSE, MeshBuffer.STRIDE, ctypes.c_void_p(MeshBuffer.UV_OFFSET))
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.buffer.ibo)
+        instances = self.instances.instances
+        for model, color, layer in zip(instances['model'], instances['color'] / 255.0, instances['layer']):
+            for row in range(4):
+                glVertexAttrib4fv(model_loc + row, model[row])
+            glVertexAttrib4fv(color_loc, color)
+            glVertexAttrib1f(layer_loc, layer)
+            glDrawElements(GL_TRIANGLES, self.buffer.count, GL_UNSIGNED_INT, None)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glDisableVertexAttribArray(uv_loc)
+        glDisableVertexAttribArray(position_loc)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glUseProgram(0)
+        glBindTexture(GL_TEXTURE_2D_ARRAY, 0)
+
+    def subscribe(self, dispatcher):
+        """Регистрируем действия кубов с клавишами по умолчанию, их можно переназначить"""
+        dispatcher.action('toggle_rotation', self.toggle_rotation, 'keyup:space')
+
+    def toggle_rotation(self, e):
+        self.enable_rotation = not self.enable_rotation
+
+
+class Controller(object):
+    """Основной класс для создания окна и запуска цикла рендеринга"""
+
+    def __init__(self, w=800, h=600, name="Lab", frame_rate=60, count=10000, animate=0.125, instanced=True,
+                 bindings='bindings.json', context=None, overlay=False):
+        """Конструктор нашего класса
+
+        Принимает параметры размера окна, название окна и ограничение количества кадров всекунду
+        count - количество кубов, animate - доля кубов, поворачиваемых за кадр
+        instanced - рисовать все кубы одним вызовом (False - каждый куб отдельно, для сравнения)
+        bindings - файл привязок клавиш (events.Dispatcher.load_bindings), читается, если есть
+        """
+        self.w = w
+        self.h = h
+        self.name = name
+        self.frame_rate = frame_rate
+        self.screen = None  # ссылка на созданное коно
+        self.clock = None  # вспомогательный объект для контроля FPS
+        self.context = context  # контекст без окна (headless.OffscreenContext), None - обычное окно
+        self.stats = FrameStats()  # статистика кадров, snapshot() - для внешних инструментов
+        self.show_overlay = overlay  # статистика текстом поверх сцены
+        self.overlay = None  # TextOverlay, создается в init
+        self.cubes = None
+        self.count = count
+        self.animate = animate
+        self.instanced = instanced
+        self.program_cache = ProgramCache(binary_dir='.shadercache')  # общий кэш шейдерных программ
+        self.events = EventBatch()  # события кадра, без объекта на каждое движение мыши
+        self.dispatcher = Dispatcher()  # события получают только подписанные на них обработчики
+        self.bindings = bindings
+        self.camera = None  # радиус орбиты зависит от размера сетки, создается в init
+
+    def init(self):
+        """Создание окна, инициализация"""
+        if self.context is None:
+            self.screen = pygame.display.set_mode((self.w, self.h), HWSURFACE | OPENGL | DOUBLEBUF | RESIZABLE)
+            pygame.display.set_caption(self.name)
+        else:
+            # без окна и дисплея: рисуем в буфер кадра (FBO) offscreen-контекста
+            self.context.init(self.w, self.h)
+        if self.show_overlay:
+            # атлас глифов загружается в GPU, поэтому только после создания контекста
+            self.overlay = TextOverlay()
+        glEnable(GL_DEPTH_TEST)
+        glDepthFunc(GL_LESS)
+        self.clock = pygame.time.Clock()
+        self.cubes = Cubes(self.count, self.animate, self.program_cache)
+        # камера снаружи сетки кубов
+        radius = self.cubes.radius
+        self.camera = CameraOrbit(self.w, self.h, radius_min=4, radius_max=radius * 4)
+        self.camera.init(pos=(radius * 1.2, radius * 0.8, -radius * 1.4), far=radius * 8)
+        # обрабатываем выход из приложения и изменение размера окна
+        self.dispatcher.action('quit', lambda e: self.quit(), 'quit', 'keyup:escape')
+        self.dispatcher.subscribe(VIDEORESIZE, lambda e: self.reshape(*e.size))
+        self.camera.subscribe(self.dispatcher)
+        self.cubes.subscribe(self.dispatcher)
+        if self.bindings is not None and os.path.exists(self.bindings):
+            self.dispatcher.load_bindings(self.bindings)
+
+    def loop_step(self):
+        """Обратока цикла рендеринга pygame"""
+        # задаем максимальное количество кадров в секунду
+        self.clock.tick(self.frame_rate)
+        profiler.next_frame()
+        self.stats.add(self.clock.get_time())
+        # считываем все произошедшие событие, движения мыши подряд сливаются в одно
+        # без окна событий нет
+        with profiler.scope('events'):
+            events = self.events.poll() if self.context is None else ()
+            for event in events:
+                # обработка события
+                self.event(event)
+        # обновляем камеру
+        with profiler.scope('camera'):
+            self.camera.update()
+        # поворачиваем часть кубов
+        with profiler.scope('animate'):
+            self.cubes.animate(self.clock.get_time())
+        # что-то рисуем
+        with profiler.scope('render'):
+            self.render()
+        # показываем в заголовке окна FPS
+        with profiler.scope('fps'):
+            self.fps()
+        if self.context is not None:
+            # без окна: кадр остается в буфере кадра, его можно считать context.read()
+            with profiler.scope('swap'):
+                self.context.swap()
+            return
+        # смена кадров, т.к. мы используем DOUBLEBUF ражим
+        with profiler.scope('flip'):
+            pygame.display.flip()
+
+    def quit(self):
+        """Выход из приложения, закрытие окна"""
+        pygame.quit()
+        quit()
+
+    def loop(self):
+        """Запускает бесконечный цикл рендеринга"""
+        while True:
+            self.loop_step()
+
+    def reshape(self, width, height):
+        """Обрабатываем изменение размера окна"""
+        self.w = width
+        self.h = height
+        # проекция камеры пересчитается только здесь, а не каждый кадр
+        self.camera.resize(width, height)
+
+    def event(self, e):
+        """Обрабатываем события: поиск обработчиков по таблице (тип, клавиша|кнопка)"""
+        self.dispatcher.dispatch(e)
+
+    def fps(self):
+        """Рисуем текущий FPS: заголовок окна обновляется не чаще двух раз в секунду"""
+        if self.stats.due():
+            if self.context is None:
+                pygame.display.set_caption("%s FPS: %.1f cubes: %s" % (self.name, self.stats.fps, self.count))
+            if self.overlay is not None:
+                text = self.stats.format()
+                text += '\nupload %.1f KB in %s calls' % (self.cubes.instances.uploaded_bytes / 1024.0,
+                                                          self.cubes.instances.upload_calls)
+                if profiler.enabled:
+                    text += '\n' + profiler.report()
+                self.overlay.set_text(text)
+        if self.overlay is not None:
+            self.overlay.render(self.w, self.h)
+
+    def run(self):
+        """Запуск приложения"""
+        self.init()
+        #  выставляем начальное положение камеры
+        self.camera.update()
+        self.loop()
+
+    def render(self):
+        """Рисуем"""
+        # Очищаем экран
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        # Рисуем кубы
+        with profiler.scope('Cubes.render'):
+            if self.instanced:
+                self.cubes.render(self.camera)
+            else:
+                self.cubes.render_each(self.camera)
+
+
+def parse_count(argv, default=10000):
+    """Количество кубов из аргумента --count N"""
+    if '--count' in argv:
+        return int(float(argv[argv.index('--count') + 1]))
+    return default
+
+
+if __name__ == '__main__':
+    # с ключом --profile время фаз кадра пишется в trace.json (chrome://tracing)
+    if '--profile' in sys.argv:
+        profiler.enable('trace.json')
+    # с ключом --count N рисуется N кубов (например, --count 1e5)
+    # с ключом --each каждый куб рисуется отдельным вызовом, удобно для сравнения скорости
+    # с ключом --stats статистика кадров рисуется поверх сцены
+    main = Controller(count=parse_count(sys.argv), instanced='--each' not in sys.argv, overlay='--stats' in sys.argv)
+    main.run()
@@ -0,0 +1,73 @@
+"""
+Стоимость обработки ввода за кадр при потоке движений мыши
+
+Каждый кадр в очередь pygame кладется N синтетических MOUSEMOTION (при зажатой кнопке),
+после чего события обрабатываются двумя способами:
+    direct   - как раньше: каждое событие из pygame.event.get() идет в CameraOrbit.event
+    coalesce - через events.EventBatch: подряд идущие движения сливаются в одно
+Окно не создается (SDL_VIDEODRIVER=dummy), OpenGL контекст не нужен.
+
+Запуск:
+    python bench_input.py
+    python bench_input.py --storm 100 1000 5000 --frames 100
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy
+import pygame
+from pygame.locals import *
+
+from camera import CameraOrbit
+from events import EventBatch
+
+
+def post_storm(count, frame):
+    """Кладет в очередь нажатие кнопки и count движений мыши"""
+    pygame.event.post(pygame.event.Event(MOUSEBUTTONDOWN, button=1, pos=(400, 300)))
+    for i in range(count):
+        x = 400 + (i + frame) % 50
+        pygame.event.post(pygame.event.Event(MOUSEMOTION, pos=(x, 300), rel=(1, 0), buttons=(1, 0, 0)))
+
+
+def run(mode, count, frames):
+    """Возвращает среднее время обработки ввода за кадр в секундах (без заполнения очереди)"""
+    camera = CameraOrbit(800, 600)
+    camera.init()
+    batch = EventBatch()
+    total = 0.0
+    for frame in range(frames):
+        post_storm(count, frame)
+        start = time.perf_counter()
+        events = batch.poll() if mode == 'coalesce' else pygame.event.get()
+        for event in events:
+            camera.event(event)
+        camera.update()
+        total += time.perf_counter() - start
+    return total / frames, camera
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--storm', type=int, nargs='+', default=[10, 100, 1000], help='движений мыши за кадр')
+    parser.add_argument('--frames', type=int, default=50, help='количество кадров')
+    args = parser.parse_args()
+
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+    for count in args.storm:
+        direct, camera_direct = run('direct', count, args.frames)
+        coalesced, camera_coalesced = run('coalesce', count, args.frames)
+        # слияние не должно менять итоговое положение камеры
+        same = numpy.allclose(camera_direct.state, camera_coalesced.state)
+        print("%6s events/frame  direct: %8.3f ms  coalesce: %8.3f ms  speedup: %5.1fx  same camera: %s" % (
+            count, direct * 1000, coalesced * 1000, direct / max(coalesced, 1e-9), same))
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Замер отрисовки N кубов (7.cube-instancing.py) без окна, N от 1 до 1 000 000
+
+Для каждого N замеряются режимы:
+    static   - все кубы одним вызовом, данные экземпляров не меняются (в GPU ничего не отправляется)
+    partial  - каждый кадр поворачивается доля --partial кубов, отправляются только их данные
+    full     - каждый кадр меняются и отправляются данные всех кубов
+    each     - каждый куб отдельным вызовом glDrawElements (только для N <= --each-max)
+Время кадра - полный loop_step с glFinish, в миллисекундах, плюс объем отправленных данных за кадр.
+
+Запуск:
+    python bench_instancing.py --frames 30 --json instancing.json
+    python bench_instancing.py --counts 1000 100000 --size 320x240
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy
+
+import headless
+from bench_labs import SimulatedClock, enter_lab, statistics
+
+
+LAB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '7.cube-instancing.py')
+COUNTS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+MODES = ('static', 'partial', 'full', 'each')
+
+
+def run(lab, count, mode, frames, warmup, size, partial, backend):
+    """Запускает лабораторную с count кубами и возвращает (времена кадров, байт отправлено за кадр)"""
+    context = headless.OffscreenContext(backend)
+    animate = {'static': 0.0, 'partial': partial, 'full': 1.0, 'each': 0.0}[mode]
+    controller = lab.Controller(size[0], size[1], frame_rate=0, count=count, animate=animate,
+                                instanced=mode != 'each', context=context)
+    controller.init()
+    controller.clock = SimulatedClock(1000.0 / 60)
+    instances = controller.cubes.instances
+    for _ in range(warmup):
+        controller.loop_step()
+    samples = numpy.zeros(frames)
+    uploaded = 0
+    for i in range(frames):
+        start = time.perf_counter()
+        controller.loop_step()
+        samples[i] = time.perf_counter() - start
+        uploaded += instances.uploaded_bytes
+    context.destroy()
+    return samples, uploaded / float(frames)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--counts', type=lambda x: int(float(x)), nargs='*', default=COUNTS, help='количества кубов')
+    parser.add_argument('--modes', nargs='*', default=MODES, choices=MODES)
+    parser.add_argument('--frames', type=int, default=20, help='количество замеряемых кадров')
+    parser.add_argument('--warmup', type=int, default=3, help='кадров прогрева перед замером')
+    parser.add_argument('--size', type=headless.parse_size, default=(320, 240), help='размер кадра')
+    parser.add_argument('--partial', type=float, default=0.01, help='доля кубов, меняющихся за кадр в режиме partial')
+    parser.add_argument('--each-max', type=int, default=10000, help='наибольшее N для режима each')
+    parser.add_argument('--backend', default='egl', choices=headless.BACKENDS)
+    parser.add_argument('--json', help='сохранить результаты в JSON')
+    args = parser.parse_args(argv)
+
+    # контекст без окна: OpenGL должен импортироваться уже для выбранной платформы
+    headless.select_backend(args.backend)
+    lab = enter_lab(LAB, args)
+
+    results = []
+    print("%10s %-8s %10s %10s %10s %12s" % ('count', 'mode', 'mean', 'p95', 'max', 'upload KB'))
+    for count in args.counts:
+        for mode in args.modes:
+            if mode == 'each' and count > args.each_max:
+                continue
+            samples, uploaded = run(lab, count, mode, args.frames, args.warmup, args.size, args.partial,
+                                    args.backend)
+            stats = statistics(samples)
+            print("%10d %-8s %10.3f %10.3f %10.3f %12.1f" % (count, mode, stats['mean'], stats['p95'], stats['max'],
+                                                            uploaded / 1024.0))
+            sys.stdout.flush()
+            results.append(dict(stats, count=count, mode=mode, upload_bytes=uploaded))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'size': list(args.size), 'frames': args.frames, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""
+Замер времени кадра всех лабораторных без окна (headless) с имитированными часами
+
+Каждая лабораторная запускается на N кадров без ограничения FPS; часы pygame заменяются
+имитированными (каждый кадр длится ровно --step-ms), поэтому анимация и кадры повторяются
+от запуска к запуску. Для каждого кадра записываются:
+    frame - полное время loop_step, включая ожидание окончания рисования (glFinish)
+    cpu   - время loop_step без ожидания glFinish (работа Python и драйвера)
+    gpu   - время выполнения команд на GPU по запросу GL_TIME_ELAPSED, если он поддерживается
+Отчет - mean, p50, p95, p99, max в миллисекундах, в JSON и|или CSV.
+С --baseline отчет сравнивается с сохраненным: если mean или p95 выросли больше чем на
+--threshold (и больше чем на --min-delta-ms), лабораторная помечается REGRESSION
+и код возврата равен 1.
+
+Запуск:
+    python bench_labs.py --frames 300 --json baseline.json
+    python bench_labs.py --frames 300 --baseline baseline.json --csv report.csv
+    python bench_labs.py 3.cube-polygons.py 6.cube-shader.py --backend osmesa
+"""
+
+import argparse
+import csv
+import ctypes
+import glob
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy
+
+import headless
+
+
+STATISTICS = ('mean', 'p50', 'p95', 'p99', 'max')
+METRICS = ('frame', 'cpu', 'gpu')
+COMPARED = ('mean', 'p95')
+
+
+class SimulatedClock(object):
+    """Замена pygame.time.Clock: каждый кадр длится step_ms, без ожидания"""
+
+    def __init__(self, step_ms):
+        self.step_ms = step_ms
+        self.time = 0
+
+    def tick(self, frame_rate=0):
+        self.time += self.step_ms
+        return self.step_ms
+
+    def get_time(self):
+        return self.step_ms
+
+    def get_fps(self):
+        return 1000.0 / self.step_ms
+
+
+class GpuTimer(object):
+    """Время GPU через GL_TIME_ELAPSED; результат запроса читается после glFinish в конце кадра"""
+
+    def __init__(self):
+        from OpenGL.GL import glGenQueries, glGetString, GL_VERSION, GL_EXTENSIONS
+
+        version = tuple(int(x) for x in glGetString(GL_VERSION).split()[0].split(b'.')[:2])
+        extensions = glGetString(GL_EXTENSIONS) or b''
+        self.supported = version >= (3, 3) or b'GL_ARB_timer_query' in extensions
+        self.query = glGenQueries(1)[0] if self.supported else None
+        self.result = ctypes.c_uint64()
+
+    def begin(self):
+        if self.supported:
+            from OpenGL.GL import glBeginQuery, GL_TIME_ELAPSED
+            glBeginQuery(GL_TIME_ELAPSED, self.query)
+
+    def end(self):
+        """Возвращает время в секундах или None"""
+        if not self.supported:
+            return None
+        from OpenGL.GL import glEndQuery, GL_TIME_ELAPSED, GL_QUERY_RESULT
+        # обертка PyOpenGL для 64-битного результата не работает, берем функцию напрямую
+        from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v
+
+        glEndQuery(GL_TIME_ELAPSED)
+        glGetQueryObjectui64v(self.query, GL_QUERY_RESULT, ctypes.byref(self.result))
+        return self.result.value * 1e-9
+
+    def delete(self):
+        if self.supported:
+            from OpenGL.GL import glDeleteQueries
+            glDeleteQueries(1, [self.query])
+
+
+def statistics(samples):
+    """mean, p50, p95, p99, max в миллисекундах"""
+    ms = numpy.asarray(samples, numpy.float64) * 1000.0
+    p50, p95, p99 = numpy.percentile(ms, (50, 95, 99))
+    return {'mean': float(ms.mean()), 'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'max': float(ms.max())}
+
+
+def wait_textures(controller, timeout=30.0):
+    """Дожидается фоновой загрузки текстур, чтобы в замер не попали кадры с заглушкой"""
+    loader = getattr(controller, 'texture_loader', None)
+    if loader is None:
+        return
+    deadline = time.perf_counter() + timeout
+    while loader.pending and time.perf_counter() < deadline:
+        loader.pump()
+        time.sleep(0.001)
+
+
+def absolute_paths(args, names):
+    """Пути из командной строки (атрибуты names у args) - относительно каталога запуска: делаем абсолютными"""
+    for name in names:
+        if getattr(args, name, None):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+
+def enter_lab(filename, args=None, paths=('json',)):
+    """Загружает лабораторную (headless.load_lab) и делает ее каталог текущим, возвращает модуль
+
+    Лабораторные открывают wall.jpg, *.glsl относительно своего каталога, поэтому пути paths из args
+    (например --json) сначала делаются абсолютными. Вернуться в прежний каталог - забота вызывающего.
+    """
+    if args is not None:
+        absolute_paths(args, paths)
+    filename = os.path.abspath(filename)
+    os.chdir(os.path.dirname(filename))
+    return headless.load_lab(filename)
+
+
+def run_lab(filename, frames, warmup, size, step_ms, backend):
+    """Запускает лабораторную и возвращает времена кадров (секунды) по метрикам"""
+    cwd = os.getcwd()
+    try:
+        return measure_lab(enter_lab(filename), frames, warmup, size, step_ms, backend)
+    finally:
+        os.chdir(cwd)
+
+
+def measure_lab(lab, frames, warmup, size, step_ms, backend):
+    """Прогрев и замер кадров модуля лабораторной lab, текущий каталог - каталог лабораторной"""
+    context = headless.OffscreenContext(backend)
+    controller = lab.Controller(size[0], size[1], frame_rate=0, context=context)
+    controller.init()
+    controller.clock = SimulatedClock(step_ms)
+    timer = GpuTimer()
+    for _ in range(warmup):
+        controller.loop_step()
+    wait_textures(controller)
+    samples = dict((metric, numpy.zeros(frames)) for metric in METRICS)
+    for i in range(frames):
+        timer.begin()
+        start = time.perf_counter()
+        controller.loop_step()
+        elapsed = time.perf_counter() - start
+        gpu = timer.end()
+        samples['frame'][i] = elapsed
+        samples['cpu'][i] = elapsed - context.finish_time
+        samples['gpu'][i] = numpy.nan if gpu is None else gpu
+    timer.delete()
+    if hasattr(controller, 'texture_loader'):
+        controller.texture_loader.shutdown()
+    context.destroy()
+    if not timer.supported:
+        del samples['gpu']
+    return samples
+
+
+def make_report(results, args):
+    return {
+        'meta': {
+            'frames': args.frames,
+            'warmup': args.warmup,
+            'size': list(args.size),
+            'step_ms': args.step_ms,
+            'backend': args.backend,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+        },
+        'labs': dict((name, dict((metric, statistics(values)) for metric, values in samples.items()))
+                     for name, samples in results.items()),
+    }
+
+
+def write_csv(report, filename):
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('lab', 'metric') + STATISTICS)
+        for name, metrics in sorted(report['labs'].items()):
+            for metric, stats in metrics.items():
+                writer.writerow([name, metric] + ['%.4f' % stats[key] for key in STATISTICS])
+
+
+def compare(report, baseline, threshold, min_delta_ms=0.0):
+    """Сравнивает отчеты, возвращает список (lab, metric, stat, old, new) с ростом больше threshold
+
+    Рост меньше min_delta_ms не считается: доли микросекунды у пустых кадров - это шум.
+    """
+    regressions = []
+    for name, metrics in sorted(report['labs'].items()):
+        old_metrics = baseline['labs'].get(name)
+        if old_metrics is None:
+            continue
+        for metric, stats in metrics.items():
+            old_stats = old_metrics.get(metric)
+            if old_stats is None:
+                continue
+            for key in COMPARED:
+                old, new = old_stats[key], stats[key]
+                if old > 0 and new > old * (1.0 + threshold) and new - old > min_delta_ms:
+                    regressions.append((name, metric, key, old, new))
+    return regressions
+
+
+def print_report(report):
+    print("%-26s %-6s" % ('lab', 'metric') + ''.join("%10s" % key for key in STATISTICS))
+    for name, metrics in sorted(report['labs'].items()):
+        for metric, stats in metrics.items():
+            print("%-26s %-6s" % (name, metric) + ''.join("%10.3f" % stats[key] for key in STATISTICS))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('labs', nargs='*', help='файлы лабораторных (по умолчанию все [1-9].*.py)')
+    parser.add_argument('--frames', type=int, default=300, help='количество замеряемых кадров')
+    parser.add_argument('--warmup', type=int, default=10, help='кадров прогрева перед замером')
+    parser.add_argument('--size', type=headless.parse_size, default=(800, 600), help='размер кадра')
+    parser.add_argument('--step-ms', type=float, default=1000.0 / 60, help='длительность кадра имитированных часов')
+    parser.add_argument('--backend', default='egl', choices=headless.BACKENDS)
+    parser.add_argument('--json', help='сохранить отчет в JSON (его же можно передать в --baseline)')
+    parser.add_argument('--csv', help='сохранить отчет в CSV')
+    parser.add_argument('--baseline', help='JSON отчет для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.10, help='допустимый рост mean|p95 (0.10 = 10%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.05, help='минимальный учитываемый рост в мс')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # run_lab меняет текущий каталог на время замера, отчеты пишутся после
+    absolute_paths(args, ('json', 'csv', 'baseline'))
+    # контекст без окна: OpenGL должен импортироваться уже для выбранной платформы
+    headless.select_backend(args.backend)
+    labs = args.labs or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '[1-9].*.py')))
+
+    results = {}
+    for filename in labs:
+        name = os.path.basename(filename)
+        results[name] = run_lab(filename, args.frames, args.warmup, args.size, args.step_ms, args.backend)
+    report = make_report(results, args)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.csv:
+        write_csv(report, args.csv)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        for name, metric, key, old, new in regressions:
+            print("REGRESSION %s %s %s: %.3f ms -> %.3f ms (+%.0f%%)" % (name, metric, key, old, new, (new / old - 1) * 100))
+        if regressions:
+            return 1
+        print("no regressions against %s" % args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Замер загрузки OBJ (mesh_loader) на сгенерированных сетках-решетках из N треугольников
+
+Для каждого N и формата углов полигонов (--layouts: v, v/vt, v//vn, v/vt/vn) создается файл OBJ
+только с нужными строками (без vt|vn, если их нет в формате), затем замеряются:
+    convert  - потоковый разбор OBJ и запись кэша .mesh, с пиком памяти numpy (tracemalloc)
+    read     - открытие кэша через memmap и чтение всех данных
+Пик памяти растет с количеством уникальных вершин, но не с размером файла:
+текст OBJ и индексы треугольников в памяти целиком не держатся.
+OpenGL не нужен.
+
+Запуск:
+    python bench_mesh_loader.py
+    python bench_mesh_loader.py --triangles 1e7 --dir /tmp/meshes --chunk-mb 4 --layouts v/vt/vn
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy
+
+import mesh_loader
+
+
+LAYOUTS = ('v', 'v/vt', 'v//vn', 'v/vt/vn')
+CORNERS = {'v': "%d", 'v/vt': "%d/%d", 'v//vn': "%d//1", 'v/vt/vn': "%d/%d/1"}
+
+
+def write_grid(path, triangles, layout='v/vt/vn', rows=256):
+    """Решетка side x side вершин, по два треугольника на клетку; возвращает количество треугольников
+
+    Файл пишется блоками по rows строк решетки, чтобы генерация тоже не занимала много памяти.
+    """
+    side = max(int((triangles / 2.0) ** 0.5), 1) + 1
+    with open(path, 'w') as f:
+        f.write("# grid %dx%d\n" % (side, side))
+        for keyword in ('v', 'vt') if '/vt' in layout else ('v',):
+            for row in range(0, side, rows):
+                y, x = numpy.mgrid[row:min(row + rows, side), 0:side].reshape(2, -1) / float(side - 1)
+                line = "v %.6f %.6f 0\n" if keyword == 'v' else "vt %.6f %.6f\n"
+                f.write(''.join(line % p for p in zip(x.tolist(), y.tolist())))
+        if layout.endswith('vn'):
+            f.write("vn 0 0 1\n")
+        # индекс uv совпадает с индексом вершины
+        corner = CORNERS[layout]
+        line = "f %s %s %s\n" % (corner, corner, corner)
+        repeat = corner.count('%d')
+        for row in range(0, side - 1, rows):
+            r, c = numpy.mgrid[row:min(row + rows, side - 1), 0:side - 1].reshape(2, -1)
+            a = r * side + c + 1
+            # клетка a, a + 1, a + side + 1, a + side -> два треугольника
+            for face in ((a, a + 1, a + side + 1), (a, a + side + 1, a + side)):
+                columns = numpy.repeat(numpy.stack(face, 1), repeat, 1)
+                f.write(''.join(line % tuple(corners) for corners in columns.tolist()))
+    return 2 * (side - 1) ** 2
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--triangles', type=lambda x: int(float(x)), nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--chunk-mb', type=float, default=mesh_loader.CHUNK_SIZE / float(1 << 20),
+                        help='размер блока чтения в МБ')
+    parser.add_argument('--dir', help='каталог для файлов (по умолчанию временный, удаляется)')
+    parser.add_argument('--layouts', nargs='+', default=LAYOUTS, choices=LAYOUTS, help='форматы углов полигонов')
+    parser.add_argument('--keep', action='store_true', help='не удалять созданные файлы')
+    args = parser.parse_args(argv)
+
+    directory = args.dir or tempfile.mkdtemp()
+    os.makedirs(directory, exist_ok=True)
+    chunk_size = int(args.chunk_mb * (1 << 20))
+    print("%10s %-8s %10s %10s %10s %12s %10s %10s" % ('triangles', 'layout', 'vertices', 'obj MB', 'convert s',
+                                                       'peak MB', 'mesh MB', 'read s'))
+    for count, layout in [(count, layout) for count in args.triangles for layout in args.layouts]:
+        name = 'grid%d_%s' % (count, layout.replace('/', '_'))
+        obj_path = os.path.join(directory, name + '.obj')
+        mesh_path = os.path.join(directory, name + '.mesh')
+        triangles = write_grid(obj_path, count, layout)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        mesh_loader.convert(obj_path, mesh_path, chunk_size)
+        convert_seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        mesh = mesh_loader.read(mesh_path)
+        # memmap читает с диска только при обращении, поэтому проходим по всем данным
+        checksum = float(mesh.vertex_data[:, :3].sum()) + int(mesh.indices.max())
+        read_seconds = time.perf_counter() - start
+        # uv есть только с vt, цвет из нормали (0.5, 0.5, 1) - только с vn, иначе белый
+        uv_max = 1.0 if '/vt' in layout else 0.0
+        color = (0.5, 0.5, 1.0) if layout.endswith('vn') else (1.0, 1.0, 1.0)
+        if (len(mesh.indices) != triangles * 3 or not numpy.isfinite(checksum)
+                or mesh.vertex_data[:, 3:5].max() != uv_max or (mesh.vertex_data[:, 5:8] != color).any()):
+            raise RuntimeError("%s: unexpected mesh" % mesh_path)
+        print("%10d %-8s %10d %10.1f %10.3f %12.1f %10.1f %10.4f" % (
+            triangles, layout, len(mesh.vertex_data), os.path.getsize(obj_path) / float(1 << 20), convert_seconds,
+            peak / float(1 << 20), os.path.getsize(mesh_path) / float(1 << 20), read_seconds))
+        sys.stdout.flush()
+        del mesh
+        if not args.keep:
+            os.remove(obj_path)
+            os.remove(mesh_path)
+    if not args.keep and args.dir is None:
+        os.rmdir(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Замер очереди отрисовки (render_queue.RenderQueue) на сцене 6.cube-shader.py с N маленькими кубами
+
+Половина кубов с другой текстурой, в порядке сцены текстура меняется на каждом кубе. Режимы:
+    sorted    - очередь с сортировкой по программе, текстуре и глубине
+    unsorted  - очередь без сортировки (пропускаются только повторы подряд)
+    direct    - каждый куб своим render, все смены состояния выполняются
+Для режимов с очередью выводятся средние за кадр: установки состояния объектов (binds),
+выполненные и пропущенные вызовы OpenGL (state_changes, state_skipped).
+Время кадра - полный loop_step с glFinish, в миллисекундах.
+
+Запуск:
+    python bench_render_queue.py
+    python bench_render_queue.py --satellites 100 10000 --frames 10 --json queue.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy
+
+import headless
+from bench_labs import SimulatedClock, enter_lab, statistics, wait_textures
+
+
+LAB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '6.cube-shader.py')
+MODES = ('sorted', 'unsorted', 'direct')
+COUNTERS = ('binds', 'state_changes', 'state_skipped')
+
+
+def run(lab, satellites, mode, frames, warmup, size, backend):
+    """Запускает лабораторную и возвращает (времена кадров, средние счетчики очереди за кадр)"""
+    context = headless.OffscreenContext(backend)
+    controller = lab.Controller(size[0], size[1], frame_rate=0, context=context, retained=True,
+                                satellites=satellites, batching=mode != 'direct', sort=mode == 'sorted')
+    controller.init()
+    controller.clock = SimulatedClock(1000.0 / 60)
+    for _ in range(warmup):
+        controller.loop_step()
+    wait_textures(controller)
+    samples = numpy.zeros(frames)
+    totals = dict((name, 0) for name in COUNTERS)
+    for i in range(frames):
+        start = time.perf_counter()
+        controller.loop_step()
+        samples[i] = time.perf_counter() - start
+        if controller.queue is not None:
+            for name, value in controller.queue.counters().items():
+                if name in totals:
+                    totals[name] += value
+    controller.texture_loader.shutdown()
+    context.destroy()
+    if controller.queue is None:
+        return samples, None
+    return samples, dict((name, total / float(frames)) for name, total in totals.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--satellites', type=lambda x: int(float(x)), nargs='*', default=[100, 1000, 5000],
+                        help='количества маленьких кубов')
+    parser.add_argument('--modes', nargs='*', default=MODES, choices=MODES)
+    parser.add_argument('--frames', type=int, default=20, help='количество замеряемых кадров')
+    parser.add_argument('--warmup', type=int, default=3, help='кадров прогрева перед замером')
+    parser.add_argument('--size', type=headless.parse_size, default=(320, 240), help='размер кадра')
+    parser.add_argument('--backend', default='egl', choices=headless.BACKENDS)
+    parser.add_argument('--json', help='сохранить результаты в JSON')
+    args = parser.parse_args(argv)
+
+    # контекст без окна: OpenGL должен импортироваться уже для выбранной платформы
+    headless.select_backend(args.backend)
+    lab = enter_lab(LAB, args)
+
+    results = []
+    print("%10s %-9s %10s %10s %10s %14s %14s" % ('satellites', 'mode', 'mean', 'p95', 'binds', 'state_changes',
+                                                  'state_skipped'))
+    for satellites in args.satellites:
+        for mode in args.modes:
+            samples, counters = run(lab, satellites, mode, args.frames, args.warmup, args.size, args.backend)
+            stats = statistics(samples)
+            if counters is None:
+                print("%10d %-9s %10.3f %10.3f %10s %14s %14s" % (satellites, mode, stats['mean'], stats['p95'],
+                                                                  '-', '-', '-'))
+            else:
+                print("%10d %-9s %10.3f %10.3f %10.0f %14.0f %14.0f" % (satellites, mode, stats['mean'], stats['p95'],
+                                                                        counters['binds'], counters['state_changes'],
+                                                                        counters['state_skipped']))
+            sys.stdout.flush()
+            results.append(dict(stats, satellites=satellites, mode=mode, counters=counters))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'size': list(args.size), 'frames': args.frames, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
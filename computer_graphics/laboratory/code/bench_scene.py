@@ -0,0 +1,108 @@
+"""
+Стоимость пересчета мировых матриц графа сцены (scene.Scene) за кадр
+
+Строится дерево из N узлов (branching детей у каждого узла), после чего каждый кадр меняется:
+    root     - поворот одного корня (пересчитывается все его поддерево)
+    leaves   - перенос доли --fraction случайных узлов
+    all      - все узлы
+    none     - ничего (update только проверяет пометки)
+Для сравнения recursive - обход дерева в Python с умножением матриц на каждом узле,
+как если бы каждый объект хранил свою матрицу (только для N <= --recursive-max).
+OpenGL не нужен.
+
+Запуск:
+    python bench_scene.py
+    python bench_scene.py --nodes 1000 100000 --frames 20
+"""
+
+import argparse
+import time
+
+import numpy
+
+from scene import Scene
+
+
+def build(count, branching):
+    """Дерево из count узлов: узел i - ребенок узла (i - 1) // branching"""
+    scene = Scene(count)
+    nodes = scene.add_many(1)
+    parents = [nodes[0]]
+    while len(scene) < count:
+        children = []
+        for parent in parents:
+            size = min(branching, count - len(scene))
+            if size <= 0:
+                break
+            offsets = numpy.zeros((size, 3), numpy.float32)
+            offsets[:, 0] = numpy.arange(size)
+            children.extend(scene.add_many(size, parent, offsets, scales=0.9))
+        parents = children
+    scene.update()
+    return scene
+
+
+def recursive(scene):
+    """Пересчет всех мировых матриц обходом в глубину, без уровней и векторизации"""
+    children = [[] for _ in range(len(scene))]
+    roots = []
+    for index, parent in enumerate(scene.parents[:len(scene)].tolist()):
+        (roots if parent < 0 else children[parent]).append(index)
+    stack = [(root, numpy.identity(4, numpy.float32)) for root in roots]
+    while stack:
+        index, parent_world = stack.pop()
+        world = parent_world @ scene.locals[index]
+        scene.worlds[index] = world
+        stack.extend((child, world) for child in children[index])
+
+
+def run(scene, mode, frames, fraction, rng):
+    """Среднее время update в секундах и среднее количество пересчитанных матриц"""
+    total = 0.0
+    updated = 0
+    count = len(scene)
+    for frame in range(frames):
+        if mode == 'root':
+            scene.mark_dirty([0])
+        elif mode == 'leaves':
+            indices = rng.choice(count, max(int(count * fraction), 1), replace=False)
+            scene.translations[indices, 1] = frame
+            scene.mark_dirty(indices)
+        elif mode == 'all':
+            scene.mark_dirty(slice(0, count))
+        start = time.perf_counter()
+        if mode == 'recursive':
+            recursive(scene)
+        else:
+            scene.update()
+        total += time.perf_counter() - start
+        updated += count if mode == 'recursive' else scene.updated
+    return total / frames, updated / float(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=lambda x: int(float(x)), nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--branching', type=int, default=8, help='детей у каждого узла')
+    parser.add_argument('--fraction', type=float, default=0.01, help='доля узлов, меняющихся за кадр в режиме leaves')
+    parser.add_argument('--frames', type=int, default=20, help='количество кадров')
+    parser.add_argument('--recursive-max', type=int, default=10000, help='наибольшее N для режима recursive')
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(0)
+    for count in args.nodes:
+        scene = build(count, args.branching)
+        modes = ['none', 'leaves', 'root', 'all']
+        if count <= args.recursive_max:
+            modes.append('recursive')
+            # уровни и обход в глубину должны давать одинаковые матрицы
+            reference = scene.worlds[:count].copy()
+            recursive(scene)
+            print("%8s nodes  same as recursive: %s" % (count, numpy.allclose(scene.worlds[:count], reference, atol=1e-4)))
+        for mode in modes:
+            seconds, updated = run(scene, mode, args.frames, args.fraction, rng)
+            print("%8s nodes  %-9s %9.3f ms  %9.0f matrices/frame" % (count, mode, seconds * 1000, updated))
+
+
+if __name__ == '__main__':
+    main()
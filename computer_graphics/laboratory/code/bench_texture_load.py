@@ -0,0 +1,85 @@
+"""
+Сравнение скорости и пиковой памяти загрузки текстуры:
+старый способ numpy.array(list(img.getdata())) против textures.image_to_array
+
+Запуск:
+    python bench_texture_load.py                 # синтетическое изображение 4096x4096
+    python bench_texture_load.py wall.jpg        # конкретный файл
+    python bench_texture_load.py --size 2048 --mode RGBA
+OpenGL контекст не нужен, сравнивается только подготовка данных.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+try:
+    import PIL.Image as Image
+except ImportError as err:
+    import Image
+import numpy
+
+import textures
+
+
+def load_list(img):
+    """Старый способ из TextureHelper.load"""
+    return numpy.array(list(img.getdata()), numpy.uint8)
+
+
+def load_array(img):
+    """Новый способ"""
+    return textures.image_to_array(img)
+
+
+def measure(func, img, repeat):
+    """Возвращает лучшее время в секундах и пиковую память в байтах"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(img)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    func(img)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def make_image(size, mode):
+    """Синтетическое изображение со случайным шумом"""
+    channels = len(Image.new(mode, (1, 1)).getbands())
+    data = numpy.random.randint(0, 256, (size, size, channels), numpy.uint8)
+    if channels == 1:
+        data = data[:, :, 0]
+    img = Image.fromarray(data)
+    return img if img.mode == mode else img.convert(mode)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('filename', nargs='?', help='файл изображения (по умолчанию синтетическое)')
+    parser.add_argument('--size', type=int, default=4096, help='размер синтетического изображения')
+    parser.add_argument('--mode', default='RGB', help='режим синтетического изображения: RGB, RGBA, L, P')
+    parser.add_argument('--repeat', type=int, default=3, help='количество повторов замера времени')
+    args = parser.parse_args()
+
+    if args.filename:
+        img = Image.open(args.filename)
+        img.load()
+    else:
+        img = make_image(args.size, args.mode)
+    print("image: %sx%s %s" % (img.size[0], img.size[1], img.mode))
+
+    results = {}
+    for name, func in (('list(getdata)', load_list), ('image_to_array', load_array)):
+        results[name] = measure(func, img, args.repeat)
+        print("%-16s time: %8.3f s  peak memory: %8.1f MB" % (name, results[name][0], results[name][1] / 2.0 ** 20))
+
+    old, new = results['list(getdata)'], results['image_to_array']
+    print("speedup: %.1fx, memory: %.1fx less" % (old[0] / max(new[0], 1e-9), old[1] / max(new[1], 1)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Вспомогательный модуль для хранения геометрии в буферах OpenGL (retained mode)
+
+Вместо glBegin|glEnd, где на каждую вершину уходит несколько вызовов через ctypes,
+геометрия один раз упаковывается в массивы numpy, загружается в вершинный (VBO)
+и индексный (IBO) буферы и рисуется одним вызовом glDrawElements.
+
+Формат вершины (interleaved, float32):
+    x, y, z, u, v, r, g, b
+"""
+
+import ctypes
+
+from OpenGL.GL import *
+
+import numpy
+
+
+def pack_faces(verticies, faces, uvs=None, colors=None):
+    """Упаковывает вершины, полигоны, uv и цвета полигонов в массивы для буферов
+
+    Каждый угол полигона становится отдельной вершиной (у углов разные uv и цвета),
+    полигоны разбиваются на треугольники веером.
+    Возвращает массив вершин (N, 8) float32 и массив индексов uint32.
+    """
+    verticies = numpy.asarray(verticies, numpy.float32)
+    faces = numpy.asarray(faces, numpy.intp)
+    count, corners = faces.shape
+
+    vertex_data = numpy.zeros((count * corners, MeshBuffer.COMPONENTS), numpy.float32)
+    vertex_data[:, 0:3] = verticies[faces.reshape(-1)]
+    if uvs is not None:
+        vertex_data[:, 3:5] = numpy.asarray(uvs, numpy.float32).reshape(-1, 2)
+    if colors is not None:
+        vertex_data[:, 5:8] = numpy.repeat(numpy.asarray(colors, numpy.float32), corners, axis=0)
+
+    # веер треугольников (0, i, i + 1) для каждого полигона
+    fan = numpy.array([(0, i, i + 1) for i in range(1, corners - 1)], numpy.uint32)
+    offsets = numpy.arange(count, dtype=numpy.uint32) * corners
+    indices = (offsets[:, None, None] + fan[None]).reshape(-1)
+    return vertex_data, indices
+
+
+class MeshBuffer(object):
+    """Геометрия в VBO + IBO, рисуется одним вызовом glDrawElements"""
+
+    COMPONENTS = 8  # x, y, z, u, v, r, g, b
+    STRIDE = COMPONENTS * 4  # размер вершины в байтах
+    POSITION_OFFSET = 0
+    UV_OFFSET = 3 * 4
+    COLOR_OFFSET = 5 * 4
+
+    def __init__(self, vertex_data, indices):
+        self.vertex_data = numpy.ascontiguousarray(vertex_data, numpy.float32)
+        self.indices = numpy.ascontiguousarray(indices, numpy.uint32)
+        self.count = len(self.indices)
+        self.vbo = None
+        self.ibo = None
+
+    @classmethod
+    def from_faces(cls, verticies, faces, uvs=None, colors=None):
+        """Создает буфер по тем же массивам, что используются в Cube"""
+        return cls(*pack_faces(verticies, faces, uvs, colors))
+
+    def upload(self):
+        """Загружаем данные в память OpenGL (GPU), вызывается один раз"""
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, self.vertex_data.nbytes, self.vertex_data, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self.ibo = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, self.indices.nbytes, self.indices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        return self
+
+    def render(self, uv=True, color=False):
+        """Рисуем через фиксированный конвейер (glVertexPointer и т.д.)"""
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, self.STRIDE, ctypes.c_void_p(self.POSITION_OFFSET))
+        if uv:
+            glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+            glTexCoordPointer(2, GL_FLOAT, self.STRIDE, ctypes.c_void_p(self.UV_OFFSET))
+        if color:
+            glEnableClientState(GL_COLOR_ARRAY)
+            glColorPointer(3, GL_FLOAT, self.STRIDE, ctypes.c_void_p(self.COLOR_OFFSET))
+
+        self.draw()
+
+        if color:
+            glDisableClientState(GL_COLOR_ARRAY)
+        if uv:
+            glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def render_attribs(self, position_loc, uv_loc=-1, color_loc=-1, instances=None):
+        """Рисуем с передачей данных в атрибуты шейдера (glVertexAttribPointer)
+
+        Если атрибут в шейдере не найден (location == -1), он пропускается.
+        instances - количество экземпляров для glDrawElementsInstanced (см. instancing)
+        """
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        enabled = []
+        for loc, size, offset in ((position_loc, 3, self.POSITION_OFFSET),
+                                  (uv_loc, 2, self.UV_OFFSET),
+                                  (color_loc, 3, self.COLOR_OFFSET)):
+            if loc < 0:
+                continue
+            glEnableVertexAttribArray(loc)
+            glVertexAttribPointer(loc, size, GL_FLOAT, GL_FALSE, self.STRIDE, ctypes.c_void_p(offset))
+            enabled.append(loc)
+
+        self.draw(instances)
+
+        for loc in enabled:
+            glDisableVertexAttribArray(loc)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self, instances=None):
+        """Один вызов отрисовки для всей геометрии (или для instances ее копий)"""
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        if instances is None:
+            glDrawElements(GL_TRIANGLES, self.count, GL_UNSIGNED_INT, None)
+        else:
+            glDrawElementsInstanced(GL_TRIANGLES, self.count, GL_UNSIGNED_INT, None, instances)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def delete(self):
+        """Освобождаем буферы"""
+        if self.vbo is not None:
+            glDeleteBuffers(2, [self.vbo, self.ibo])
+            self.vbo = self.ibo = None
@@ -0,0 +1,403 @@
+"""
+Орбитальная камера, общая для лабораторных 5 и 6
+
+Матрицы проекции и вида считаются на CPU (transforms), без gluPerspective|gluLookAt:
+в шейдер они передаются как uniform, в фиксированный конвейер - через glLoadMatrixf.
+Проекция пересчитывается только при изменении размера окна или параметров камеры,
+положение и вид - только после движения мыши: если ничего не менялось, update ничего не считает.
+CameraInertial вращается с инерцией: скорость набирается от мыши и затухает с фиксированным шагом,
+независимо от частоты кадров.
+
+Параметры камеры хранятся не в словаре, а в одном непрерывном массиве float64 (STATE_SIZE чисел,
+индексы полей ниже). Состояние легко сохранить в байты и восстановить (запись и повтор пролета
+камеры), а у CameraGroup состояния всех камер лежат в одном массиве (N, STATE_SIZE)
+и обновляются одним векторным вызовом.
+"""
+
+import math
+
+import pygame
+from pygame.locals import *
+
+from OpenGL.GL import *
+
+import numpy
+
+import transforms
+
+
+# поля состояния камеры (индексы в массиве float64)
+POS = slice(0, 3)
+TARGET = slice(3, 6)
+UP = slice(6, 9)
+FOV = 9
+NEAR = 10
+FAR = 11
+R = 12
+THETA = 13
+PHI = 14
+ASPECT = 15
+STATE_SIZE = 16
+
+
+def new_states(count=None):
+    """Пустое состояние одной камеры (STATE_SIZE,) или count камер (count, STATE_SIZE)"""
+    return numpy.zeros(STATE_SIZE if count is None else (count, STATE_SIZE), numpy.float64)
+
+
+def update_states(states):
+    """Векторно пересчитывает положения (на месте) и возвращает матрицы вида и проекции (N, 4, 4)"""
+    r, theta, phi = states[:, R], states[:, THETA], states[:, PHI]
+    sin_theta = numpy.sin(theta)
+    states[:, 0] = r * sin_theta * numpy.cos(phi)
+    states[:, 1] = r * sin_theta * numpy.sin(phi)
+    states[:, 2] = r * numpy.cos(theta)
+    views = transforms.look_at_batch(states[:, POS], states[:, TARGET], states[:, UP])
+    projections = transforms.perspective_batch(states[:, FOV], states[:, ASPECT], states[:, NEAR], states[:, FAR])
+    return views, projections
+
+
+class CameraOrbit(object):
+    """Камера для вращения по сфере вокруг центра модели|сцены"""
+
+    __slots__ = ('w', 'h', 'radius_min', 'radius_max', 'move_button', 'speed', 'mouse_states', 'mouse_coords',
+                 'state', 'projection', 'view', 'projection_dirty', 'dirty', 'updates', 'cache_hits')
+
+    def __init__(self, w, h, radius_min=4, radius_max=20, move_button=1, speed=0.01, state=None):
+        """state - массив (STATE_SIZE,) для хранения параметров, например строка массива CameraGroup"""
+        self.w = w
+        self.h = h
+        self.radius_min = radius_min
+        self.radius_max = radius_max
+        self.move_button = move_button  # по умолчанию используем правую клавишу мыши
+        self.speed = speed  # фактор скорости изменения
+        self.mouse_states = {self.move_button: 0}  # состояние нажатия клавиши
+        self.mouse_coords = {self.move_button: (0, 0)}  # координаты нажатия клавиши мыши
+        self.state = new_states() if state is None else state
+        self.state[ASPECT] = w / h
+        self.projection = transforms.identity()
+        self.view = transforms.identity()
+        self.projection_dirty = True  # проекцию нужно пересчитать
+        self.dirty = True  # положение и вид нужно пересчитать
+        self.updates = 0  # сколько раз матрицы пересчитывались
+        self.cache_hits = 0  # сколько раз update обошелся без пересчета
+
+    def init(self, pos=(0, 0, -5), target=(0, 0, 0), fov=45, near=0.1, far=50.0, up=(0, 0, 1)):
+        """Задаем все необходимые начальные параметры камеры"""
+        state = self.state
+        state[POS] = pos
+        state[TARGET] = target
+        state[UP] = up
+        state[FOV] = fov
+        state[NEAR] = near
+        state[FAR] = far
+        state[R] = math.sqrt(numpy.dot(pos, pos))
+        state[THETA] = math.acos(pos[2] / state[R])
+        if pos[0] != 0:
+            state[PHI] = math.atan(pos[1] / pos[0])
+        else:
+            state[PHI] = 0
+        self.projection_dirty = True
+        self.dirty = True
+
+    @property
+    def pos(self):
+        return self.state[POS]
+
+    def to_bytes(self):
+        """Состояние камеры в байтах (STATE_SIZE чисел float64), например для записи пролета"""
+        return self.state.tobytes()
+
+    def from_bytes(self, data):
+        """Восстанавливает состояние, сохраненное to_bytes"""
+        self.state[:] = numpy.frombuffer(data, numpy.float64, STATE_SIZE)
+        self.projection_dirty = True
+        self.dirty = True
+
+    def resize(self, w, h):
+        """Размер окна изменился: проекцию нужно пересчитать"""
+        self.w = w
+        self.h = h
+        self.state[ASPECT] = w / h
+        self.projection_dirty = True
+        self.dirty = True
+
+    def set_lens(self, fov=None, near=None, far=None):
+        """Меняем параметры проекции"""
+        if fov is not None:
+            self.state[FOV] = fov
+        if near is not None:
+            self.state[NEAR] = near
+        if far is not None:
+            self.state[FAR] = far
+        self.projection_dirty = True
+        self.dirty = True
+
+    def update(self):
+        """Обновляем положение камеры и ее матрицы
+
+        Возвращает True, если матрицы изменились, и False, если использованы прежние.
+        """
+        if not self.dirty:
+            self.cache_hits += 1
+            return False
+        state = self.state
+        r, theta, phi = float(state[R]), float(state[THETA]), float(state[PHI])
+        state[0] = r * math.sin(theta) * math.cos(phi)
+        state[1] = r * math.sin(theta) * math.sin(phi)
+        state[2] = r * math.cos(theta)
+        if self.projection_dirty:
+            self.projection = transforms.perspective(state[FOV], state[ASPECT], state[NEAR], state[FAR])
+            self.projection_dirty = False
+        self.view = transforms.look_at(state[POS], state[TARGET], state[UP])
+        self.dirty = False
+        self.updates += 1
+        return True
+
+    def advance(self, dt):
+        """Шаг симуляции камеры на dt секунд, у обычной камеры движения нет"""
+        pass
+
+    def load_matrices(self):
+        """Для фиксированного конвейера: загружаем проекцию и вид в GL_PROJECTION, как раньше gluPerspective|gluLookAt"""
+        glMatrixMode(GL_PROJECTION)
+        # OpenGL хранит матрицы по столбцам, поэтому транспонируем
+        glLoadMatrixf((self.projection @ self.view).T)
+
+    def subscribe(self, dispatcher):
+        """Подписываемся в events.Dispatcher только на нужные события мыши"""
+        dispatcher.subscribe(MOUSEBUTTONDOWN, self.press, self.move_button)
+        dispatcher.subscribe(MOUSEBUTTONUP, self.release, self.move_button)
+        dispatcher.subscribe(MOUSEMOTION, self.motion)
+
+    def event(self, e):
+        """Обрабатываем нажатия клавиш мыши (без Dispatcher)"""
+        if (e.type == MOUSEBUTTONDOWN and e.button == self.move_button):
+            self.press(e)
+        elif (e.type == MOUSEBUTTONUP and e.button == self.move_button):
+            self.release(e)
+        elif e.type == MOUSEMOTION:
+            self.motion(e)
+
+    def press(self, e):
+        # если нажали на левую клавишу мыши, то запоминаем координаты и состояние нажатия
+        self.mouse_coords[e.button] = e.pos
+        self.mouse_states[e.button] = 1
+
+    def release(self, e):
+        # если отпустили левую клавишу мыши, то сбрасываем координаты и состояние
+        self.mouse_coords[e.button] = (0, 0)
+        self.mouse_states[e.button] = 0
+
+    def motion(self, e):
+        if self.mouse_states[self.move_button]:
+            # при движение мыши и при зажатой левой кнопке мыши вращаем камеру
+            self.mouse_move(*e.pos)
+
+    def mouse_move(self, x, y):
+        """Меняем параметры камеры в зависимости от положения мыши"""
+        # считываем модификаторы, например ctrl
+        mod = pygame.key.get_mods()
+        # вычисляем сдвих между текущими координатми и теми что были при нажатии
+        dx = self.mouse_coords[self.move_button][0] - x
+        dy = self.mouse_coords[self.move_button][1] - y
+        # обновляем координаты
+        self.mouse_coords[self.move_button] = (x, y)
+        if dx == 0 and dy == 0:
+            return
+        self.dirty = True
+        state = self.state
+        # если зажат CRTL, то меняем радиус (приближаем/удаляем)
+        if mod & KMOD_LCTRL:
+            state[R] = min(max(state[R] + self.speed * dy, self.radius_min), self.radius_max)
+        else:
+            # иначе меняем углы, на полюсах сферы направление "вверх" вырождается
+            state[PHI] += self.speed * dx
+            state[THETA] = min(max(state[THETA] + self.speed * dy, 1e-5), math.pi - 1e-5)
+
+
+class CameraInertial(CameraOrbit):
+    """Орбитальная камера с инерцией
+
+    Движения мыши не поворачивают камеру сразу, а добавляют угловую скорость (и скорость
+    приближения с CTRL), которая затухает со временем. Физика считается фиксированными шагами
+    step секунд (накопитель времени), а между двумя последними шагами положение интерполируется,
+    поэтому движение одинаково плавное и при 30, и при 240 FPS.
+
+    Ввод применяется только на границах шагов, а затухание за шаг - заранее посчитанная
+    константа, так что при одинаковом начальном состоянии (to_bytes сохраняет и скорость, и номер
+    шага) и одинаковом журнале ввода (record=True, log) результат совпадает побитово: см. replay.
+    Снимок можно делать в любой момент, не только сразу после init.
+    follow - вращать камеру простым перемещением мыши, без нажатия клавиши.
+    """
+
+    __slots__ = ('step', 'damping', 'decay', 'max_steps', 'follow', 'velocity', 'impulse', 'physics', 'previous',
+                 'accumulator', 'steps', 'record', 'log')
+
+    def __init__(self, w, h, step=1.0 / 120, damping=4.0, max_steps=8, follow=False, record=False, **kwargs):
+        super(CameraInertial, self).__init__(w, h, **kwargs)
+        self.step = step
+        self.damping = damping  # доля скорости, теряемая за секунду: v *= exp(-damping * t)
+        self.decay = math.exp(-damping * step)
+        self.max_steps = max_steps  # после долгого кадра не догоняем время бесконечно
+        self.follow = follow
+        self.velocity = numpy.zeros(3)  # скорости r, theta, phi в секунду
+        self.impulse = numpy.zeros(3)  # ввод, накопленный до следующего шага
+        self.physics = numpy.zeros(3)  # r, theta, phi после последнего шага
+        self.previous = numpy.zeros(3)  # r, theta, phi после предпоследнего шага
+        self.accumulator = 0.0
+        self.steps = 0
+        self.record = record
+        self.log = []  # (номер шага, dr, dtheta, dphi)
+
+    def init(self, *args, **kwargs):
+        super(CameraInertial, self).init(*args, **kwargs)
+        self.physics[:] = self.state[R:PHI + 1]
+        self.previous[:] = self.physics
+        self.velocity[:] = 0
+        self.impulse[:] = 0
+        self.accumulator = 0.0
+
+    def to_bytes(self):
+        """Состояние камеры (STATE_SIZE чисел float64), затем physics, previous, velocity, accumulator и steps"""
+        physics = numpy.concatenate((self.physics, self.previous, self.velocity, (self.accumulator, self.steps)))
+        return self.state.tobytes() + physics.tobytes()
+
+    def from_bytes(self, data):
+        """Восстанавливает состояние to_bytes; состояние CameraOrbit.to_bytes - камера в покое с шага 0"""
+        super(CameraInertial, self).from_bytes(data)
+        offset = STATE_SIZE * numpy.dtype(numpy.float64).itemsize
+        if len(data) > offset:
+            physics = numpy.frombuffer(data, numpy.float64, 11, offset)
+            self.physics[:], self.previous[:], self.velocity[:] = physics[0:3], physics[3:6], physics[6:9]
+            self.accumulator = float(physics[9])
+            self.steps = int(physics[10])
+        else:
+            self.physics[:] = self.state[R:PHI + 1]
+            self.previous[:] = self.physics
+            self.velocity[:] = 0
+            self.accumulator = 0.0
+            self.steps = 0
+
+    def motion(self, e):
+        if self.follow:
+            # без нажатия клавиши: направление как при перетаскивании
+            self.impulse_move(-e.rel[0], -e.rel[1])
+        else:
+            super(CameraInertial, self).motion(e)
+
+    def mouse_move(self, x, y):
+        dx = self.mouse_coords[self.move_button][0] - x
+        dy = self.mouse_coords[self.move_button][1] - y
+        self.mouse_coords[self.move_button] = (x, y)
+        if dx or dy:
+            self.impulse_move(dx, dy)
+
+    def impulse_move(self, dx, dy):
+        """Добавляем скорость от сдвига мыши, применится на ближайшем шаге"""
+        if pygame.key.get_mods() & KMOD_LCTRL:
+            self.impulse[0] += self.speed * dy
+        else:
+            self.impulse[1] += self.speed * dy
+            self.impulse[2] += self.speed * dx
+
+    def integrate(self):
+        """Один шаг физики длиной step"""
+        if self.impulse.any():
+            if self.record:
+                self.log.append((self.steps,) + tuple(self.impulse))
+            # сдвиг мыши переводим в скорость, которая за время затухания даст тот же поворот
+            self.velocity += self.impulse * self.damping
+            self.impulse[:] = 0
+        self.previous[:] = self.physics
+        self.physics += self.velocity * self.step
+        self.velocity *= self.decay
+        r, theta = self.physics[0], self.physics[1]
+        self.physics[0] = min(max(r, self.radius_min), self.radius_max)
+        self.physics[1] = min(max(theta, 1e-5), math.pi - 1e-5)
+        if self.physics[0] != r:
+            self.velocity[0] = 0
+        if self.physics[1] != theta:
+            self.velocity[1] = 0
+        self.steps += 1
+
+    def advance(self, dt):
+        """Продвигает физику на dt секунд целыми шагами и интерполирует положение камеры"""
+        self.accumulator += dt
+        steps = 0
+        while self.accumulator >= self.step:
+            if steps == self.max_steps:
+                self.accumulator = 0.0
+                break
+            self.integrate()
+            self.accumulator -= self.step
+            steps += 1
+        alpha = self.accumulator / self.step
+        current = self.previous + (self.physics - self.previous) * alpha
+        if not numpy.array_equal(current, self.state[R:PHI + 1]):
+            self.state[R:PHI + 1] = current
+            self.dirty = True
+
+    def replay(self, data, log, steps):
+        """Восстанавливает состояние data (to_bytes) и проигрывает журнал ввода на steps шагов
+
+        В журнале номера шагов абсолютные, как и сохраненный в data номер шага, поэтому записи
+        до снимка пропускаются, а остальные применяются на тех же шагах, что и при записи.
+        """
+        self.from_bytes(data)
+        # ввод, накопленный к моменту снимка, попал в журнал на ближайшем шаге
+        self.impulse[:] = 0
+        record, self.record = self.record, False
+        events = iter(log)
+        event = next(events, None)
+        while event is not None and event[0] < self.steps:
+            event = next(events, None)
+        for _ in range(steps):
+            while event is not None and event[0] == self.steps:
+                self.impulse += event[1:]
+                event = next(events, None)
+            self.integrate()
+        self.record = record
+        self.state[R:PHI + 1] = self.physics
+        self.dirty = True
+
+
+class CameraGroup(object):
+    """Несколько камер (разделенный экран, камеры теней) с состояниями в одном массиве"""
+
+    def __init__(self, count, w, h, **kwargs):
+        self.states = new_states(count)
+        self.cameras = [CameraOrbit(w, h, state=self.states[i], **kwargs) for i in range(count)]
+
+    def __getitem__(self, i):
+        return self.cameras[i]
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def to_bytes(self):
+        return self.states.tobytes()
+
+    def from_bytes(self, data):
+        self.states[:] = numpy.frombuffer(data, numpy.float64).reshape(self.states.shape)
+        for camera in self.cameras:
+            camera.projection_dirty = camera.dirty = True
+
+    def update(self):
+        """Пересчитывает все изменившиеся камеры одним векторным вызовом, возвращает их количество"""
+        dirty = [i for i, camera in enumerate(self.cameras) if camera.dirty]
+        for camera in self.cameras:
+            if not camera.dirty:
+                camera.cache_hits += 1
+        if not dirty:
+            return 0
+        states = self.states[dirty]
+        views, projections = update_states(states)
+        self.states[dirty] = states
+        for j, i in enumerate(dirty):
+            camera = self.cameras[i]
+            camera.view = views[j]
+            camera.projection = projections[j]
+            camera.projection_dirty = camera.dirty = False
+            camera.updates += 1
+        return len(dirty)
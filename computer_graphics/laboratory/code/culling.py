@@ -0,0 +1,204 @@
+"""
+Отсечение по пирамиде видимости (frustum culling) с иерархией ограничивающих объемов (BVH)
+
+Плоскости пирамиды видимости берутся из матрицы projection @ view (метод Gribb-Hartmann).
+Объекты описываются выровненными по осям коробками (AABB). BVH строится без рекурсии:
+объекты сортируются по коду Мортона центра (близкие в пространстве оказываются рядом),
+по leaf_size подряд идущих объектов образуют лист, а уровни выше получаются попарным
+объединением соседних узлов - полное двоичное дерево в массивах numpy, по массиву на уровень.
+Когда объекты двигаются, порядок сохраняется и пересчитываются только коробки (refit).
+
+Запрос идет по уровням от корня: все узлы уровня проверяются одним векторным вызовом.
+Узел вне пирамиды отбрасывается целиком, узел полностью внутри принимается целиком
+без проверки потомков, остальные узлы передают проверку детям; в частично видимых листьях
+проверяется каждый объект.
+"""
+
+import numpy
+
+
+def frustum_planes(matrix):
+    """Шесть плоскостей (a, b, c, d) из матрицы projection @ view, нормали смотрят внутрь"""
+    m = numpy.asarray(matrix, numpy.float64)
+    planes = numpy.array((m[3] + m[0], m[3] - m[0], m[3] + m[1], m[3] - m[1], m[3] + m[2], m[3] - m[2]))
+    return planes / numpy.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+
+
+def transform_boxes(mins, maxs, matrices):
+    """Коробки (N, 3) в локальных координатах -> коробки в мировых после матриц (N, 4, 4)"""
+    centers = (mins + maxs) * 0.5
+    extents = (maxs - mins) * 0.5
+    rotation = matrices[:, :3, :3]
+    # центр поворачивается и переносится, полуразмеры - через модули элементов матрицы
+    centers = numpy.einsum('nij,nj->ni', rotation, centers) + matrices[:, :3, 3]
+    extents = numpy.einsum('nij,nj->ni', numpy.abs(rotation), extents)
+    return centers - extents, centers + extents
+
+
+def classify(mins, maxs, planes):
+    """Для коробок (N, 3): (вне пирамиды, полностью внутри) - два массива bool длины N"""
+    planes = numpy.asarray(planes, mins.dtype)
+    normals, d = planes[:, :3], planes[:, 3]
+    # пустые коробки (от +inf до -inf) дают nan, сравнения ниже считают их невидимыми
+    with numpy.errstate(invalid='ignore'):
+        # расстояние от центра до плоскости и проекция полуразмеров коробки на нормаль
+        center = ((mins + maxs) * 0.5) @ normals.T + d
+        radius = ((maxs - mins) * 0.5) @ numpy.abs(normals).T
+        # вся коробка за какой-то плоскостью - вне пирамиды, перед всеми плоскостями - внутри
+        outside = ~(center + radius >= 0).all(1)
+        inside = (center - radius >= 0).all(1)
+    return outside, inside
+
+
+def morton_codes(points):
+    """30-битные коды Мортона точек (N, 3), по 10 бит на ось"""
+    lo, hi = points.min(0), points.max(0)
+    q = ((points - lo) / numpy.maximum(hi - lo, 1e-9) * 1023).astype(numpy.uint32)
+    # раздвигаем биты: между соседними битами оси остается место для двух других осей
+    q = (q | (q << 16)) & 0x030000FF
+    q = (q | (q << 8)) & 0x0300F00F
+    q = (q | (q << 4)) & 0x030C30C3
+    q = (q | (q << 2)) & 0x09249249
+    return q[:, 0] | (q[:, 1] << 1) | (q[:, 2] << 2)
+
+
+class BVH(object):
+    """Двоичное дерево коробок в массивах: levels_min[0] - корень, levels_min[-1] - листья"""
+
+    def __init__(self, leaf_size=8):
+        self.leaf_size = leaf_size
+        self.count = 0
+        self.order = numpy.zeros(0, numpy.intp)  # индексы объектов в порядке листьев
+        self.levels_min = []
+        self.levels_max = []
+        self.object_min = None  # коробки объектов в порядке order, дополненные пустыми
+        self.object_max = None
+        self.tested = 0  # проверок узлов и объектов при последнем запросе
+
+    def build(self, mins, maxs):
+        """Строит дерево: сортировка по кодам Мортона и расчет коробок всех уровней"""
+        self.count = len(mins)
+        if self.count:
+            self.order = numpy.argsort(morton_codes((mins + maxs) * 0.5), kind='stable')
+        else:
+            self.order = numpy.zeros(0, numpy.intp)
+        leaves = max(-(-self.count // self.leaf_size), 1)
+        size = 1 << (leaves - 1).bit_length()  # листьев до степени двойки
+        # пустые места: коробка от +inf до -inf не видна и не расширяет родителя
+        self.object_min = numpy.full((size * self.leaf_size, 3), numpy.inf, numpy.float32)
+        self.object_max = numpy.full((size * self.leaf_size, 3), -numpy.inf, numpy.float32)
+        self.refit(mins, maxs)
+
+    def refit(self, mins, maxs):
+        """Пересчитывает коробки узлов после движения объектов, порядок объектов не меняется"""
+        numpy.take(numpy.asarray(mins, numpy.float32), self.order, 0, self.object_min[:self.count])
+        numpy.take(numpy.asarray(maxs, numpy.float32), self.order, 0, self.object_max[:self.count])
+        self.levels_min = self.reduce(self.object_min, numpy.minimum)
+        self.levels_max = self.reduce(self.object_max, numpy.maximum)
+
+    def reduce(self, boxes, function):
+        """Уровни дерева от корня к листьям: лист - по leaf_size объектов, выше - пары узлов"""
+        # соседние объекты листа лежат в строке (листья, leaf_size * 3), сравниваем столбцы по 3
+        rows = boxes.reshape(-1, self.leaf_size * 3)
+        level = rows[:, :3].copy()
+        for i in range(1, self.leaf_size):
+            function(level, rows[:, 3 * i:3 * i + 3], out=level)
+        levels = [level]
+        while len(level) > 1:
+            level = function(level[0::2], level[1::2])
+            levels.append(level)
+        levels.reverse()
+        return levels
+
+    def query(self, planes):
+        """Индексы объектов (по возрастанию), пересекающих пирамиду видимости"""
+        depth = len(self.levels_min)
+        leaf_size = self.leaf_size
+        # объекты принятых целиком узлов отмечаются разностным массивом: +1 в начале, -1 после конца
+        delta = numpy.zeros(len(self.object_min) + 1, numpy.int32)
+        visible = []
+        self.tested = 0
+        nodes = numpy.zeros(1, numpy.intp)
+        for level in range(depth):
+            if not len(nodes):
+                break
+            outside, inside = classify(self.levels_min[level][nodes], self.levels_max[level][nodes], planes)
+            self.tested += len(nodes)
+            span = leaf_size << (depth - 1 - level)  # объектов под узлом этого уровня
+            accepted = nodes[inside & ~outside]
+            numpy.add.at(delta, accepted * span, 1)
+            numpy.add.at(delta, (accepted + 1) * span, -1)
+            nodes = nodes[~inside & ~outside]
+            if level < depth - 1:
+                nodes = numpy.stack((nodes * 2, nodes * 2 + 1), 1).reshape(-1)
+        if len(nodes):
+            # частично видимые листья: проверяем каждый объект
+            objects = (nodes[:, None] * leaf_size + numpy.arange(leaf_size)).reshape(-1)
+            objects = objects[objects < self.count]
+            outside, inside = classify(self.object_min[objects], self.object_max[objects], planes)
+            self.tested += len(objects)
+            visible.append(objects[~outside])
+        accepted = numpy.flatnonzero(numpy.cumsum(delta[:-1])[:self.count] > 0)
+        visible.append(accepted)
+        return numpy.sort(self.order[numpy.concatenate(visible)])
+
+
+class SceneCuller(object):
+    """Отсечение объектов графа сцены (scene.Scene) с BVH по их мировым коробкам
+
+    Локальная коробка берется из атрибута bounds объекта (min, max), без него - куб [-1, 1].
+    Дерево перестраивается при изменении состава сцены и раз в rebuild_interval пересчетов,
+    в остальных кадрах с движением объектов только пересчитываются коробки (refit).
+    """
+
+    DEFAULT_BOUNDS = ((-1.0, -1.0, -1.0), (1.0, 1.0, 1.0))
+
+    def __init__(self, scene, leaf_size=8, rebuild_interval=120):
+        self.scene = scene
+        self.bvh = BVH(leaf_size)
+        self.rebuild_interval = rebuild_interval
+        self.nodes = None  # узлы сцены с объектами для отрисовки (объект BVH i - узел nodes[i])
+        self.local_min = None
+        self.local_max = None
+        self.structure = None  # версия состава сцены, для которой построено дерево
+        self.version = None  # версия матриц сцены, для которой посчитаны коробки
+        self.refits = 0
+        self.tested = 0
+        self.culled = 0
+        self.drawn = 0
+
+    def update(self):
+        """Перестраивает или пересчитывает дерево, если сцена изменилась"""
+        scene = self.scene
+        if self.structure != scene.structure_version:
+            self.nodes = scene.drawable_indices()
+            bounds = numpy.array([getattr(scene.drawables[i], 'bounds', self.DEFAULT_BOUNDS) for i in self.nodes.tolist()],
+                                 numpy.float32).reshape(-1, 2, 3)
+            self.local_min, self.local_max = bounds[:, 0], bounds[:, 1]
+            self.structure = scene.structure_version
+            self.version = None
+            self.refits = self.rebuild_interval
+        if self.version == scene.version:
+            return
+        mins, maxs = transform_boxes(self.local_min, self.local_max, scene.worlds[self.nodes])
+        if self.refits >= self.rebuild_interval:
+            # после многих refit коробки узлов разрастаются: объекты разлетаются от соседей по порядку
+            self.bvh.build(mins, maxs)
+            self.refits = 0
+        else:
+            self.bvh.refit(mins, maxs)
+            self.refits += 1
+        self.version = scene.version
+
+    def visible(self, view_projection):
+        """Индексы видимых узлов сцены для матрицы projection @ view"""
+        self.update()
+        visible = self.bvh.query(frustum_planes(view_projection))
+        self.tested = self.bvh.tested
+        self.drawn = len(visible)
+        self.culled = len(self.nodes) - self.drawn
+        return self.nodes[visible]
+
+    def counters(self):
+        """Статистика последнего отсечения для FrameStats|оверлея"""
+        return {'tested': self.tested, 'culled': self.culled, 'drawn': self.drawn}
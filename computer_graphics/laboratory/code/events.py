@@ -0,0 +1,227 @@
+"""
+Сбор событий pygame за кадр со слиянием движений мыши
+
+Мышь с высокой частотой опроса дает сотни MOUSEMOTION за кадр, и раньше каждое проходило
+через Controller.event, камеру и куб. EventBatch собирает события кадра в заранее созданные
+объекты Event (без выделения памяти на каждое событие), а подряд идущие движения мыши
+сливает в одно: последнее положение, суммарный сдвиг rel и количество слитых событий.
+Порядок событий сохраняется: нажатие клавиши между движениями разделяет их.
+
+    batch = EventBatch()
+    for event in batch.poll():
+        ...
+
+Dispatcher раздает события только подписанным обработчикам: обработчики хранятся в словаре
+по ключу (тип события, клавиша|кнопка мыши), поиск - один-два обращения к словарю вместо
+цепочки if/elif в каждом обработчике. Для клавиш удобнее именованные действия: действие
+регистрируется с привязками по умолчанию, привязки можно поменять во время работы (bind)
+и загрузить из файла JSON (load_bindings), например:
+    {"toggle_rotation": ["keyup:space"], "toggle_texture": ["keyup:t", "mousebuttonup:3"]}
+"""
+
+import json
+
+import pygame
+from pygame.locals import *
+
+
+class Event(object):
+    """Событие кадра с теми же полями, что у событий pygame, которые используют лабораторные"""
+
+    __slots__ = ('type', 'key', 'button', 'pos', 'rel', 'buttons', 'size', 'count')
+
+    def __init__(self):
+        self.type = NOEVENT
+        self.key = 0
+        self.button = 0
+        self.pos = (0, 0)
+        self.rel = (0, 0)
+        self.buttons = (0, 0, 0)
+        self.size = (0, 0)
+        self.count = 0  # сколько событий pygame слито в это
+
+
+class EventBatch(object):
+    """Заранее выделенный набор событий кадра"""
+
+    def __init__(self, capacity=64, coalesce=True):
+        self.events = [Event() for _ in range(capacity)]
+        self.count = 0
+        self.coalesce = coalesce
+        self.received = 0  # всего событий pygame
+        self.merged = 0  # из них слито с предыдущим движением мыши
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        events = self.events
+        for i in range(self.count):
+            yield events[i]
+
+    def next_event(self):
+        """Следующий свободный объект, при переполнении набор растет"""
+        if self.count == len(self.events):
+            self.events.append(Event())
+        event = self.events[self.count]
+        self.count += 1
+        return event
+
+    def collect(self, events):
+        """Заполняет набор событиями pygame (или любыми объектами с такими же полями)"""
+        self.count = 0
+        last = None  # последнее движение мыши, к которому можно прибавить следующее
+        for e in events:
+            self.received += 1
+            if e.type == MOUSEMOTION:
+                if last is not None:
+                    # сливаем: положение - последнее, сдвиг - суммарный
+                    last.pos = e.pos
+                    last.rel = (last.rel[0] + e.rel[0], last.rel[1] + e.rel[1])
+                    last.buttons = e.buttons
+                    last.count += 1
+                    self.merged += 1
+                    continue
+                event = self.next_event()
+                event.type = MOUSEMOTION
+                event.pos = e.pos
+                event.rel = e.rel
+                event.buttons = e.buttons
+                # объект переиспользуется: поля других типов событий сбрасываем
+                event.key = 0
+                event.button = 0
+                event.size = (0, 0)
+                event.count = 1
+                if self.coalesce:
+                    last = event
+                continue
+            last = None
+            event = self.next_event()
+            event.type = e.type
+            event.key = getattr(e, 'key', 0)
+            event.button = getattr(e, 'button', 0)
+            event.pos = getattr(e, 'pos', (0, 0))
+            event.size = getattr(e, 'size', (0, 0))
+            event.rel = (0, 0)
+            event.buttons = (0, 0, 0)
+            event.count = 1
+        return self
+
+    def poll(self):
+        """Забирает все события из очереди pygame"""
+        return self.collect(pygame.event.get())
+
+
+# тип события в файле привязок -> тип pygame
+EVENT_TYPES = {
+    'keydown': KEYDOWN,
+    'keyup': KEYUP,
+    'mousebuttondown': MOUSEBUTTONDOWN,
+    'mousebuttonup': MOUSEBUTTONUP,
+    'mousemotion': MOUSEMOTION,
+    'videoresize': VIDEORESIZE,
+    'quit': QUIT,
+}
+EVENT_NAMES = dict((value, name) for name, value in EVENT_TYPES.items())
+# по какому полю различаются события одного типа
+CODE_FIELDS = {KEYDOWN: 'key', KEYUP: 'key', MOUSEBUTTONDOWN: 'button', MOUSEBUTTONUP: 'button'}
+
+
+def parse_binding(spec):
+    """'keyup:space' -> (KEYUP, K_SPACE), 'mousebuttondown:1' -> (MOUSEBUTTONDOWN, 1), 'quit' -> (QUIT, None)"""
+    name, _, code = spec.lower().partition(':')
+    if name not in EVENT_TYPES:
+        raise ValueError("unknown event type in binding %r" % spec)
+    type = EVENT_TYPES[name]
+    if not code:
+        return type, None
+    if CODE_FIELDS.get(type) == 'key':
+        # константы K_* не требуют инициализации pygame (key_code без нее предупреждает, например без окна)
+        key = getattr(pygame, 'K_' + code, None)
+        if key is None:
+            key = getattr(pygame, 'K_' + code.upper(), None)
+        if key is None:
+            key = pygame.key.key_code(code)
+        return type, key
+    return type, int(code)
+
+
+def format_binding(type, code):
+    """Обратное к parse_binding"""
+    if code is None:
+        return EVENT_NAMES[type]
+    if CODE_FIELDS.get(type) == 'key':
+        return "%s:%s" % (EVENT_NAMES[type], pygame.key.name(code))
+    return "%s:%s" % (EVENT_NAMES[type], code)
+
+
+class Dispatcher(object):
+    """Таблица обработчиков событий по ключу (тип, клавиша|кнопка)"""
+
+    def __init__(self):
+        self.handlers = {}  # (тип, код или None) -> кортеж обработчиков
+        self.actions = {}  # имя действия -> обработчик
+        self.bindings = {}  # имя действия -> список (тип, код)
+
+    def subscribe(self, type, handler, code=None):
+        """Подписывает handler(event) на события типа type; code=None - на все события этого типа"""
+        key = (type, code)
+        # кортеж заменяется целиком, поэтому подписку можно менять прямо из обработчика
+        self.handlers[key] = self.handlers.get(key, ()) + (handler,)
+
+    def unsubscribe(self, type, handler, code=None):
+        key = (type, code)
+        handlers = tuple(h for h in self.handlers.get(key, ()) if h != handler)
+        if handlers:
+            self.handlers[key] = handlers
+        else:
+            self.handlers.pop(key, None)
+
+    def action(self, name, handler, *bindings):
+        """Регистрирует действие с привязками по умолчанию ('keyup:space' или (KEYUP, K_SPACE))"""
+        self.actions[name] = handler
+        self.bind(name, *bindings)
+
+    def bind(self, name, *bindings):
+        """Заменяет привязки действия, можно вызывать во время работы"""
+        handler = self.actions[name]
+        for type, code in self.bindings.get(name, ()):
+            self.unsubscribe(type, handler, code)
+        keys = [parse_binding(b) if isinstance(b, str) else tuple(b) for b in bindings]
+        for type, code in keys:
+            self.subscribe(type, handler, code)
+        self.bindings[name] = keys
+
+    def load_bindings(self, filename):
+        """Загружает привязки из JSON {действие: [привязки]}; неизвестные действия пропускаются
+
+        Один файл можно использовать для разных лабораторных с разным набором действий.
+        """
+        with open(filename) as f:
+            config = json.load(f)
+        for name, bindings in config.items():
+            if name in self.actions:
+                self.bind(name, *bindings)
+
+    def save_bindings(self, filename):
+        config = dict((name, [format_binding(*key) for key in keys]) for name, keys in self.bindings.items())
+        with open(filename, 'w') as f:
+            json.dump(config, f, indent=4, sort_keys=True)
+
+    def dispatch(self, event):
+        """Передает событие подписанным обработчикам, возвращает True, если такие нашлись"""
+        type = event.type
+        found = False
+        field = CODE_FIELDS.get(type)
+        if field is not None:
+            handlers = self.handlers.get((type, getattr(event, field)))
+            if handlers:
+                found = True
+                for handler in handlers:
+                    handler(event)
+        handlers = self.handlers.get((type, None))
+        if handlers:
+            found = True
+            for handler in handlers:
+                handler(event)
+        return found
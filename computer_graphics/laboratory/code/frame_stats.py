@@ -0,0 +1,65 @@
+"""
+Статистика времени кадра в скользящем окне
+
+Раньше Controller.fps каждый кадр форматировал строку и вызывал pygame.display.set_caption,
+а это обращение к оконному менеджеру. FrameStats копит длительности кадров в кольцевом буфере
+и отвечает, когда пора обновить заголовок (due, по умолчанию дважды в секунду); snapshot
+отдает статистику словарем - для оверлея (text_overlay) и внешних инструментов.
+"""
+
+import time
+
+import numpy
+
+
+class FrameStats(object):
+    """Длительности последних window кадров в миллисекундах"""
+
+    def __init__(self, window=240, interval=0.5):
+        """window - размер окна в кадрах, interval - период обновления заголовка в секундах"""
+        self.times = numpy.zeros(window, numpy.float64)
+        self.count = 0  # всего кадров
+        self.interval = interval
+        self.next_update = 0.0
+        self.counters = {}  # счетчики кадра других подсистем, например отсечения (tested, culled, drawn)
+
+    def add(self, frame_ms):
+        self.times[self.count % len(self.times)] = frame_ms
+        self.count += 1
+
+    def window(self):
+        """Длительности кадров в окне (порядок не важен для статистики)"""
+        return self.times[:min(self.count, len(self.times))]
+
+    @property
+    def fps(self):
+        times = self.window()
+        mean = times.mean() if len(times) else 0.0
+        return float(1000.0 / mean) if mean > 0 else 0.0
+
+    def due(self, now=None):
+        """True не чаще раза в interval секунд: пора обновить заголовок|оверлей"""
+        now = time.perf_counter() if now is None else now
+        if now < self.next_update:
+            return False
+        self.next_update = now + self.interval
+        return True
+
+    def snapshot(self):
+        """Словарь со статистикой окна: fps, mean, p50, p95, p99, max (мс), frames и счетчики"""
+        times = self.window()
+        if not len(times):
+            stats = {'fps': 0.0, 'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0, 'frames': 0}
+        else:
+            p50, p95, p99 = numpy.percentile(times, (50, 95, 99))
+            stats = {'fps': self.fps, 'mean': float(times.mean()), 'p50': float(p50), 'p95': float(p95),
+                     'p99': float(p99), 'max': float(times.max()), 'frames': self.count}
+        stats.update(self.counters)
+        return stats
+
+    def format(self):
+        stats = self.snapshot()
+        text = "FPS %(fps).1f  mean %(mean).2f  p95 %(p95).2f  max %(max).2f ms" % stats
+        if self.counters:
+            text += '\n' + '  '.join("%s %s" % item for item in sorted(self.counters.items()))
+        return text
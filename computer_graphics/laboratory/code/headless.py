@@ -0,0 +1,219 @@
+"""
+Запуск лабораторных без окна и без дисплея (CI, сервер без GPU)
+
+Контекст OpenGL создается без окна: EGL без поверхности (EGL_PLATFORM=surfaceless, в Mesa
+это программный llvmpipe, если GPU нет) или OSMesa. Рисование идет в буфер кадра (FBO),
+кадр считывается glReadPixels в массив numpy. pygame.display не используется: Controller
+получает контекст параметром context и пропускает окно, события и заголовок.
+
+PyOpenGL выбирает платформу при первом импорте OpenGL, поэтому select_backend нужно вызвать
+раньше любого `from OpenGL.GL import *`; в этом модуле OpenGL импортируется внутри функций.
+
+Запуск:
+    python headless.py 5.cube-input.py --frames 120 --save frame.png
+    python headless.py 5.cube-input.py --frames 300 --trace trace.json
+    python headless.py 6.cube-shader.py --size 320x240 --backend osmesa --save-every 30 --save frames/%04d.png
+"""
+
+import argparse
+import ctypes
+import importlib.util
+import os
+import sys
+import time
+
+import numpy
+
+
+BACKENDS = ('egl', 'osmesa')
+
+
+def select_backend(backend='egl'):
+    """Выбирает платформу PyOpenGL; должна вызываться до первого импорта OpenGL"""
+    if backend not in BACKENDS:
+        raise ValueError("unknown backend %r, expected one of %s" % (backend, ', '.join(BACKENDS)))
+    if 'OpenGL.GL' in sys.modules:
+        if os.environ.get('PYOPENGL_PLATFORM') != backend:
+            raise RuntimeError("OpenGL is already imported for another platform, select_backend must be called first")
+        return
+    os.environ['PYOPENGL_PLATFORM'] = backend
+    if backend == 'egl':
+        # без X11|Wayland: контекст без поверхности
+        os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+
+
+class OffscreenContext(object):
+    """Контекст OpenGL без окна с буфером кадра w x h (цвет RGBA8 и глубина 24 бита)"""
+
+    def __init__(self, backend='egl'):
+        select_backend(backend)
+        self.backend = backend
+        self.w = 0
+        self.h = 0
+        self.display = None  # EGLDisplay
+        self.context = None  # EGLContext или OSMesaContext
+        self.osmesa_buffer = None  # память, в которую OSMesa рисует по умолчанию
+        self.fbo = None
+        self.renderbuffers = None
+        self.pixels = None  # заранее выделенный массив для glReadPixels
+        self.frames = 0
+        self.finish_time = 0.0  # сколько секунд последний swap ждал окончания рисования
+
+    def init(self, w, h):
+        """Создает контекст и делает его текущим, затем создает буфер кадра"""
+        self.w = w
+        self.h = h
+        if self.backend == 'egl':
+            self.create_egl()
+        else:
+            self.create_osmesa()
+        self.create_framebuffer()
+
+    def create_egl(self):
+        from OpenGL import EGL
+
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor))
+        attribs = numpy.array((
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8, EGL.EGL_ALPHA_SIZE, 8,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_NONE,
+        ), numpy.int32)
+        config, count = EGL.EGLConfig(), EGL.EGLint()
+        EGL.eglChooseConfig(self.display, attribs, ctypes.pointer(config), 1, ctypes.pointer(count))
+        if count.value == 0:
+            raise RuntimeError("no EGL config with desktop OpenGL support")
+        # полный OpenGL (не GLES): в лабораторных используется фиксированный конвейер
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self.context)
+
+    def create_osmesa(self):
+        from OpenGL import GL, osmesa, arrays
+
+        self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not self.context:
+            raise RuntimeError("OSMesaCreateContextExt failed")
+        self.osmesa_buffer = arrays.GLubyteArray.zeros((self.h, self.w, 4))
+        if not osmesa.OSMesaMakeCurrent(self.context, self.osmesa_buffer, GL.GL_UNSIGNED_BYTE, self.w, self.h):
+            raise RuntimeError("OSMesaMakeCurrent failed")
+
+    def create_framebuffer(self):
+        from OpenGL.GL import (glGenFramebuffers, glBindFramebuffer, glGenRenderbuffers, glBindRenderbuffer,
+                               glRenderbufferStorage, glFramebufferRenderbuffer, glCheckFramebufferStatus, glViewport,
+                               GL_FRAMEBUFFER, GL_RENDERBUFFER, GL_RGBA8, GL_DEPTH_COMPONENT24,
+                               GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT, GL_FRAMEBUFFER_COMPLETE)
+
+        self.fbo = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        self.renderbuffers = glGenRenderbuffers(2)
+        for renderbuffer, format, attachment in zip(self.renderbuffers,
+                                                    (GL_RGBA8, GL_DEPTH_COMPONENT24),
+                                                    (GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT)):
+            glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer)
+            glRenderbufferStorage(GL_RENDERBUFFER, format, self.w, self.h)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, renderbuffer)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("framebuffer is incomplete: 0x%x" % status)
+        glViewport(0, 0, self.w, self.h)
+        self.pixels = numpy.empty((self.h, self.w, 4), numpy.uint8)
+
+    def swap(self):
+        """Конец кадра (вместо pygame.display.flip): дожидаемся окончания рисования"""
+        from OpenGL.GL import glFinish
+
+        start = time.perf_counter()
+        glFinish()
+        self.finish_time = time.perf_counter() - start
+        self.frames += 1
+
+    def read(self):
+        """Считывает кадр в массив (h, w, 4) uint8, первая строка - верхняя
+
+        Массив переиспользуется между вызовами, для хранения кадра нужна копия.
+        """
+        from OpenGL.GL import glReadPixels, glPixelStorei, GL_PACK_ALIGNMENT, GL_RGBA, GL_UNSIGNED_BYTE
+
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glReadPixels(0, 0, self.w, self.h, GL_RGBA, GL_UNSIGNED_BYTE, self.pixels)
+        # OpenGL считает строки снизу вверх
+        return self.pixels[::-1]
+
+    def save(self, filename):
+        """Сохраняет текущий кадр в файл изображения"""
+        import PIL.Image as Image
+
+        Image.fromarray(numpy.ascontiguousarray(self.read())).save(filename)
+
+    def destroy(self):
+        from OpenGL.GL import glDeleteFramebuffers, glDeleteRenderbuffers
+
+        if self.fbo is not None:
+            glDeleteRenderbuffers(2, self.renderbuffers)
+            glDeleteFramebuffers(1, [self.fbo])
+            self.fbo = None
+        if self.backend == 'egl' and self.context is not None:
+            from OpenGL import EGL
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroyContext(self.display, self.context)
+            EGL.eglTerminate(self.display)
+        elif self.context is not None:
+            from OpenGL import osmesa
+            osmesa.OSMesaDestroyContext(self.context)
+        self.context = None
+
+
+def load_lab(filename):
+    """Импортирует файл лабораторной ('5.cube-input.py' нельзя импортировать по имени)"""
+    name = 'lab_' + os.path.splitext(os.path.basename(filename))[0].replace('.', '_').replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_size(text):
+    w, h = text.lower().split('x')
+    return int(w), int(h)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('lab', help='файл лабораторной, например 5.cube-input.py')
+    parser.add_argument('--frames', type=int, default=60, help='количество кадров')
+    parser.add_argument('--size', type=parse_size, default=(800, 600), help='размер кадра, например 800x600')
+    parser.add_argument('--backend', default='egl', choices=BACKENDS)
+    parser.add_argument('--save', help='куда сохранить последний кадр (или шаблон с %%d для --save-every)')
+    parser.add_argument('--save-every', type=int, default=0, help='сохранять каждый N-й кадр')
+    parser.add_argument('--trace', help='записать время фаз кадра (profiling) в Chrome trace JSON')
+    args = parser.parse_args(argv)
+
+    # до импорта лабораторной: она импортирует OpenGL
+    context = OffscreenContext(args.backend)
+    lab = load_lab(args.lab)
+    if args.trace:
+        from profiling import profiler
+        profiler.enable(args.trace)
+    w, h = args.size
+    # frame_rate=0 - без ограничения FPS
+    controller = lab.Controller(w, h, frame_rate=0, context=context)
+    controller.init()
+    for frame in range(args.frames):
+        controller.loop_step()
+        if args.save and args.save_every and frame % args.save_every == 0:
+            context.save(args.save % frame)
+    if args.save and not args.save_every:
+        context.save(args.save)
+    if hasattr(controller, 'texture_loader'):
+        controller.texture_loader.shutdown()
+    context.destroy()
+    print("%s: %s frames %sx%s (%s)" % (args.lab, context.frames, w, h, args.backend))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
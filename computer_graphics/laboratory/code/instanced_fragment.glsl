@@ -0,0 +1,11 @@
+#version 150 compatibility
+
+uniform sampler2DArray textures;
+
+in vec3 tex_coord;
+in vec4 tint;
+
+void main()
+{
+    gl_FragColor = texture(textures, tex_coord) * tint;
+}
\ No newline at end of file
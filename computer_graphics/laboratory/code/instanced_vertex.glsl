@@ -0,0 +1,22 @@
+#version 150 compatibility
+
+uniform mat4 projection;
+uniform mat4 view;
+
+in vec4 position;
+in vec2 uv;
+
+// атрибуты экземпляра (glVertexAttribDivisor = 1): одно значение на весь куб
+in mat4 instance_model;  // строки матрицы модели, поэтому вектор умножается слева
+in vec4 instance_color;
+in float instance_layer;
+
+out vec3 tex_coord;
+out vec4 tint;
+
+void main()
+{
+   tex_coord = vec3(uv, instance_layer);
+   tint = instance_color;
+   gl_Position = projection * view * (position * instance_model);
+}
\ No newline at end of file
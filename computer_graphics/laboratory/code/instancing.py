@@ -0,0 +1,177 @@
+"""
+Аппаратное дублирование (instancing): тысячи одинаковых объектов одним вызовом отрисовки
+
+Геометрия объекта (MeshBuffer) загружается один раз, а данные каждого экземпляра - матрица
+модели, цвет и слой массива текстур - лежат в структурированном массиве numpy (INSTANCE)
+и загружаются в отдельный буфер. Атрибуты экземпляра читаются шейдером раз на экземпляр
+(glVertexAttribDivisor = 1), и все N объектов рисуются одним glDrawElementsInstanced.
+
+При изменении части экземпляров помечаются измененные диапазоны (mark_dirty), и в GPU
+отправляются только они (glBufferSubData); близкие диапазоны сливаются в один вызов.
+"""
+
+import ctypes
+
+from OpenGL.GL import *
+
+import numpy
+
+
+# данные одного экземпляра в буфере, 72 байта
+INSTANCE = numpy.dtype([
+    ('model', '<f4', (4, 4)),  # матрица модели по строкам, как в transforms
+    ('color', 'u1', 4),  # RGBA 0..255, в шейдере нормализуется в 0..1
+    ('layer', '<f4'),  # слой массива текстур (sampler2DArray)
+])
+MODEL_OFFSET = INSTANCE.fields['model'][1]
+COLOR_OFFSET = INSTANCE.fields['color'][1]
+LAYER_OFFSET = INSTANCE.fields['layer'][1]
+
+# палитра цветов экземпляров, те же цвета, что у граней Cube
+PALETTE = numpy.array((
+    (0, 255, 0, 255),
+    (255, 128, 0, 255),
+    (255, 0, 0, 255),
+    (255, 255, 0, 255),
+    (0, 0, 255, 255),
+    (255, 0, 255, 255),
+), numpy.uint8)
+
+
+def merge_ranges(ranges, gap=0):
+    """Сортирует диапазоны [start, stop) и сливает пересекающиеся и отстоящие не дальше gap"""
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1] + gap:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return [tuple(r) for r in merged]
+
+
+class InstanceBuffer(object):
+    """Данные экземпляров в массиве INSTANCE и в буфере OpenGL, загружаются только измененные части"""
+
+    def __init__(self, capacity=1024, merge_gap=256):
+        """capacity - начальная емкость, merge_gap - диапазоны ближе стольких экземпляров сливаются"""
+        self.data = numpy.zeros(capacity, INSTANCE)
+        self.count = 0
+        self.merge_gap = merge_gap
+        self.dirty = []  # измененные диапазоны [start, stop)
+        self.vbo = None
+        self.gpu_capacity = 0  # емкость буфера в GPU (в экземплярах)
+        self.uploaded_bytes = 0  # байт отправлено при последней загрузке
+        self.upload_calls = 0  # вызовов glBuffer*Data при последней загрузке
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def instances(self):
+        """Занятая часть массива, изменения в ней нужно пометить через mark_dirty"""
+        return self.data[:self.count]
+
+    def reserve(self, capacity):
+        """Увеличивает емкость массива (вдвое, пока не хватит); буфер GPU пересоздастся при загрузке"""
+        if capacity <= len(self.data):
+            return
+        size = len(self.data) or 1
+        while size < capacity:
+            size *= 2
+        data = numpy.zeros(size, INSTANCE)
+        data[:self.count] = self.data[:self.count]
+        self.data = data
+
+    def append(self, model, color=None, layer=0):
+        """Добавляет экземпляры: model (4, 4) или (N, 4, 4), возвращает диапазон их индексов"""
+        model = numpy.asarray(model, numpy.float32).reshape(-1, 4, 4)
+        start, stop = self.count, self.count + len(model)
+        self.reserve(stop)
+        self.count = stop
+        self.update(start, model, PALETTE[0] if color is None else color, layer)
+        return range(start, stop)
+
+    def update(self, start, model=None, color=None, layer=None):
+        """Записывает данные экземпляров начиная с start и помечает их измененными
+
+        Передаются только нужные поля; длина диапазона - по первому массиву (или 1).
+        """
+        size = 1
+        for value, ndim in ((model, 3), (color, 2), (layer, 1)):
+            value = numpy.asarray(value) if value is not None else None
+            if value is not None and value.ndim == ndim:
+                size = len(value)
+                break
+        stop = start + size
+        if stop > self.count:
+            raise IndexError("instances %s..%s out of range (count %s)" % (start, stop, self.count))
+        view = self.data[start:stop]
+        if model is not None:
+            view['model'] = model
+        if color is not None:
+            view['color'] = color
+        if layer is not None:
+            view['layer'] = layer
+        self.mark_dirty(start, stop)
+
+    def mark_dirty(self, start=0, stop=None):
+        """Помечает экземпляры [start, stop) для загрузки в GPU"""
+        stop = self.count if stop is None else min(stop, self.count)
+        if start < stop:
+            self.dirty.append((start, stop))
+
+    def upload(self):
+        """Отправляет в GPU измененные диапазоны; буфер пересоздается, если не хватает емкости"""
+        self.uploaded_bytes = 0
+        self.upload_calls = 0
+        raw = self.data.view(numpy.uint8).reshape(len(self.data), INSTANCE.itemsize)
+        if self.vbo is None:
+            self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        if self.gpu_capacity < len(self.data):
+            # новый буфер на всю емкость массива, старое содержимое драйвер может отбросить
+            glBufferData(GL_ARRAY_BUFFER, raw.nbytes, raw, GL_DYNAMIC_DRAW)
+            self.gpu_capacity = len(self.data)
+            self.uploaded_bytes = raw.nbytes
+            self.upload_calls = 1
+        else:
+            for start, stop in merge_ranges(self.dirty, self.merge_gap):
+                chunk = raw[start:stop]
+                glBufferSubData(GL_ARRAY_BUFFER, start * INSTANCE.itemsize, chunk.nbytes, chunk)
+                self.uploaded_bytes += chunk.nbytes
+                self.upload_calls += 1
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        del self.dirty[:]
+
+    def bind(self, model_loc, color_loc=-1, layer_loc=-1):
+        """Подключает буфер к атрибутам шейдера с делителем 1, возвращает включенные location
+
+        mat4 занимает четыре location подряд, по строке матрицы в каждом.
+        """
+        stride = INSTANCE.itemsize
+        attribs = []
+        if model_loc >= 0:
+            attribs += [(model_loc + row, 4, GL_FLOAT, GL_FALSE, MODEL_OFFSET + row * 16) for row in range(4)]
+        if color_loc >= 0:
+            attribs.append((color_loc, 4, GL_UNSIGNED_BYTE, GL_TRUE, COLOR_OFFSET))
+        if layer_loc >= 0:
+            attribs.append((layer_loc, 1, GL_FLOAT, GL_FALSE, LAYER_OFFSET))
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        for loc, size, type, normalized, offset in attribs:
+            glEnableVertexAttribArray(loc)
+            glVertexAttribPointer(loc, size, type, normalized, stride, ctypes.c_void_p(offset))
+            glVertexAttribDivisor(loc, 1)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        return [attrib[0] for attrib in attribs]
+
+    @staticmethod
+    def unbind(locations):
+        for loc in locations:
+            glVertexAttribDivisor(loc, 0)
+            glDisableVertexAttribArray(loc)
+
+    def delete(self):
+        if self.vbo is not None:
+            glDeleteBuffers(1, [self.vbo])
+            self.vbo = None
+            self.gpu_capacity = 0
@@ -0,0 +1,450 @@
+"""
+Загрузка моделей Wavefront OBJ и бинарный кэш сетки (.mesh)
+
+Файл OBJ читается блоками по chunk_size байт, строки в блоке не разбираются по одной в Python:
+    - тип каждой строки (v, vt, vn, f, остальные пропускаются) определяется по первым байтам
+      сразу для всех строк блока, байты строк одного типа собираются маской;
+    - ключевые слова затираются пробелами, числа разбираются одним numpy.fromstring,
+      количество чисел в строке - по началам токенов (переход пробел -> не пробел);
+    - полигоны разбиваются на треугольники веером (0, i, i + 1) векторно.
+Углы полигонов - тройки индексов (v, vt, vn); одинаковые тройки становятся одной вершиной
+(KeyIndex: словарь "ключ -> номер" на сортированных массивах numpy). Отрицательные индексы
+(относительно последней объявленной вершины) поддерживаются.
+
+Память при разборе ограничена блоком и уникальными вершинами: индексы треугольников каждого
+блока сразу пишутся в файл кэша, поэтому файл на 10M треугольников не держится в памяти целиком
+(временные массивы блока занимают порядка 20 размеров блока).
+
+Формат вершины как у buffers.MeshBuffer: x, y, z, u, v, r, g, b. Отдельного места под нормаль
+в нем нет, поэтому цвет вершины - нормаль, переведенная в [0, 1] (без нормалей - белый).
+
+Формат кэша (little-endian):
+    заголовок   magic 'MESH', версия, компонент на вершину (uint32), резерв,
+                количество вершин, количество индексов, смещения индексов и вершин (uint64)
+    индексы     uint32, по три на треугольник
+    вершины     float32, начало выровнено по ALIGNMENT байт
+Файл открывается через numpy.memmap, массивы передаются в glBufferData без копий.
+
+Запуск (перевод OBJ в .mesh, OpenGL контекст не нужен):
+    python mesh_loader.py model.obj model.mesh
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+import numpy
+
+
+MAGIC = b'MESH'
+VERSION = 1
+ALIGNMENT = 16
+COMPONENTS = 8  # x, y, z, u, v, r, g, b, как buffers.MeshBuffer.COMPONENTS
+CHUNK_SIZE = 4 << 20
+
+HEADER = numpy.dtype([
+    ('magic', 'S4'),
+    ('version', '<u4'),
+    ('components', '<u4'),
+    ('reserved', '<u4'),
+    ('vertex_count', '<u8'),
+    ('index_count', '<u8'),
+    ('index_offset', '<u8'),
+    ('vertex_offset', '<u8'),
+])
+
+# типы строк OBJ
+OTHER, POSITION, UV, NORMAL, FACE = range(5)
+NEWLINE = ord('\n')
+SPACE = ord(' ')
+WHITESPACE = numpy.zeros(256, bool)
+WHITESPACE[[ord(' '), ord('\t'), ord('\r'), NEWLINE]] = True
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class MeshData(object):
+    """Вершины (N, COMPONENTS) float32 и индексы треугольников uint32, в памяти или memmap"""
+
+    def __init__(self, vertex_data, indices, path=None):
+        self.vertex_data = vertex_data
+        self.indices = indices
+        self.path = path
+
+    @property
+    def bounds(self):
+        """Коробка модели (min, max) по позициям вершин"""
+        positions = self.vertex_data[:, :3]
+        return positions.min(0), positions.max(0)
+
+    @property
+    def nbytes(self):
+        return self.vertex_data.nbytes + self.indices.nbytes
+
+
+class KeyIndex(object):
+    """Номера int64 ключей в порядке первого появления, без словаря Python
+
+    Известные ключи хранятся отсортированными, новые вставляются на свои места (numpy.insert),
+    поиск - numpy.searchsorted. Память - два массива по количеству разных ключей.
+    """
+
+    def __init__(self):
+        self.keys = numpy.zeros(0, numpy.int64)
+        self.ids = numpy.zeros(0, numpy.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys):
+        """Номера ключей массива keys, новые ключи получают следующие номера
+
+        Возвращает (номера для keys, номера новых ключей, позиции их первого появления в keys).
+        """
+        unique, first, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+        position = numpy.searchsorted(self.keys, unique)
+        found = numpy.zeros(len(unique), bool)
+        inside = position < len(self.keys)
+        found[inside] = self.keys[position[inside]] == unique[inside]
+        ids = numpy.empty(len(unique), numpy.int64)
+        ids[found] = self.ids[position[found]]
+        new = ~found
+        # новые номера раздаются в порядке первого появления в блоке, а не в порядке ключей
+        order = numpy.argsort(first[new], kind='stable')
+        new_ids = numpy.empty(len(order), numpy.int64)
+        new_ids[order] = numpy.arange(len(self.keys), len(self.keys) + len(order))
+        ids[new] = new_ids
+        self.keys = numpy.insert(self.keys, position[new], unique[new])
+        self.ids = numpy.insert(self.ids, position[new], new_ids)
+        return ids[inverse.reshape(-1)], new_ids, first[new]
+
+
+def _tokens_per_line(data):
+    """Количество токенов в каждой строке байтов data (каждая строка заканчивается переводом строки)"""
+    space = WHITESPACE[data]
+    starts = ~space
+    starts[1:] &= space[:-1]
+    # токенов до каждого перевода строки, без номера строки для каждого байта
+    before = numpy.searchsorted(numpy.flatnonzero(starts), numpy.flatnonzero(data == NEWLINE))
+    return numpy.diff(before, prepend=0)
+
+
+def _first_columns(values, counts, columns, name):
+    """Первые columns чисел каждой строки из плоского массива values"""
+    if (counts == columns).all():
+        return values.reshape(-1, columns)
+    if (counts < columns).any():
+        raise ValueError("OBJ: '%s' line with less than %d values" % (name, columns))
+    starts = numpy.cumsum(counts) - counts
+    return values[starts[:, None] + numpy.arange(columns)]
+
+
+def _fan(counts):
+    """Индексы углов (в плоском массиве углов) треугольников веера для полигонов с counts углами"""
+    if (counts < 3).any():
+        raise ValueError("OBJ: face with less than 3 vertices")
+    starts = numpy.cumsum(counts) - counts
+    triangles = counts - 2
+    face = numpy.repeat(numpy.arange(len(counts)), triangles)
+    i = numpy.arange(len(face)) - numpy.repeat(numpy.cumsum(triangles) - triangles, triangles) + 1
+    base = starts[face]
+    return numpy.stack((base, base + i, base + i + 1), 1)
+
+
+class ObjParser(object):
+    """Потоковый разбор OBJ: parse_chunk для каждого блока целых строк, затем vertex_blocks"""
+
+    def __init__(self):
+        self.positions = []  # блоки массивов (N, 3) float32
+        self.uvs = []
+        self.normals = []
+        self.counts = [0, 0, 0]  # объявлено v, vt, vn
+        self.layout = None  # номера компонент (v, vt, vn) в записи угла, определяются по первому полигону
+        self.index = KeyIndex()  # ключ угла -> номер вершины
+        self.pairs = KeyIndex()  # (vt, vn) -> номер пары, если в углах есть обе компоненты
+        self.corners = []  # блоки троек (v, vt, vn) новых вершин, в порядке номеров
+        self.triangles = 0
+
+    def detect_layout(self, token):
+        """Формат угла полигона: v, v/vt, v//vn или v/vt/vn"""
+        parts = token.split(b'/')
+        if len(parts) == 1:
+            return (0, None, None)
+        if len(parts) == 2:
+            return (0, 1, None)
+        if parts[1] == b'':
+            return (0, None, 1)
+        return (0, 1, 2)
+
+    def parse_chunk(self, chunk):
+        """Разбирает блок байтов из целых строк (последний байт - перевод строки), возвращает индексы uint32"""
+        data = numpy.frombuffer(bytearray(chunk), numpy.uint8)
+        ends = numpy.flatnonzero(data == NEWLINE)
+        starts = numpy.empty_like(ends)
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+        # ключевое слово - с первого непробельного байта строки: сдвигаем начала строк с отступом,
+        # шагов столько, какой самый длинный отступ (пустые строки доходят до своего перевода строки)
+        first = starts.copy()
+        indented = numpy.flatnonzero(WHITESPACE[data[first]] & (first < ends))
+        while len(indented):
+            first[indented] += 1
+            indented = indented[WHITESPACE[data[first[indented]]] & (first[indented] < ends[indented])]
+        padded = numpy.append(data, (NEWLINE, NEWLINE))
+        b0, b1, b2 = padded[first], padded[first + 1], padded[first + 2]
+        types = numpy.full(len(starts), OTHER, numpy.uint8)
+        space1, space2 = WHITESPACE[b1], WHITESPACE[b2]
+        is_v = b0 == ord('v')
+        types[is_v & space1] = POSITION
+        types[is_v & (b1 == ord('t')) & space2] = UV
+        types[is_v & (b1 == ord('n')) & space2] = NORMAL
+        types[(b0 == ord('f')) & space1] = FACE
+        # затираем ключевые слова, в строках остаются только числа
+        keyword = types != OTHER
+        data[first[keyword]] = SPACE
+        data[numpy.minimum(first[keyword] + 1, ends[keyword])] = SPACE
+        # комментарий в конце строки с данными (f 1 2 3 # ...): затираем от '#' до перевода строки
+        hashes = numpy.flatnonzero(data == ord('#'))
+        if len(hashes):
+            lines, first_hash = numpy.unique(numpy.searchsorted(ends, hashes), return_index=True)
+            commented = types[lines] != OTHER
+            marks = numpy.zeros(len(data), numpy.int8)
+            marks[hashes[first_hash[commented]]] = 1
+            marks[ends[lines[commented]]] = -1
+            data[numpy.cumsum(marks, dtype=numpy.int8) > 0] = SPACE
+        byte_types = numpy.repeat(types, ends - starts + 1)
+
+        # сколько v|vt|vn объявлено до каждой строки: для отрицательных индексов
+        before = [self.counts[kind] + numpy.cumsum(types == kind + POSITION) for kind in range(3)]
+        for kind, arrays, columns in ((0, self.positions, 3), (1, self.uvs, 2), (2, self.normals, 3)):
+            lines = types == kind + POSITION
+            if not lines.any():
+                continue
+            selected = data[byte_types == kind + POSITION]
+            values = numpy.fromstring(selected.tobytes(), numpy.float32, sep=' ')
+            counts = _tokens_per_line(selected)
+            name = ('v', 'vt', 'vn')[kind]
+            if len(values) != counts.sum():
+                raise ValueError("OBJ: cannot parse '%s' values" % name)
+            arrays.append(numpy.ascontiguousarray(_first_columns(values, counts, columns, name)))
+            self.counts[kind] += int(numpy.count_nonzero(lines))
+
+        face_lines = numpy.flatnonzero(types == FACE)
+        if not len(face_lines):
+            return numpy.zeros(0, numpy.uint32)
+        selected = data[byte_types == FACE]
+        corners_per_face = _tokens_per_line(selected)
+        if self.layout is None:
+            first_line = selected[:numpy.argmax(selected == NEWLINE)]
+            self.layout = self.detect_layout(first_line.tobytes().split()[0])
+        width = sum(component is not None for component in self.layout)
+        selected[selected == ord('/')] = SPACE
+        values = numpy.fromstring(selected.tobytes(), numpy.int64, sep=' ')
+        if len(values) != corners_per_face.sum() * width:
+            raise ValueError("OBJ: faces with different vertex formats are not supported")
+        values = values.reshape(-1, width)
+        corner_line = numpy.repeat(face_lines, corners_per_face)
+        corners = numpy.zeros((len(values), 3), numpy.int64)
+        for kind, component in enumerate(self.layout):
+            if component is None:
+                continue
+            index = values[:, component]
+            # 1..N - с начала файла, -1..-N - от последней объявленной до этой строки
+            index = numpy.where(index < 0, before[kind][corner_line] + index, index - 1)
+            corners[:, kind] = index + 1  # 0 - компоненты нет
+        return self.add_corners(corners, corners_per_face)
+
+    def add_corners(self, corners, corners_per_face):
+        """Номера вершин для углов, индексы треугольников uint32"""
+        # тройка -> один ключ: (vt, vn) сначала сводятся к номеру пары, затем пара с v
+        if self.layout[1] is not None and self.layout[2] is not None:
+            pair, _, _ = self.pairs.lookup((corners[:, 1] << 32) | corners[:, 2])
+            keys = (corners[:, 0] << 32) | pair
+        else:
+            keys = (corners[:, 0] << 32) | corners[:, 1] | corners[:, 2]
+        ids, new_ids, first = self.index.lookup(keys)
+        # тройки новых вершин по порядку номеров: сами атрибуты собираются в vertex_blocks
+        new = numpy.empty((len(new_ids), 3), numpy.int32)
+        new[new_ids - (len(self.index) - len(new_ids))] = corners[first]
+        self.corners.append(new)
+        triangles = ids[_fan(corners_per_face)]
+        self.triangles += len(triangles)
+        return triangles.astype(numpy.uint32).reshape(-1)
+
+    def vertex_blocks(self, size=1 << 20):
+        """Вершины в формате MeshBuffer по тройкам (v, vt, vn) в порядке номеров, блоками по size
+
+        Вызывается один раз после разбора всех блоков: данные разбора при этом освобождаются.
+        """
+        # словари углов больше не нужны, освобождаем их до сборки вершин
+        self.index = self.pairs = None
+        corners = numpy.concatenate(self.corners) if self.corners else numpy.zeros((0, 3), numpy.int32)
+        self.corners = []
+        attributes = []
+        for kind, arrays, columns in ((0, self.positions, 3), (1, self.uvs, 2), (2, self.normals, 3)):
+            values = numpy.concatenate(arrays) if arrays else numpy.zeros((0, columns), numpy.float32)
+            del arrays[:]
+            index = corners[:, kind]
+            # 0 - компоненты нет (у позиции она есть всегда)
+            if len(index) and (index.max() > len(values) or index.min() < (1 if kind == 0 else 0)):
+                raise ValueError("OBJ: %s index out of range" % ('v', 'vt', 'vn')[kind])
+            attributes.append(values)
+        positions, uvs, normals = attributes
+        for start in range(0, len(corners), size):
+            block = corners[start:start + size]
+            vertex_data = numpy.empty((len(block), COMPONENTS), numpy.float32)
+            vertex_data[:, 0:3] = positions[block[:, 0] - 1]
+            # без uv - (0, 0), без нормали - белый цвет
+            vertex_data[:, 3:5] = 0.0
+            vertex_data[:, 5:8] = 1.0
+            present = block[:, 1] > 0
+            vertex_data[present, 3:5] = uvs[block[present, 1] - 1]
+            present = block[:, 2] > 0
+            # нормаль [-1, 1] -> цвет [0, 1]
+            vertex_data[present, 5:8] = normals[block[present, 2] - 1] * 0.5 + 0.5
+            yield vertex_data
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """Блоки файла из целых строк: хвост незаконченной строки переносится в следующий блок"""
+    tail = b''
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            block = tail + block
+            end = block.rfind(b'\n') + 1
+            if end == 0:
+                tail = block
+                continue
+            tail = block[end:]
+            yield block[:end]
+    if tail.strip():
+        yield tail + b'\n'
+
+
+def parse(path, chunk_size=CHUNK_SIZE, write=None):
+    """Разбирает OBJ; индексы каждого блока передаются в write, иначе собираются в массив
+
+    Возвращает ObjParser после разбора, если задан write, иначе MeshData.
+    """
+    parser = ObjParser()
+    blocks = []
+    for chunk in read_chunks(path, chunk_size):
+        indices = parser.parse_chunk(chunk)
+        if write is not None:
+            write(indices)
+        else:
+            blocks.append(indices)
+    if write is not None:
+        return parser
+    indices = numpy.concatenate(blocks) if blocks else numpy.zeros(0, numpy.uint32)
+    vertex_data = list(parser.vertex_blocks())
+    vertex_data = numpy.concatenate(vertex_data) if vertex_data else numpy.zeros((0, COMPONENTS), numpy.float32)
+    return MeshData(vertex_data, indices)
+
+
+def convert(obj_path, mesh_path, chunk_size=CHUNK_SIZE):
+    """Переводит OBJ в файл кэша, индексы пишутся по мере разбора, вершины - блоками после него
+
+    Запись идет во временный файл, который затем заменяет целевой: файл не бывает недописанным.
+    """
+    tmp_path = "%s.%s.tmp" % (mesh_path, os.getpid())
+    index_offset = _align(HEADER.itemsize)
+    try:
+        _write(obj_path, tmp_path, index_offset, chunk_size)
+    except BaseException:
+        # недописанный файл не оставляем (например, в .meshcache при ошибке в OBJ)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, mesh_path)
+
+
+def _write(obj_path, path, index_offset, chunk_size):
+    """Индексы, затем вершины; заголовок пишется последним, когда известны размеры"""
+    with open(path, 'wb') as f:
+        f.seek(index_offset)
+        parser = parse(obj_path, chunk_size, lambda indices: f.write(indices.astype('<u4').tobytes()))
+        index_count = (f.tell() - index_offset) // 4
+        vertex_offset = _align(f.tell())
+        f.seek(vertex_offset)
+        vertex_count = 0
+        for vertex_data in parser.vertex_blocks():
+            f.write(vertex_data.astype('<f4').tobytes())
+            vertex_count += len(vertex_data)
+        header = numpy.zeros(1, HEADER)
+        header[0] = (MAGIC, VERSION, COMPONENTS, 0, vertex_count, index_count, index_offset, vertex_offset)
+        f.seek(0)
+        f.write(header.tobytes())
+
+
+def read(path):
+    """Открывает файл кэша через memmap, данные читаются с диска только при обращении"""
+    data = numpy.memmap(path, numpy.uint8, 'r')
+    header = data[:HEADER.itemsize].view(HEADER)[0]
+    if header['magic'] != MAGIC:
+        raise ValueError("%s is not a mesh file" % path)
+    if header['version'] != VERSION or header['components'] != COMPONENTS:
+        raise ValueError("%s: unsupported mesh version %s" % (path, header['version']))
+    index_offset, index_count = int(header['index_offset']), int(header['index_count'])
+    vertex_offset, vertex_count = int(header['vertex_offset']), int(header['vertex_count'])
+    if vertex_offset + vertex_count * COMPONENTS * 4 > len(data):
+        raise ValueError("%s: truncated mesh file" % path)
+    indices = data[index_offset:index_offset + index_count * 4].view('<u4')
+    vertex_data = data[vertex_offset:vertex_offset + vertex_count * COMPONENTS * 4].view('<f4')
+    return MeshData(vertex_data.reshape(vertex_count, COMPONENTS), indices, path)
+
+
+def mesh_cache_path(cache_dir, filename):
+    """Имя файла кэша: зависит от пути и времени изменения исходника"""
+    path = os.path.abspath(filename)
+    key = "%s|%s" % (path, os.path.getmtime(path))
+    name = "%s.%s.mesh" % (os.path.basename(path), hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+    return os.path.join(cache_dir, name)
+
+
+def load(filename, cache_dir=None, chunk_size=CHUNK_SIZE):
+    """Загружает модель: .mesh открывается как есть, OBJ разбирается (с cache_dir - один раз)"""
+    if filename.endswith('.mesh'):
+        return read(filename)
+    if cache_dir is None:
+        return parse(filename, chunk_size)
+    cache_path = mesh_cache_path(cache_dir, filename)
+    if not os.path.exists(cache_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        convert(filename, cache_path, chunk_size)
+    return read(cache_path)
+
+
+def load_buffer(filename, cache_dir=None):
+    """Модель в buffers.MeshBuffer (нужен контекст OpenGL), рисуется как куб: render_attribs"""
+    # OpenGL импортируется только здесь: разбор и кэш работают без него
+    from buffers import MeshBuffer
+
+    mesh = load(filename, cache_dir)
+    return MeshBuffer(mesh.vertex_data, mesh.indices).upload(), mesh
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('src', help='файл OBJ')
+    parser.add_argument('dst', help='файл .mesh')
+    parser.add_argument('--chunk-mb', type=float, default=CHUNK_SIZE / float(1 << 20), help='размер блока чтения в МБ')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    convert(args.src, args.dst, int(args.chunk_mb * (1 << 20)))
+    mesh = read(args.dst)
+    print("%s: %d vertices, %d triangles, %.1f MB, %.2f s" % (args.dst, len(mesh.vertex_data), len(mesh.indices) // 3,
+                                                              mesh.nbytes / float(1 << 20), time.perf_counter() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Профилировщик фаз кадра: вложенные замеры времени в кольцевом буфере
+
+    from profiling import profiler
+
+    profiler.enable('trace.json')  # по умолчанию выключен
+    with profiler.scope('Cube.render'):
+        ...
+    profiler.begin('events')
+    ...
+    profiler.end()
+
+Замеры пишутся в заранее выделенные массивы (кольцевой буфер на capacity записей), старые
+записи затираются новыми. Трассу можно открыть в chrome://tracing или https://ui.perfetto.dev
+(формат Chrome trace event), а summary дает среднее время фаз за последние кадры.
+Выключенный профилировщик стоит одну проверку флага: scope возвращает общий пустой объект.
+"""
+
+import atexit
+import json
+import time
+
+import numpy
+
+
+class NullScope(object):
+    """Пустой контекст для выключенного профилировщика"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_SCOPE = NullScope()
+
+
+class Scope(object):
+    """Контекст замера одной фазы, создается один раз на имя"""
+
+    __slots__ = ('profiler', 'name_id')
+
+    def __init__(self, profiler, name_id):
+        self.profiler = profiler
+        self.name_id = name_id
+
+    def __enter__(self):
+        self.profiler.stack.append((self.name_id, time.perf_counter()))
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.end()
+        return False
+
+
+class Profiler(object):
+    """Кольцевой буфер вложенных замеров (имя, глубина, кадр, начало, длительность)"""
+
+    def __init__(self, capacity=2 ** 16):
+        self.enabled = False
+        self.capacity = capacity
+        self.names = []  # id -> имя
+        self.ids = {}  # имя -> id
+        self.scopes = {}  # имя -> Scope
+        self.stack = []  # открытые замеры (id, начало)
+        self.name_ids = numpy.zeros(capacity, numpy.uint16)
+        self.depths = numpy.zeros(capacity, numpy.uint8)
+        self.frames = numpy.zeros(capacity, numpy.uint32)
+        self.starts = numpy.zeros(capacity, numpy.float64)
+        self.durations = numpy.zeros(capacity, numpy.float64)
+        self.count = 0  # всего записей (индекс в буфере - count % capacity)
+        self.frame = 0
+        self.origin = time.perf_counter()
+        self.trace_file = None
+
+    def enable(self, trace_file=None):
+        """Включает запись; если задан trace_file, трасса сохранится в него при выходе"""
+        self.enabled = True
+        if trace_file is not None and self.trace_file is None:
+            atexit.register(self.finish)
+        self.trace_file = trace_file
+
+    def finish(self):
+        """При выходе: сохраняем трассу и печатаем среднее время фаз"""
+        self.dump_chrome(self.trace_file)
+        print(self.report())
+
+    def disable(self):
+        self.enabled = False
+        del self.stack[:]
+
+    def name_id(self, name):
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def scope(self, name):
+        """Контекст with для замера фазы name"""
+        if not self.enabled:
+            return NULL_SCOPE
+        scope = self.scopes.get(name)
+        if scope is None:
+            scope = self.scopes[name] = Scope(self, self.name_id(name))
+        return scope
+
+    def begin(self, name):
+        if self.enabled:
+            self.stack.append((self.name_id(name), time.perf_counter()))
+
+    def end(self):
+        """Закрывает последний открытый замер и записывает его в буфер"""
+        if not self.stack:
+            return
+        end = time.perf_counter()
+        name_id, start = self.stack.pop()
+        i = self.count % self.capacity
+        self.name_ids[i] = name_id
+        self.depths[i] = len(self.stack)
+        self.frames[i] = self.frame
+        self.starts[i] = start - self.origin
+        self.durations[i] = end - start
+        self.count += 1
+
+    def next_frame(self):
+        if self.enabled:
+            self.frame += 1
+
+    def records(self):
+        """Индексы записей в буфере от старых к новым"""
+        if self.count <= self.capacity:
+            return numpy.arange(self.count)
+        return (numpy.arange(self.capacity) + self.count) % self.capacity
+
+    def summary(self, frames=60):
+        """Среднее время фаз за последние frames кадров: {имя: мс на кадр}"""
+        index = self.records()
+        index = index[self.frames[index] + frames > self.frame]
+        if not len(index):
+            return {}
+        count = max(len(numpy.unique(self.frames[index])), 1)
+        totals = numpy.bincount(self.name_ids[index], self.durations[index], len(self.names))
+        return dict((self.names[i], totals[i] * 1000.0 / count) for i in numpy.flatnonzero(totals))
+
+    def report(self, frames=60):
+        """Текст со средним временем фаз за последние кадры, по убыванию"""
+        summary = self.summary(frames)
+        return '\n'.join("%-24s %8.3f ms" % (name, ms) for name, ms in sorted(summary.items(), key=lambda x: -x[1]))
+
+    def dump_chrome(self, filename):
+        """Сохраняет буфер в формате Chrome trace event (события 'X' с микросекундами)"""
+        index = self.records()
+        events = [{'name': self.names[name_id], 'ph': 'X', 'pid': 0, 'tid': 0,
+                   'ts': start * 1e6, 'dur': duration * 1e6, 'args': {'frame': int(frame)}}
+                  for name_id, start, duration, frame in zip(self.name_ids[index].tolist(), self.starts[index].tolist(),
+                                                             self.durations[index].tolist(), self.frames[index])]
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+# общий профилировщик, чтобы не передавать его в каждый класс
+profiler = Profiler()
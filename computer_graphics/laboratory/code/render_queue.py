@@ -0,0 +1,187 @@
+"""
+Очередь отрисовки: сортировка по ключу состояния и пропуск повторных смен состояния OpenGL
+
+Если рисовать объекты в порядке обхода сцены, то перед каждым объектом заново включаются
+текстура, программа и т.д., даже если у соседних объектов они одинаковые. RenderQueue сначала
+собирает все объекты кадра, затем сортирует их по 64-битному ключу (одним numpy.argsort):
+    биты 48..63  программа (номер в порядке первого появления)
+    биты 32..47  текстура
+    биты 0..31   глубина в пространстве камеры, от ближних к дальним (меньше перерисовки пикселей)
+и рисует объекты подряд: состояние объекта (bind) устанавливается только при смене объекта,
+а GLState пропускает вызовы OpenGL, которые ничего не меняют, и считает их.
+
+Объект для очереди должен иметь:
+    program.id и texture (текстура кэша) или texture_id    для ключа сортировки
+    bind(state, camera)        установка программы, текстуры и общих uniform через GLState
+    draw(model)                отрисовка с матрицей модели
+"""
+
+from OpenGL.GL import *
+
+import numpy
+
+from camera import FAR
+
+
+PROGRAM_SHIFT = 48
+TEXTURE_SHIFT = 32
+DEPTH_MAX = 0xFFFFFFFF
+
+
+class GLState(object):
+    """Кэш текущего состояния OpenGL: вызов выполняется, только если значение меняется"""
+
+    def __init__(self):
+        self.current = {}
+        self.changes = 0  # выполненных вызовов
+        self.skipped = 0  # пропущенных повторных вызовов
+
+    def invalidate(self):
+        """Забываем состояние: его могли поменять в обход кэша (другой код, начало кадра)"""
+        self.current.clear()
+
+    def reset_counters(self):
+        self.changes = 0
+        self.skipped = 0
+
+    def set(self, key, value, function, *args):
+        if key in self.current and self.current[key] == value:
+            self.skipped += 1
+            return False
+        function(*args)
+        self.current[key] = value
+        self.changes += 1
+        return True
+
+    def use_program(self, program_id):
+        return self.set('program', program_id, glUseProgram, program_id)
+
+    def enable(self, cap):
+        return self.set(('enable', cap), True, glEnable, cap)
+
+    def disable(self, cap):
+        return self.set(('enable', cap), False, glDisable, cap)
+
+    def active_texture(self, unit):
+        return self.set('active_texture', unit, glActiveTexture, unit)
+
+    def bind_texture(self, target, texture_id):
+        """Привязка запоминается для текущего текстурного блока"""
+        key = ('texture', self.current.get('active_texture'), target)
+        return self.set(key, texture_id, glBindTexture, target, texture_id)
+
+    def matrix_mode(self, mode):
+        return self.set('matrix_mode', mode, glMatrixMode, mode)
+
+    def load_identity(self, mode):
+        """Единичная матрица в стеке mode, один раз до следующего invalidate"""
+        self.matrix_mode(mode)
+        return self.set(('identity', mode), True, glLoadIdentity)
+
+
+class RenderQueue(object):
+    """Объекты кадра с ключами сортировки в массивах numpy"""
+
+    def __init__(self, capacity=256):
+        self.count = 0
+        self.keys = numpy.zeros(capacity, numpy.uint64)
+        self.models = numpy.zeros((capacity, 4, 4), numpy.float32)
+        self.drawables = []
+        # номера в ключе раздаются заново каждый кадр, поэтому не копятся и не повторяются
+        self.program_slots = {}  # id программы -> номер в ключе
+        self.texture_slots = {}  # id текстуры -> номер в ключе
+        self.state = GLState()
+        self.draws = 0  # объектов нарисовано при последнем flush
+        self.binds = 0  # установок состояния объекта (bind) при последнем flush
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+        del self.drawables[:]
+        self.program_slots.clear()
+        self.texture_slots.clear()
+
+    def reserve(self, capacity):
+        if capacity <= len(self.keys):
+            return
+        size = len(self.keys) or 1
+        while size < capacity:
+            size *= 2
+        keys = numpy.zeros(size, numpy.uint64)
+        keys[:self.count] = self.keys[:self.count]
+        models = numpy.zeros((size, 4, 4), numpy.float32)
+        models[:self.count] = self.models[:self.count]
+        self.keys, self.models = keys, models
+
+    def slot(self, slots, object_id):
+        slot = slots.get(object_id)
+        if slot is None:
+            # больше 65536 разных id за кадр: лишние попадают в последний номер (хуже группировка, но не ошибка)
+            slot = slots[object_id] = min(len(slots), 0xFFFF)
+        return slot
+
+    def state_key(self, drawable):
+        """Старшие биты ключа: программа и текстура объекта"""
+        program = self.slot(self.program_slots, int(drawable.program.id))
+        # id текстуры из кэша меняется, когда заканчивается фоновая загрузка: берем текущий
+        texture = getattr(drawable, 'texture', None)
+        texture_id = texture.texture_id if texture is not None else drawable.texture_id
+        texture = self.slot(self.texture_slots, int(texture_id or 0))
+        return (program << PROGRAM_SHIFT) | (texture << TEXTURE_SHIFT)
+
+    def submit(self, drawables, models, view, far):
+        """Добавляет объекты drawables с матрицами моделей (N, 4, 4) для камеры с матрицей вида view"""
+        models = numpy.asarray(models, numpy.float32).reshape(-1, 4, 4)
+        start, stop = self.count, self.count + len(models)
+        self.reserve(stop)
+        self.models[start:stop] = models
+        self.drawables.extend(drawables)
+        # глубина центра объекта: -z в пространстве камеры, квантуется в 32 бита
+        depth = -(models[:, :, 3] @ numpy.asarray(view, numpy.float32)[2])
+        depth = (numpy.clip(depth / far, 0.0, 1.0) * DEPTH_MAX).astype(numpy.uint64)
+        state_keys = {}
+        for drawable in drawables:
+            if id(drawable) not in state_keys:
+                state_keys[id(drawable)] = self.state_key(drawable)
+        high = numpy.array([state_keys[id(drawable)] for drawable in drawables], numpy.uint64)
+        self.keys[start:stop] = high | depth
+        self.count = stop
+
+    def submit_scene(self, scene, indices, camera):
+        """Добавляет узлы сцены indices (None - все узлы с объектами)"""
+        if indices is None:
+            indices = scene.drawable_indices()
+        self.submit([scene.drawables[i] for i in indices.tolist()], scene.worlds[indices], camera.view,
+                    camera.state[FAR])
+
+    def order(self, sort=True):
+        """Порядок отрисовки: по ключу или в порядке добавления"""
+        if not sort:
+            return numpy.arange(self.count)
+        return numpy.argsort(self.keys[:self.count], kind='stable')
+
+    def flush(self, camera, sort=True):
+        """Рисует все объекты очереди и очищает ее"""
+        state = self.state
+        # состояние могли поменять вне очереди (оверлей, другие объекты), начинаем с чистого кэша
+        state.invalidate()
+        state.reset_counters()
+        self.binds = 0
+        previous = None
+        for i in self.order(sort).tolist():
+            drawable = self.drawables[i]
+            if drawable is not previous:
+                drawable.bind(state, camera)
+                previous = drawable
+                self.binds += 1
+            drawable.draw(self.models[i])
+        state.use_program(0)
+        self.draws = self.count
+        self.clear()
+
+    def counters(self):
+        """Статистика последнего flush для FrameStats|оверлея и замеров"""
+        return {'draws': self.draws, 'binds': self.binds, 'state_changes': self.state.changes,
+                'state_skipped': self.state.skipped}
@@ -0,0 +1,191 @@
+"""
+Граф сцены: узлы с локальным преобразованием (перенос, поворот, масштаб) и кэшированной мировой матрицей
+
+Вместо накопления поворотов в матрице драйвера (glRotatef каждый кадр) преобразование
+каждого объекта хранится явно, и его можно прочитать и переиспользовать.
+Данные всех узлов лежат в плоских массивах numpy (индекс узла - номер строки):
+    parents         индекс родителя, -1 у корней
+    translations    перенос (N, 3)
+    rotations       поворот кватернионом (w, x, y, z) (N, 4)
+    scales          масштаб (N, 3)
+    locals, worlds  локальная матрица T @ R @ S и мировая матрица родителя @ локальная (N, 4, 4)
+При изменении узел помечается (local_dirty). update пересчитывает локальные матрицы только
+помеченных узлов, распространяет пометку вниз по их поддеревьям и пересчитывает мировые
+матрицы по уровням глубины: на каждом уровне один векторный numpy.matmul для всех помеченных
+узлов, родители которых уже посчитаны на предыдущем уровне.
+"""
+
+import numpy
+
+import transforms
+
+
+class Node(object):
+    """Ссылка на узел сцены: данные хранятся в массивах Scene, здесь только индекс"""
+
+    __slots__ = ('scene', 'index')
+
+    def __init__(self, scene, index):
+        self.scene = scene
+        self.index = index
+
+    def add(self, **kwargs):
+        """Добавляет дочерний узел (параметры как у Scene.add)"""
+        return self.scene.add(parent=self, **kwargs)
+
+    @property
+    def parent(self):
+        parent = self.scene.parents[self.index]
+        return None if parent < 0 else Node(self.scene, parent)
+
+    @property
+    def drawable(self):
+        return self.scene.drawables[self.index]
+
+    @property
+    def translation(self):
+        return self.scene.translations[self.index]
+
+    @property
+    def world(self):
+        """Мировая матрица на момент последнего Scene.update"""
+        return self.scene.worlds[self.index]
+
+    def set_translation(self, x, y, z):
+        self.scene.translations[self.index] = (x, y, z)
+        self.scene.local_dirty[self.index] = True
+
+    def set_rotation(self, angle, x, y, z):
+        """Поворот на angle градусов вокруг оси (x, y, z), как glRotatef, но не накапливается"""
+        self.scene.rotations[self.index] = transforms.quaternion_batch(angle, (x, y, z))
+        self.scene.local_dirty[self.index] = True
+
+    def set_scale(self, x, y, z):
+        self.scene.scales[self.index] = (x, y, z)
+        self.scene.local_dirty[self.index] = True
+
+
+class Scene(object):
+    """Дерево узлов в плоских массивах с пересчетом мировых матриц по уровням"""
+
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.parents = numpy.full(capacity, -1, numpy.int32)
+        self.depths = numpy.zeros(capacity, numpy.int32)
+        self.translations = numpy.zeros((capacity, 3), numpy.float32)
+        self.rotations = numpy.zeros((capacity, 4), numpy.float32)
+        self.rotations[:, 0] = 1.0
+        self.scales = numpy.ones((capacity, 3), numpy.float32)
+        self.locals = numpy.zeros((capacity, 4, 4), numpy.float32)
+        self.worlds = numpy.zeros((capacity, 4, 4), numpy.float32)
+        self.local_dirty = numpy.zeros(capacity, bool)
+        self.drawables = []  # объект для отрисовки каждого узла или None
+        self.levels = None  # индексы узлов по глубине, пересобираются при изменении дерева
+        self.drawable_nodes = None  # индексы узлов с объектами для отрисовки
+        self.updated = 0  # сколько мировых матриц пересчитано последним update
+        self.version = 0  # увеличивается, когда update меняет мировые матрицы
+        self.structure_version = 0  # увеличивается при добавлении узлов
+
+    def __len__(self):
+        return self.count
+
+    def reserve(self, capacity):
+        """Увеличивает емкость массивов (вдвое, пока не хватит)"""
+        if capacity <= len(self.parents):
+            return
+        size = len(self.parents) or 1
+        while size < capacity:
+            size *= 2
+        for name, fill in (('parents', -1), ('depths', 0), ('translations', 0), ('rotations', None),
+                           ('scales', 1), ('locals', 0), ('worlds', 0), ('local_dirty', False)):
+            old = getattr(self, name)
+            new = numpy.empty((size,) + old.shape[1:], old.dtype)
+            new[:self.count] = old[:self.count]
+            if fill is None:
+                new[self.count:] = (1.0, 0.0, 0.0, 0.0)
+            else:
+                new[self.count:] = fill
+            setattr(self, name, new)
+
+    def add(self, parent=None, translation=(0, 0, 0), rotation=None, scale=(1, 1, 1), drawable=None):
+        """Добавляет узел, rotation - (угол, x, y, z) как у glRotatef; возвращает Node"""
+        node = self.add_many(1, parent, translation, scales=scale, drawable=drawable)[0]
+        if rotation is not None:
+            node.set_rotation(*rotation)
+        return node
+
+    def add_many(self, count, parent=None, translations=(0, 0, 0), rotations=None, scales=(1, 1, 1), drawable=None):
+        """Добавляет count узлов с общим родителем, rotations - кватернионы (count, 4); возвращает [Node]
+
+        drawable - общий объект для всех узлов или список из count объектов, по одному на узел
+        """
+        start, stop = self.count, self.count + count
+        self.reserve(stop)
+        parent_index = -1 if parent is None else parent.index
+        self.parents[start:stop] = parent_index
+        self.depths[start:stop] = 0 if parent is None else self.depths[parent_index] + 1
+        self.translations[start:stop] = translations
+        if rotations is not None:
+            self.rotations[start:stop] = rotations
+        self.scales[start:stop] = scales
+        self.local_dirty[start:stop] = True
+        self.drawables.extend(drawable if isinstance(drawable, list) else [drawable] * count)
+        self.count = stop
+        self.levels = None
+        self.drawable_nodes = None
+        self.structure_version += 1
+        return [Node(self, index) for index in range(start, stop)]
+
+    def mark_dirty(self, indices):
+        """Помечает узлы после прямой записи в массивы translations|rotations|scales"""
+        self.local_dirty[indices] = True
+
+    def build_levels(self):
+        """Группирует узлы по глубине: уровень d считается после уровня d - 1"""
+        depths = self.depths[:self.count]
+        order = numpy.argsort(depths, kind='stable').astype(numpy.int32)
+        bounds = numpy.cumsum(numpy.bincount(depths))[:-1]
+        self.levels = numpy.split(order, bounds)
+        self.drawable_nodes = numpy.array([i for i, drawable in enumerate(self.drawables) if drawable is not None],
+                                          numpy.int32)
+
+    def update(self):
+        """Пересчитывает матрицы измененных узлов и их потомков, возвращает True, если что-то изменилось"""
+        if self.levels is None:
+            self.build_levels()
+        count = self.count
+        self.updated = 0
+        changed = numpy.flatnonzero(self.local_dirty[:count])
+        if not len(changed):
+            return False
+        self.locals[changed] = transforms.trs_batch(self.translations[changed], self.rotations[changed],
+                                                    self.scales[changed])
+        # пометка "мировая матрица устарела": свои изменения и изменения предков
+        dirty = self.local_dirty[:count].copy()
+        for depth, nodes in enumerate(self.levels):
+            if depth > 0:
+                dirty[nodes] |= dirty[self.parents[nodes]]
+            nodes = nodes[dirty[nodes]]
+            if not len(nodes):
+                continue
+            if depth == 0:
+                self.worlds[nodes] = self.locals[nodes]
+            else:
+                self.worlds[nodes] = numpy.matmul(self.worlds[self.parents[nodes]], self.locals[nodes])
+            self.updated += len(nodes)
+        self.local_dirty[:count] = False
+        self.version += 1
+        return True
+
+    def drawable_indices(self):
+        """Индексы узлов с объектами для отрисовки"""
+        if self.drawable_nodes is None:
+            self.build_levels()
+        return self.drawable_nodes
+
+    def items(self, indices=None):
+        """Пары (объект для отрисовки, мировая матрица) для узлов indices (по умолчанию всех с объектами)"""
+        if indices is None:
+            indices = self.drawable_indices()
+        for index in indices.tolist():
+            yield self.drawables[index], self.worlds[index]
@@ -0,0 +1,470 @@
+"""
+Кэш шейдерных программ
+
+Программа определяется исходниками и типами шейдеров: для одинакового набора
+компиляция и линковка выполняются один раз за запуск (ключ - sha1 от типов и исходников).
+Если драйвер поддерживает GL_ARB_get_program_binary (или OpenGL 4.1), слинкованная программа
+сохраняется на диск и при следующем запуске загружается через glProgramBinary без компиляции.
+
+Program - обертка над программой: после линковки один раз запрашивает расположение
+всех активных uniform и атрибутов, а при установке uniform пропускает вызов glUniform*,
+если значение не изменилось.
+
+ReloadableProgram - программа, которая пересобирается при изменении файлов шейдеров
+(ShaderWatcher следит за ними в фоновом потоке), без перезапуска приложения.
+"""
+
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from OpenGL.GL import *
+
+import numpy
+
+
+def compile_shader(source, type=GL_VERTEX_SHADER):
+    """Компилирует шейдер из исходника, при ошибке бросает RuntimeError с логом драйвера"""
+    shader = glCreateShader(type)
+    glShaderSource(shader, source)
+    glCompileShader(shader)
+    if glGetShaderiv(shader, GL_COMPILE_STATUS) != GL_TRUE:
+        log = glGetShaderInfoLog(shader)
+        glDeleteShader(shader)
+        raise RuntimeError(log)
+    return shader
+
+
+def link_program(shaders, retrievable=False):
+    """Создает программу и линкует шейдеры
+
+    retrievable - попросить драйвер сохранить бинарный код программы (glGetProgramBinary)
+    """
+    program = glCreateProgram()
+    if retrievable:
+        glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+    for shader in shaders:
+        glAttachShader(program, shader)
+    glLinkProgram(program)
+    if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+        log = glGetProgramInfoLog(program)
+        glDeleteProgram(program)
+        raise RuntimeError(log)
+    return program
+
+
+def read_sources(files):
+    """[(путь, тип), ...] -> [(исходник, тип), ...]"""
+    sources = []
+    for path, type in files:
+        with open(path) as f:
+            sources.append((f.read(), type))
+    return sources
+
+
+def program_key(sources):
+    """Ключ программы: sha1 от типов и исходников всех шейдеров"""
+    digest = hashlib.sha1()
+    for source, type in sources:
+        digest.update(str(int(type)).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(source.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def binary_supported():
+    """Можно ли получить бинарный код программы у текущего драйвера"""
+    try:
+        version = tuple(int(x) for x in glGetString(GL_VERSION).split()[0].split(b'.')[:2])
+        extensions = glGetString(GL_EXTENSIONS) or b''
+    except Exception:
+        return False
+    if version < (4, 1) and b'GL_ARB_get_program_binary' not in extensions.split():
+        return False
+    return int(glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS)) > 0
+
+
+# тип uniform -> (функция установки, количество компонент)
+UNIFORM_SETTERS = {
+    GL_FLOAT: (glUniform1f, 1),
+    GL_FLOAT_VEC2: (glUniform2f, 2),
+    GL_FLOAT_VEC3: (glUniform3f, 3),
+    GL_FLOAT_VEC4: (glUniform4f, 4),
+    GL_INT: (glUniform1i, 1),
+    GL_INT_VEC2: (glUniform2i, 2),
+    GL_INT_VEC3: (glUniform3i, 3),
+    GL_INT_VEC4: (glUniform4i, 4),
+    GL_BOOL: (glUniform1i, 1),
+    GL_SAMPLER_2D: (glUniform1i, 1),
+    GL_SAMPLER_2D_ARRAY: (glUniform1i, 1),
+}
+UNIFORM_MATRICES = {
+    GL_FLOAT_MAT3: glUniformMatrix3fv,
+    GL_FLOAT_MAT4: glUniformMatrix4fv,
+}
+
+
+class Program(object):
+    """Слинкованная программа с заранее найденными uniform и атрибутами"""
+
+    def __init__(self, program_id):
+        self.id = program_id
+        self.uniforms = {}  # имя -> (location, тип)
+        self.attributes = {}  # имя -> location
+        self.values = {}  # имя -> последнее установленное значение
+        self.updates = 0  # сколько раз вызывался glUniform*
+        self.skipped = 0  # сколько вызовов пропущено, т.к. значение не менялось
+        self.refs = 0  # сколько раз программа выдана из ProgramCache и не возвращена (release)
+        self.reflect()
+
+    def reflect(self):
+        """Запрашиваем у драйвера все активные uniform и атрибуты (один раз после линковки)"""
+        for i in range(glGetProgramiv(self.id, GL_ACTIVE_UNIFORMS)):
+            name, size, type = glGetActiveUniform(self.id, i)
+            name = name.decode('utf-8')
+            if name.startswith('gl_'):
+                # встроенные переменные (gl_ModelViewProjectionMatrix) задаются через фиксированный конвейер
+                continue
+            if name.endswith('[0]'):
+                name = name[:-3]
+            self.uniforms[name] = (glGetUniformLocation(self.id, name), int(type))
+        for i in range(glGetProgramiv(self.id, GL_ACTIVE_ATTRIBUTES)):
+            name, size, type = glGetActiveAttrib(self.id, i)
+            name = name.decode('utf-8')
+            if name.startswith('gl_'):
+                continue
+            self.attributes[name] = glGetAttribLocation(self.id, name)
+
+    def use(self):
+        glUseProgram(self.id)
+
+    def uniform(self, name):
+        """Расположение uniform, -1 если его нет (например, компилятор его выкинул)"""
+        return self.uniforms.get(name, (-1, None))[0]
+
+    def attrib(self, name):
+        """Расположение атрибута, -1 если его нет"""
+        return self.attributes.get(name, -1)
+
+    def set(self, name, *values):
+        """Устанавливает uniform по имени, программа должна быть активна (use)
+
+        Функция glUniform* выбирается по типу uniform. Для матриц передается один
+        массив 3x3|4x4 (по строкам, как в numpy). Неизвестные имена пропускаются.
+        """
+        location, type = self.uniforms.get(name, (-1, None))
+        if location < 0:
+            return False
+        if type in UNIFORM_MATRICES:
+            value = numpy.array(values[0], numpy.float32)
+            previous = self.values.get(name)
+            if previous is not None and numpy.array_equal(previous, value):
+                self.skipped += 1
+                return False
+            # в numpy матрицы по строкам, OpenGL ждет по столбцам - просим транспонировать
+            UNIFORM_MATRICES[type](location, 1, GL_TRUE, value)
+        else:
+            value = tuple(values)
+            if self.values.get(name) == value:
+                self.skipped += 1
+                return False
+            if type not in UNIFORM_SETTERS:
+                raise ValueError("uniform %s has unsupported type 0x%04x" % (name, type))
+            setter, count = UNIFORM_SETTERS[type]
+            if len(value) != count:
+                raise ValueError("uniform %s expects %s values, got %s" % (name, count, len(value)))
+            setter(location, *value)
+        self.values[name] = value
+        self.updates += 1
+        return True
+
+
+class ProgramCache(object):
+    """Кэш слинкованных программ в памяти и (опционально) на диске"""
+
+    def __init__(self, binary_dir=None):
+        """binary_dir - каталог для бинарного кэша программ (None - только в памяти)"""
+        self.binary_dir = binary_dir
+        self.programs = {}  # ключ -> Program
+        self.hits = 0
+        self.compiled = 0  # программ, собранных из исходников
+        self.binary_loaded = 0  # программ, загруженных с диска
+        self._binary = None  # поддержка бинарного кэша, проверяется при первом обращении
+        self._driver = None
+
+    def load(self, files):
+        """Программа из файлов [(путь, тип), ...], например [('vertex.glsl', GL_VERTEX_SHADER), ...]"""
+        return self.get(read_sources(files))
+
+    def get(self, sources):
+        """Программа (Program) из исходников [(исходник, тип), ...]: из кэша или собирается заново
+
+        Каждый вызов берет ссылку на программу, ненужную программу можно вернуть через release.
+        """
+        key = program_key(sources)
+        program = self.programs.get(key)
+        if program is not None:
+            self.hits += 1
+        else:
+            program_id = self.load_binary(key)
+            if program_id is None:
+                program_id = self.build(key, sources)
+            program = self.programs[key] = Program(program_id)
+        program.refs += 1
+        return program
+
+    def release(self, program):
+        """Возвращает ссылку на программу; программа без ссылок удаляется из кэша и из OpenGL"""
+        if program.refs > 0:
+            program.refs -= 1
+        if program.refs > 0:
+            return
+        for key in [key for key, cached in self.programs.items() if cached is program]:
+            del self.programs[key]
+            glDeleteProgram(program.id)
+
+    def build(self, key, sources):
+        """Компилирует и линкует программу, сохраняет ее бинарный код на диск"""
+        shaders = [compile_shader(source, type) for source, type in sources]
+        try:
+            program = link_program(shaders, retrievable=self.use_binary())
+        finally:
+            # после линковки шейдеры программе больше не нужны
+            for shader in shaders:
+                glDeleteShader(shader)
+        self.compiled += 1
+        self.save_binary(key, program)
+        return program
+
+    def use_binary(self):
+        if self.binary_dir is None:
+            return False
+        if self._binary is None:
+            self._binary = binary_supported()
+        return self._binary
+
+    def binary_path(self, key):
+        """Бинарный код зависит от драйвера, поэтому он тоже входит в имя файла"""
+        if self._driver is None:
+            driver = b'|'.join(glGetString(name) or b'' for name in (GL_VENDOR, GL_RENDERER, GL_VERSION))
+            self._driver = hashlib.sha1(driver).hexdigest()[:16]
+        return os.path.join(self.binary_dir, "%s.%s.bin" % (key, self._driver))
+
+    def load_binary(self, key):
+        """Загружает программу из бинарного кэша, None если его нет или драйвер его не принял"""
+        if not self.use_binary():
+            return None
+        path = self.binary_path(key)
+        if not os.path.exists(path):
+            return None
+        data = numpy.fromfile(path, numpy.uint8)
+        binary_format = int(data[:4].view(numpy.uint32)[0])
+        binary = data[4:]
+        program = glCreateProgram()
+        glProgramBinary(program, binary_format, binary, len(binary))
+        if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+            # драйвер обновился или файл испорчен: собираем из исходников
+            glDeleteProgram(program)
+            os.remove(path)
+            return None
+        self.binary_loaded += 1
+        return program
+
+    def save_binary(self, key, program):
+        """Сохраняет бинарный код программы: 4 байта формата и сами данные"""
+        if not self.use_binary():
+            return
+        size = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if size <= 0:
+            return
+        length = numpy.zeros(1, numpy.int32)
+        binary_format = numpy.zeros(1, numpy.uint32)
+        binary = numpy.zeros(size, numpy.uint8)
+        glGetProgramBinary(program, size, length, binary_format, binary)
+        os.makedirs(self.binary_dir, exist_ok=True)
+        path = self.binary_path(key)
+        tmp_path = "%s.%s.tmp" % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(binary_format.tobytes())
+            f.write(binary[:int(length[0])].tobytes())
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        """Удаляет все программы из памяти (файлы на диске остаются)"""
+        for program in self.programs.values():
+            glDeleteProgram(program.id)
+        self.programs.clear()
+
+
+# флаги inotify (см. man inotify)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len, далее имя файла
+
+
+def _inotify_init(dirs):
+    """Дескриптор inotify, следящий за каталогами, или None, если inotify недоступен"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(0)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    for path in dirs:
+        if libc.inotify_add_watch(fd, path.encode('utf-8'), mask) < 0:
+            os.close(fd)
+            return None
+    return fd
+
+
+class ShaderWatcher(object):
+    """Следит за изменением файлов в фоновом потоке
+
+    На Linux используется inotify (поток спит, пока файлы не изменятся), иначе раз в interval
+    секунд сравниваются времена изменения (os.stat). При изменении в фоновом потоке вызывается
+    callback(пути измененных файлов).
+    """
+
+    def __init__(self, paths, callback, interval=0.25, use_inotify=True):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.callback = callback
+        self.interval = interval
+        self.use_inotify = use_inotify
+        self.mtimes = {path: self.mtime(path) for path in self.paths}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='ShaderWatcher', daemon=True)
+
+    @staticmethod
+    def mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        fd = None
+        if self.use_inotify:
+            fd = _inotify_init(sorted(set(os.path.dirname(path) for path in self.paths)))
+        try:
+            while not self.stopped.is_set():
+                if fd is not None:
+                    # ждем событий, но не дольше interval, чтобы заметить stop
+                    if not select.select([fd], [], [], self.interval)[0]:
+                        continue
+                    os.read(fd, 64 * 1024)
+                    # редакторы пишут файл в несколько приемов, даем им закончить
+                    time.sleep(0.05)
+                else:
+                    time.sleep(self.interval)
+                changed = self.check()
+                if changed:
+                    self.callback(changed)
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def check(self):
+        """Список файлов, время изменения которых отличается от запомненного"""
+        changed = []
+        for path in self.paths:
+            mtime = self.mtime(path)
+            if mtime is not None and mtime != self.mtimes[path]:
+                self.mtimes[path] = mtime
+                changed.append(path)
+        return changed
+
+
+class ReloadableProgram(object):
+    """Программа, которая пересобирается при изменении файлов шейдеров
+
+    Исходники читаются в фоновом потоке наблюдателя, а компиляция (вызовы OpenGL) выполняется
+    в update, который вызывается в основном потоке перед отрисовкой. Новая программа подменяет
+    старую целиком; при ошибке компиляции остается старая, а лог драйвера выводится в консоль.
+    """
+
+    def __init__(self, files, cache=None, watch=True):
+        """files - [(путь, тип), ...], cache - ProgramCache (необязательно)"""
+        self.files = list(files)
+        self.cache = cache
+        self.program = self.build(read_sources(self.files))
+        self.pending = None  # исходники, прочитанные наблюдателем и ожидающие компиляции
+        self.lock = threading.Lock()  # pending пишет поток наблюдателя, забирает update
+        self.reloads = 0
+        self.errors = 0
+        self.watcher = None
+        if watch:
+            self.watcher = ShaderWatcher([path for path, type in self.files], self.changed).start()
+
+    def build(self, sources):
+        if self.cache is not None:
+            return self.cache.get(sources)
+        shaders = [compile_shader(source, type) for source, type in sources]
+        try:
+            return Program(link_program(shaders))
+        finally:
+            for shader in shaders:
+                glDeleteShader(shader)
+
+    def changed(self, paths):
+        """Вызывается в потоке наблюдателя: читаем исходники заранее"""
+        try:
+            sources = read_sources(self.files)
+        except OSError as err:
+            print("shader reload: %s" % err)
+            return
+        with self.lock:
+            self.pending = sources
+
+    def update(self):
+        """Пересобирает программу, если файлы изменились, и возвращает текущую (Program)"""
+        with self.lock:
+            sources, self.pending = self.pending, None
+        if sources is None:
+            return self.program
+        try:
+            program = self.build(sources)
+        except RuntimeError as err:
+            self.errors += 1
+            log = err.args[0]
+            print("shader reload failed, keeping previous program:\n%s" % (
+                log.decode('utf-8', 'replace') if isinstance(log, bytes) else log))
+            return self.program
+        # переносим значения uniform, установленные в старой программе (например, resolution)
+        program.use()
+        for name, value in self.program.values.items():
+            if name in program.uniforms:
+                program.set(name, *(value if isinstance(value, tuple) else (value,)))
+        glUseProgram(0)
+        if self.cache is not None:
+            # старую программу могут использовать другие владельцы кэша, удаляется без последней ссылки
+            self.cache.release(self.program)
+        else:
+            # без кэша старой программой больше никто не владеет
+            glDeleteProgram(self.program.id)
+        self.program = program
+        self.reloads += 1
+        return program
+
+    def stop(self):
+        if self.watcher is not None:
+            self.watcher.stop()
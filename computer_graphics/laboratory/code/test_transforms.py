@@ -0,0 +1,137 @@
+"""
+Проверка transforms без контекста OpenGL: сравнение с формулами gluPerspective|gluLookAt|glRotatef
+
+Запуск:
+    python -m pytest test_transforms.py
+    python -m unittest test_transforms
+"""
+
+import math
+import unittest
+
+import numpy
+
+import transforms
+
+
+def glu_perspective(fov, aspect, near, far):
+    """Матрица из описания gluPerspective"""
+    f = 1.0 / math.tan(math.radians(fov) / 2.0)
+    return numpy.array((
+        (f / aspect, 0, 0, 0),
+        (0, f, 0, 0),
+        (0, 0, (far + near) / (near - far), 2.0 * far * near / (near - far)),
+        (0, 0, -1, 0),
+    ))
+
+
+def glu_look_at(eye, center, up):
+    """Матрица из описания gluLookAt: поворот базиса s, u, -f и перенос на -eye"""
+    f = numpy.subtract(center, eye, dtype=numpy.float64)
+    f /= numpy.linalg.norm(f)
+    up = numpy.asarray(up, numpy.float64) / numpy.linalg.norm(up)
+    s = numpy.cross(f, up)
+    u = numpy.cross(s / numpy.linalg.norm(s), f)
+    m = numpy.identity(4)
+    m[0, :3], m[1, :3], m[2, :3] = s / numpy.linalg.norm(s), u, -f
+    t = numpy.identity(4)
+    t[:3, 3] = numpy.negative(eye)
+    return m @ t
+
+
+def gl_rotate(angle, x, y, z):
+    """Матрица из описания glRotatef через формулу Родрига: c * I + s * [k]x + (1 - c) * k k^T"""
+    k = numpy.array((x, y, z), numpy.float64)
+    k /= numpy.linalg.norm(k)
+    c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    cross = numpy.array(((0, -k[2], k[1]), (k[2], 0, -k[0]), (-k[1], k[0], 0)))
+    m = numpy.identity(4)
+    m[:3, :3] = c * numpy.identity(3) + s * cross + (1 - c) * numpy.outer(k, k)
+    return m
+
+
+class TestTransforms(unittest.TestCase):
+
+    def assertMatrix(self, actual, expected, atol=1e-5):
+        self.assertEqual(actual.dtype, numpy.float32)
+        numpy.testing.assert_allclose(actual, expected, rtol=1e-5, atol=atol)
+
+    def test_perspective(self):
+        for fov, aspect, near, far in ((45, 4 / 3.0, 0.1, 100), (90, 1, 1, 10), (30, 0.5, 0.01, 1000)):
+            self.assertMatrix(transforms.perspective(fov, aspect, near, far), glu_perspective(fov, aspect, near, far),
+                              atol=1e-4)
+
+    def test_look_at(self):
+        for eye, center, up in (((0, 0, 5), (0, 0, 0), (0, 1, 0)), ((3, -2, 7), (1, 1, 1), (0, 0, 2)),
+                                ((-4, 5, 1), (0, 0.5, 0), (1, 1, 0))):
+            m = transforms.look_at(eye, center, up)
+            self.assertMatrix(m, glu_look_at(eye, center, up))
+            # точка взгляда попадает на отрицательную ось z камеры
+            point = m @ numpy.append(center, 1.0)
+            numpy.testing.assert_allclose(point[:2], 0, atol=1e-5)
+            self.assertLess(point[2], 0)
+
+    def test_rotate(self):
+        for angle, axis in ((90, (0, 0, 1)), (-30, (1, 0, 0)), (123, (1, 2, 3)), (0, (0, 1, 0))):
+            self.assertMatrix(transforms.rotate(angle, *axis), gl_rotate(angle, *axis))
+        numpy.testing.assert_allclose(transforms.rotate(90, 0, 0, 1) @ (1, 0, 0, 1), (0, 1, 0, 1), atol=1e-6)
+
+    def test_translate_scale(self):
+        self.assertMatrix(transforms.translate(1, 2, 3) @ numpy.array((1, 1, 1, 1), numpy.float32), [2, 3, 4, 1])
+        self.assertMatrix(transforms.scale(2, 3, 4) @ numpy.array((1, 1, 1, 1), numpy.float32), [2, 3, 4, 1])
+
+    def test_matrix_stack(self):
+        stack = transforms.MatrixStack()
+        stack.translate(1, 2, 3)
+        stack.push()
+        stack.rotate(45, 0, 1, 0)
+        stack.scale(2, 2, 2)
+        # как в OpenGL: каждая операция умножает текущую матрицу справа
+        expected = gl_rotate(45, 0, 1, 0)
+        expected[:3, :3] *= 2
+        expected[:3, 3] = (1, 2, 3)
+        self.assertMatrix(stack.top, expected)
+        stack.pop()
+        self.assertMatrix(stack.top, transforms.translate(1, 2, 3))
+        stack.load_identity()
+        self.assertMatrix(stack.top, numpy.identity(4))
+        with self.assertRaises(IndexError):
+            stack.pop()
+
+    def test_rotate_batch(self):
+        angles = numpy.array((0, 30, -45, 90, 270.5))
+        axes = numpy.array(((1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (-1, 2, 3)))
+        batch = transforms.rotate_batch(angles, axes)
+        self.assertEqual(batch.shape, (len(angles), 4, 4))
+        for m, angle, axis in zip(batch, angles, axes):
+            self.assertMatrix(m, transforms.rotate(angle, *axis))
+        # одна ось на все углы
+        for m, angle in zip(transforms.rotate_batch(angles, (0, 0, 1)), angles):
+            self.assertMatrix(m, transforms.rotate(angle, 0, 0, 1))
+
+    def test_trs_batch(self):
+        rng = numpy.random.RandomState(0)
+        count = 16
+        angles = rng.uniform(-360, 360, count)
+        axes = rng.uniform(-1, 1, (count, 3))
+        translations = rng.uniform(-10, 10, (count, 3))
+        scales = rng.uniform(0.1, 3, (count, 3))
+        quaternions = transforms.quaternion_batch(angles, axes)
+        numpy.testing.assert_allclose(numpy.linalg.norm(quaternions, axis=1), 1, rtol=1e-6)
+        batch = transforms.trs_batch(translations, quaternions, scales)
+        for m, t, angle, axis, s in zip(batch, translations, angles, axes, scales):
+            expected = transforms.translate(*t) @ transforms.rotate(angle, *axis) @ transforms.scale(*s)
+            self.assertMatrix(m, expected, atol=1e-4)
+
+    def test_perspective_look_at_batch(self):
+        fov = numpy.array((30, 60, 90))
+        for m, f in zip(transforms.perspective_batch(fov, 1.5, 0.1, 50), fov):
+            self.assertMatrix(m, transforms.perspective(f, 1.5, 0.1, 50))
+        eye = numpy.array(((0, 0, 5), (3, -2, 7), (-4, 5, 1)), numpy.float64)
+        target = numpy.array(((0, 0, 0), (1, 1, 1), (0, 0.5, 0)), numpy.float64)
+        for m, e, t in zip(transforms.look_at_batch(eye, target, (0, 1, 0)), eye, target):
+            self.assertMatrix(m, transforms.look_at(e, t, (0, 1, 0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""
+Текст поверх сцены: атлас глифов в одной текстуре и четырехугольники на каждый символ
+
+Глифы ASCII рисуются pygame.font один раз и складываются в одну текстуру (GlyphAtlas).
+TextOverlay пересобирает массивы вершин только при смене текста, а рисует их каждый кадр
+одним glDrawArrays в экранных координатах (glOrtho), сохраняя и восстанавливая состояние OpenGL.
+"""
+
+import numpy
+import pygame
+
+from OpenGL.GL import *
+
+
+class GlyphAtlas(object):
+    """Текстура с глифами символов FIRST..LAST-1"""
+
+    FIRST = 32
+    LAST = 127
+    COLUMNS = 16
+
+    def __init__(self, size=16, font=None):
+        """font - файл шрифта, None - встроенный шрифт pygame"""
+        pygame.font.init()
+        font = pygame.font.Font(font, size)
+        glyphs = [font.render(chr(code), True, (255, 255, 255)) for code in range(self.FIRST, self.LAST)]
+        self.cell_w = max(glyph.get_width() for glyph in glyphs)
+        self.cell_h = font.get_linesize()
+        rows = (len(glyphs) + self.COLUMNS - 1) // self.COLUMNS
+        self.width = self.COLUMNS * self.cell_w
+        self.height = rows * self.cell_h
+        atlas = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+        atlas.fill((0, 0, 0, 0))
+        # прямоугольник глифа в пикселях атласа: x, y, ширина, высота
+        self.rects = numpy.zeros((len(glyphs), 4), numpy.float32)
+        for i, glyph in enumerate(glyphs):
+            x, y = (i % self.COLUMNS) * self.cell_w, (i // self.COLUMNS) * self.cell_h
+            atlas.blit(glyph, (x, y))
+            self.rects[i] = (x, y, glyph.get_width(), glyph.get_height())
+        self.advances = self.rects[:, 2]
+
+        # строки атласа не переворачиваем: v считается сверху вниз, как и y экрана в glOrtho ниже
+        data = pygame.image.tostring(atlas, 'RGBA')
+        self.texture_id = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture_id)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.width, self.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, data)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def indices(self, text):
+        """Номера глифов строки, неизвестные символы заменяются на '?'"""
+        codes = numpy.frombuffer(text.encode('ascii', 'replace'), numpy.uint8).astype(numpy.int32)
+        codes[(codes < self.FIRST) | (codes >= self.LAST)] = ord('?')
+        return codes - self.FIRST
+
+    def delete(self):
+        glDeleteTextures([self.texture_id])
+
+
+class TextOverlay(object):
+    """Многострочный текст в левом верхнем углу экрана"""
+
+    def __init__(self, atlas=None, x=8, y=8, color=(1.0, 1.0, 0.2, 1.0)):
+        self.atlas = GlyphAtlas() if atlas is None else atlas
+        self.x = x
+        self.y = y
+        self.color = color
+        self.text = None
+        self.vertices = numpy.zeros((0, 2), numpy.float32)
+        self.uvs = numpy.zeros((0, 2), numpy.float32)
+        self.rebuilds = 0
+
+    def set_text(self, text):
+        """Пересобирает вершины, только если текст изменился"""
+        if text == self.text:
+            return
+        self.text = text
+        self.rebuilds += 1
+        atlas = self.atlas
+        vertices, uvs = [], []
+        for row, line in enumerate(text.split('\n')):
+            if not line:
+                continue
+            index = atlas.indices(line)
+            rects = atlas.rects[index]
+            x0 = self.x + numpy.concatenate(([0], numpy.cumsum(atlas.advances[index])[:-1]))
+            y0 = numpy.full(len(index), self.y + row * atlas.cell_h, numpy.float32)
+            x1, y1 = x0 + rects[:, 2], y0 + rects[:, 3]
+            u0, v0 = rects[:, 0] / atlas.width, rects[:, 1] / atlas.height
+            u1, v1 = (rects[:, 0] + rects[:, 2]) / atlas.width, (rects[:, 1] + rects[:, 3]) / atlas.height
+            # четыре вершины на символ, по часовой стрелке от левого верхнего угла
+            vertices.append(numpy.stack((x0, y0, x1, y0, x1, y1, x0, y1), 1).reshape(-1, 2))
+            uvs.append(numpy.stack((u0, v0, u1, v0, u1, v1, u0, v1), 1).reshape(-1, 2))
+        if vertices:
+            self.vertices = numpy.ascontiguousarray(numpy.concatenate(vertices), numpy.float32)
+            self.uvs = numpy.ascontiguousarray(numpy.concatenate(uvs), numpy.float32)
+        else:
+            self.vertices = numpy.zeros((0, 2), numpy.float32)
+            self.uvs = numpy.zeros((0, 2), numpy.float32)
+
+    def render(self, w, h):
+        """Рисует текст поверх кадра размером w x h, состояние OpenGL восстанавливается"""
+        if not len(self.vertices):
+            return
+        glPushAttrib(GL_ENABLE_BIT | GL_CURRENT_BIT | GL_TEXTURE_BIT | GL_COLOR_BUFFER_BIT)
+        glDisable(GL_DEPTH_TEST)
+        glDisable(GL_POLYGON_SMOOTH)
+        glEnable(GL_TEXTURE_2D)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glBindTexture(GL_TEXTURE_2D, self.atlas.texture_id)
+        glColor4f(*self.color)
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        # экранные координаты в пикселях, y вниз
+        glOrtho(0, w, h, 0, -1, 1)
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, self.vertices)
+        glTexCoordPointer(2, GL_FLOAT, 0, self.uvs)
+        glDrawArrays(GL_QUADS, 0, len(self.vertices))
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        glPopAttrib()
+
+    def delete(self):
+        self.atlas.delete()
@@ -0,0 +1,129 @@
+"""
+Кэш текстур OpenGL
+
+Каждое сочетание (файл, время изменения, повторение, фильтр, растяжение до степени двойки,
+mip-уровни) декодируется и загружается в GPU один раз, id текстуры разделяется между всеми объектами.
+Для записей ведется счетчик ссылок; если суммарный объем текстур превышает бюджет,
+удаляются давно не использованные текстуры, на которые больше никто не ссылается.
+Если задан TextureLoader, файлы декодируются в фоне, а до загрузки выдается заглушка.
+"""
+
+import collections
+import os
+
+from OpenGL.GL import *
+
+import textures
+
+
+class Texture(object):
+    """Запись кэша: текстура OpenGL и сведения о ней"""
+
+    def __init__(self, key, texture_id, width, height, nbytes):
+        self.key = key
+        self.texture_id = texture_id
+        self.width = width
+        self.height = height
+        self.nbytes = nbytes  # примерный объем памяти текстуры в GPU
+        self.refs = 0  # сколько объектов используют текстуру
+        self.loaded = texture_id is not None  # False, пока вместо текстуры используется заглушка
+
+
+class TextureCache(object):
+    """Кэш текстур с вытеснением давно не использованных (LRU)"""
+
+    def __init__(self, budget=256 * 2 ** 20, loader=None, mip_cache_dir=None):
+        """budget - бюджет памяти текстур в байтах, loader - TextureLoader для фоновой загрузки,
+        mip_cache_dir - каталог для кэша mip-уровней на диске (None - не сохранять)
+        """
+        self.budget = budget
+        self.loader = loader
+        self.mip_cache_dir = mip_cache_dir
+        self.entries = collections.OrderedDict()  # ключ -> Texture, от старых к новым
+        self.used = 0  # занятая память в байтах
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(filename, wrap=GL_CLAMP, filter=GL_LINEAR, resize=False, mipmaps=False):
+        """Ключ кэша: при изменении файла меняется и ключ"""
+        path = os.path.abspath(filename)
+        return path, os.path.getmtime(path), int(wrap), int(filter), bool(resize), bool(mipmaps)
+
+    def acquire(self, filename, wrap=GL_CLAMP, filter=GL_LINEAR, resize=False, mipmaps=False):
+        """Возвращает текстуру из кэша (или загружает ее) и увеличивает счетчик ссылок"""
+        key = self.make_key(filename, wrap, filter, resize, mipmaps)
+        texture = self.entries.get(key)
+        if texture is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        else:
+            self.misses += 1
+            if self.loader is None:
+                texture = self.load(key)
+            else:
+                texture = self.load_async(key)
+            self.entries[key] = texture
+            self.used += texture.nbytes
+        texture.refs += 1
+        self.evict()
+        return texture
+
+    def load(self, key):
+        """Декодирует файл и загружает его в GPU"""
+        path, mtime, wrap, filter, resize, mipmaps = key
+        levels = textures.load_levels(path, resize, mipmaps, cache_dir=self.mip_cache_dir)
+        texture_id = textures.upload_levels(levels, wrap, filter)
+        height, width = levels[0].shape[:2]
+        return Texture(key, texture_id, width, height, sum(level.nbytes for level in levels))
+
+    def load_async(self, key):
+        """Ставит файл на фоновое декодирование, пока выдаем заглушку"""
+        texture = Texture(key, None, 0, 0, 0)
+        texture.texture_id = self.loader.placeholder()
+        path, mtime, wrap, filter, resize, mipmaps = key
+        self.loader.request(path, lambda levels: self.uploaded(texture, levels), resize, mipmaps, self.mip_cache_dir)
+        return texture
+
+    def uploaded(self, texture, levels):
+        """Вызывается в основном потоке, когда пиксели декодированы: загружаем их в GPU"""
+        if levels is None or self.entries.get(texture.key) is not texture:
+            # ошибка чтения или текстуру уже вытеснили: остается заглушка
+            return
+        texture.texture_id = textures.upload_levels(levels, texture.key[2], texture.key[3])
+        texture.height, texture.width = levels[0].shape[:2]
+        texture.nbytes = sum(level.nbytes for level in levels)
+        texture.loaded = True
+        self.used += texture.nbytes
+        self.evict()
+
+    def release(self, texture):
+        """Уменьшает счетчик ссылок; текстура остается в кэше до вытеснения"""
+        if texture.refs > 0:
+            texture.refs -= 1
+        self.evict()
+
+    def evict(self):
+        """Удаляет неиспользуемые текстуры, начиная с самых старых, пока не уложимся в бюджет"""
+        if self.used <= self.budget:
+            return
+        for key in [key for key, texture in self.entries.items() if texture.refs == 0]:
+            if self.used <= self.budget:
+                break
+            self.remove(key)
+
+    def remove(self, key):
+        """Удаляет запись из кэша вместе с текстурой OpenGL"""
+        texture = self.entries.pop(key)
+        self.used -= texture.nbytes
+        self.evictions += 1
+        if texture.loaded:
+            glDeleteTextures([texture.texture_id])
+        texture.texture_id = 0
+        texture.loaded = False
+
+    def clear(self):
+        """Удаляет все текстуры"""
+        for key in list(self.entries):
+            self.remove(key)
@@ -0,0 +1,103 @@
+"""
+Бинарный контейнер текстуры (.tex)
+
+Хранит уже декодированные пиксели, чтобы при запуске не разбирать jpg|png через PIL.
+Файл открывается через numpy.memmap, и отображенный в память буфер каждого уровня
+передается в glTexImage2D без промежуточных копий (см. textures.upload_levels).
+
+Формат (little-endian):
+    заголовок   magic 'TEXC', версия, ширина, высота, каналы, количество уровней (uint32)
+    таблица     для каждого уровня: смещение от начала файла и размер в байтах (uint64)
+    данные      уровни друг за другом, строки снизу вверх (как ожидает OpenGL),
+                начало каждого уровня выровнено по ALIGNMENT байт
+
+Создать контейнер из любого изображения: python texture_tools.py pack wall.jpg wall.tex --mipmaps
+"""
+
+import os
+
+import numpy
+
+
+MAGIC = b'TEXC'
+VERSION = 1
+ALIGNMENT = 16
+
+HEADER = numpy.dtype([
+    ('magic', 'S4'),
+    ('version', '<u4'),
+    ('width', '<u4'),
+    ('height', '<u4'),
+    ('channels', '<u4'),
+    ('levels', '<u4'),
+])
+LEVEL = numpy.dtype([
+    ('offset', '<u8'),
+    ('nbytes', '<u8'),
+])
+
+
+class Container(object):
+    """Открытый контейнер: сведения из заголовка и уровни, отображенные в память"""
+
+    def __init__(self, path, width, height, channels, levels):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.levels = levels  # список массивов numpy.memmap формы (h, w, каналы)
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write(path, levels):
+    """Записывает список уровней (h, w, каналы) uint8 в контейнер
+
+    Запись идет во временный файл, который затем заменяет целевой: файл не бывает недописанным.
+    """
+    height, width, channels = levels[0].shape
+    header = numpy.zeros(1, HEADER)
+    header[0] = (MAGIC, VERSION, width, height, channels, len(levels))
+    table = numpy.zeros(len(levels), LEVEL)
+    offset = _align(HEADER.itemsize + LEVEL.itemsize * len(levels))
+    for i, level in enumerate(levels):
+        table[i] = (offset, level.nbytes)
+        offset = _align(offset + level.nbytes)
+
+    tmp_path = "%s.%s.tmp" % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(table.tobytes())
+        for (offset, nbytes), level in zip(table, levels):
+            f.seek(int(offset))
+            f.write(numpy.ascontiguousarray(level, numpy.uint8).tobytes())
+    os.replace(tmp_path, path)
+
+
+def read(path):
+    """Открывает контейнер через memmap, данные читаются с диска только при обращении"""
+    data = numpy.memmap(path, numpy.uint8, 'r')
+    header = data[:HEADER.itemsize].view(HEADER)[0]
+    if header['magic'] != MAGIC:
+        raise ValueError("%s is not a texture container" % path)
+    if header['version'] != VERSION:
+        raise ValueError("%s: unsupported container version %s" % (path, header['version']))
+    count = int(header['levels'])
+    table = data[HEADER.itemsize:HEADER.itemsize + LEVEL.itemsize * count].view(LEVEL)
+
+    width, height, channels = int(header['width']), int(header['height']), int(header['channels'])
+    levels = []
+    level_width, level_height = width, height
+    for offset, nbytes in table:
+        offset, nbytes = int(offset), int(nbytes)
+        if nbytes != level_width * level_height * channels:
+            raise ValueError("%s: level size mismatch" % path)
+        levels.append(data[offset:offset + nbytes].reshape(level_height, level_width, channels))
+        level_width, level_height = max(level_width // 2, 1), max(level_height // 2, 1)
+    return Container(path, width, height, channels, levels)
@@ -0,0 +1,83 @@
+"""
+Фоновая загрузка текстур
+
+Декодирование (растяжение до степени двойки, построение mip-уровней) выполняется
+в пуле потоков или процессов, а загрузка в GPU - только в основном потоке, где создан контекст OpenGL.
+Готовые массивы пикселей попадают в очередь, которую Controller.loop_step разбирает
+в пределах бюджета времени на кадр. Пока текстура не готова, объект рисуется с заглушкой.
+"""
+
+import concurrent.futures
+import queue
+import time
+import traceback
+
+from OpenGL.GL import *
+
+import numpy
+
+import textures
+
+
+class TextureLoader(object):
+    """Декодирует изображения в фоне и загружает их в GPU по частям, кадр за кадром"""
+
+    def __init__(self, workers=None, processes=False, budget_ms=4.0):
+        """workers - размер пула, processes - использовать процессы вместо потоков,
+        budget_ms - сколько миллисекунд за кадр можно тратить на загрузку в GPU
+        """
+        if processes:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.budget_ms = budget_ms
+        self.ready = queue.Queue()  # (future, callback) готовых заданий
+        self.pending = 0  # сколько заданий еще не загружено в GPU
+        self.placeholder_id = None
+
+    def placeholder(self):
+        """Текстура-заглушка 2x2 (шахматная клетка), создается при первом обращении"""
+        if self.placeholder_id is None:
+            img_data = numpy.array([[[255, 0, 255], [64, 64, 64]],
+                                    [[64, 64, 64], [255, 0, 255]]], numpy.uint8)
+            self.placeholder_id = textures.upload(img_data, GL_REPEAT, GL_NEAREST)
+        return self.placeholder_id
+
+    def request(self, filename, callback, resize=False, mipmaps=False, cache_dir=None):
+        """Ставит файл в очередь на декодирование (и построение mip-уровней, см. textures.load_levels)
+
+        callback(levels) будет вызван в основном потоке из pump, levels равен None при ошибке.
+        """
+        self.pending += 1
+        future = self.executor.submit(textures.load_levels, filename, resize, mipmaps, 'box', cache_dir)
+        future.add_done_callback(lambda f: self.ready.put((f, callback)))
+        return future
+
+    def pump(self, budget_ms=None):
+        """Загружает готовые текстуры в GPU, пока не исчерпан бюджет времени кадра
+
+        Хотя бы одна текстура загружается всегда, чтобы очередь не застревала.
+        Возвращает количество обработанных текстур.
+        """
+        if budget_ms is None:
+            budget_ms = self.budget_ms
+        deadline = time.perf_counter() + budget_ms * 0.001
+        count = 0
+        while count == 0 or time.perf_counter() < deadline:
+            try:
+                future, callback = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            count += 1
+            try:
+                levels = future.result()
+            except Exception:
+                traceback.print_exc()
+                levels = None
+            callback(levels)
+        return count
+
+    def shutdown(self):
+        """Останавливает пул, не дожидаясь незавершенных заданий"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
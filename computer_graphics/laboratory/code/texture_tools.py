@@ -0,0 +1,94 @@
+"""
+Утилиты для подготовки текстур из командной строки
+
+Пакетное растяжение до степени двойки всех изображений каталога, параллельно на всех ядрах:
+    python texture_tools.py resize textures/ textures_p2/ --filter bilinear --jobs 8
+    python texture_tools.py resize textures/ textures_small/ --downsample 2
+
+Упаковка изображения в бинарный контейнер (texture_container) с цепочкой mip-уровней:
+    python texture_tools.py pack wall.jpg wall.tex --mipmaps --resize
+OpenGL контекст не нужен.
+"""
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+
+import texture_container
+import textures
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tga', '.gif', '.tif', '.tiff')
+
+
+def find_images(src_dir):
+    """Все изображения каталога (без подкаталогов)"""
+    return sorted(name for name in os.listdir(src_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def resize_file(src, dst, filter='lanczos', downsample=1):
+    """Растягивает один файл до степени двойки и при необходимости уменьшает блочным фильтром"""
+    with textures.Image.open(src) as img:
+        img = textures.resize_power2(img, filter)
+        if downsample > 1:
+            img_data = textures.box_downsample(textures.image_to_array(img, flip=False), downsample)
+            if img_data.shape[2] == 1:
+                img_data = img_data[:, :, 0]
+            img = textures.Image.fromarray(img_data)
+        img.save(dst)
+    return dst
+
+
+def resize_dir(src_dir, dst_dir, filter='lanczos', downsample=1, jobs=None):
+    """Обрабатывает все изображения каталога в пуле процессов, возвращает список готовых файлов"""
+    os.makedirs(dst_dir, exist_ok=True)
+    names = find_images(src_dir)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(resize_file, os.path.join(src_dir, name), os.path.join(dst_dir, name),
+                                   filter, downsample)
+                   for name in names]
+        return [future.result() for future in futures]
+
+
+def pack_file(src, dst, resize=False, mipmaps=False, filter='box'):
+    """Декодирует изображение и сохраняет его в контейнер .tex"""
+    levels = textures.load_levels(src, resize, mipmaps, filter)
+    texture_container.write(dst, levels)
+    return dst
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    resize = commands.add_parser('resize', help='растянуть все изображения каталога до степени двойки')
+    resize.add_argument('src_dir')
+    resize.add_argument('dst_dir')
+    resize.add_argument('--filter', default='lanczos', choices=sorted(textures.RESIZE_FILTERS),
+                        help='фильтр растяжения (nearest - быстрее, lanczos - качественнее)')
+    resize.add_argument('--downsample', type=int, default=1, help='дополнительно уменьшить в N раз (numpy)')
+    resize.add_argument('--jobs', type=int, default=None, help='количество процессов (по умолчанию - все ядра)')
+
+    pack = commands.add_parser('pack', help='упаковать изображение в контейнер .tex')
+    pack.add_argument('src')
+    pack.add_argument('dst')
+    pack.add_argument('--resize', action='store_true', help='растянуть до степени двойки')
+    pack.add_argument('--mipmaps', action='store_true', help='сохранить полную цепочку mip-уровней')
+    pack.add_argument('--filter', default='box', choices=('box', 'kaiser'), help='фильтр mip-уровней')
+
+    args = parser.parse_args(argv)
+    if args.command == 'resize':
+        start = time.perf_counter()
+        done = resize_dir(args.src_dir, args.dst_dir, args.filter, args.downsample, args.jobs)
+        print("%s files in %.2f s" % (len(done), time.perf_counter() - start))
+    elif args.command == 'pack':
+        pack_file(args.src, args.dst, args.resize, args.mipmaps, args.filter)
+        container = texture_container.read(args.dst)
+        print("%s: %sx%s, %s channels, %s levels, %s bytes" % (
+            args.dst, container.width, container.height, container.channels, len(container.levels), container.nbytes))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""
+Вспомогательные функции для подготовки текстур
+
+Изображение из PIL преобразуется в непрерывный массив numpy.uint8 формы (h, w, каналы)
+без промежуточного списка пикселей (list(img.getdata()) создает по кортежу на каждый пиксель).
+Здесь же строится цепочка mip-уровней на CPU и сохраняется в кэш на диске (texture_container).
+"""
+
+import hashlib
+import math
+import os
+
+from OpenGL.GL import *
+
+try:
+    import PIL.Image as Image
+except ImportError as err:
+    import Image
+import numpy
+
+import texture_container
+
+
+# количество каналов -> формат данных OpenGL
+GL_FORMATS = {
+    1: GL_LUMINANCE,
+    3: GL_RGB,
+    4: GL_RGBA,
+}
+
+
+def image_mode(img):
+    """Режим, в который нужно привести изображение, чтобы передать его в OpenGL"""
+    if img.mode in ('L', 'RGB', 'RGBA'):
+        return img.mode
+    # палитра и прочие режимы: сохраняем прозрачность, если она есть
+    if img.mode == 'P' and 'transparency' in img.info:
+        return 'RGBA'
+    if 'A' in img.getbands():
+        return 'RGBA'
+    if img.mode in ('1', 'I;16', 'I', 'F'):
+        return 'L'
+    return 'RGB'
+
+
+def image_to_array(img, flip=True):
+    """Преобразует изображение PIL в массив uint8 формы (h, w, каналы)
+
+    flip - переворачивает строки: в OpenGL первая строка текстуры нижняя.
+    Данные копируются один раз (из буфера PIL сразу в нужном порядке строк),
+    массив numpy создается поверх полученных байт без копирования.
+    """
+    mode = image_mode(img)
+    if img.mode != mode:
+        img = img.convert(mode)
+    width, height = img.size
+    data = img.tobytes('raw', mode, 0, -1 if flip else 1)
+    return numpy.frombuffer(data, numpy.uint8).reshape(height, width, len(mode))
+
+
+def load_image(filename, flip=True, resize=False):
+    """Открывает файл и возвращает массив пикселей
+
+    resize - растянуть до размеров, кратных степени двойки.
+    Не использует OpenGL, поэтому может выполняться в отдельном потоке или процессе.
+    """
+    with Image.open(filename) as img:
+        if resize:
+            img = resize_power2(img)
+        return image_to_array(img, flip)
+
+
+# фильтры для растяжения, от самого быстрого к самому качественному
+RESIZE_FILTERS = {
+    'nearest': Image.NEAREST,
+    'box': Image.BOX,
+    'bilinear': Image.BILINEAR,
+    'bicubic': Image.BICUBIC,
+    'lanczos': Image.LANCZOS,
+}
+
+
+def next_p2(num):
+    """Если число не является степенью двойки, то возвращаем ближайшую большую степень"""
+    # (num - 1).bit_length() - номер старшего бита, вместо цикла со сдвигами
+    # дробные размеры округляются вверх, как в прежнем цикле (while rval < num)
+    return 1 << max(math.ceil(num) - 1, 0).bit_length()
+
+
+def is_p2(num):
+    """Является ли число степенью двойки"""
+    return num > 0 and num & (num - 1) == 0
+
+
+def resize_power2(img, filter='lanczos'):
+    """Растягивает изображение до размеров, кратных степени двойки
+
+    Если размеры уже подходят, изображение возвращается без изменений.
+    filter - ключ RESIZE_FILTERS: 'nearest' самый быстрый, 'lanczos' самый качественный.
+    """
+    width, height = img.size
+    if is_p2(width) and is_p2(height):
+        return img
+    return img.resize((next_p2(width), next_p2(height)), RESIZE_FILTERS[filter])
+
+
+def box_downsample(img_data, factor=2):
+    """Уменьшает массив (h, w, каналы) в factor раз усреднением блоков factor x factor
+
+    Чистый numpy, без PIL: удобно для пакетной обработки уже декодированных данных.
+    Лишние строки и столбцы, не кратные factor, отбрасываются.
+    Сторона короче factor усредняется целиком в один пиксель.
+    """
+    if factor == 1:
+        return img_data
+    height, width, channels = img_data.shape
+    fy, fx = min(factor, height), min(factor, width)
+    height, width = height // fy, width // fx
+    blocks = img_data[:height * fy, :width * fx].reshape(height, fy, width, fx, channels)
+    total = blocks.sum(axis=(1, 3), dtype=numpy.uint32)
+    # округляем к ближайшему целому
+    return ((total + fy * fx // 2) // (fy * fx)).astype(numpy.uint8)
+
+
+def halve(level, filter='box'):
+    """Следующий mip-уровень: уменьшает массив (h, w, каналы) в два раза по каждой стороне
+
+    Сторона длиной 1 не уменьшается, нечетный последний столбец или строка отбрасываются.
+    """
+    if filter == 'kaiser':
+        result = level.astype(numpy.float32)
+        for axis in (0, 1):
+            result = _kaiser_halve(result, axis)
+        return numpy.clip(numpy.rint(result), 0, 255).astype(numpy.uint8)
+    height, width, channels = level.shape
+    fy, fx = (2 if height > 1 else 1), (2 if width > 1 else 1)
+    height, width = height // fy, width // fx
+    blocks = level[:height * fy, :width * fx].reshape(height, fy, width, fx, channels)
+    total = blocks.sum(axis=(1, 3), dtype=numpy.uint32)
+    return ((total + fy * fx // 2) // (fy * fx)).astype(numpy.uint8)
+
+
+def _kaiser_kernel(taps=4, beta=4.0):
+    """Веса фильтра sinc с окном Кайзера для уменьшения в два раза (2 * taps отсчетов)"""
+    distance = numpy.arange(2 * taps) - taps + 0.5
+    kernel = numpy.sinc(distance / 2.0) * numpy.kaiser(2 * taps, beta)
+    return (kernel / kernel.sum()).astype(numpy.float32)
+
+
+def _kaiser_halve(data, axis, taps=4):
+    """Фильтрует и прореживает в два раза вдоль одной оси, края повторяются"""
+    size = data.shape[axis]
+    if size == 1:
+        return data
+    count = size // 2
+    pad = [(0, 0)] * data.ndim
+    pad[axis] = (taps, taps)
+    padded = numpy.pad(data, pad, mode='edge')
+    result = numpy.zeros_like(numpy.take(data, numpy.arange(count), axis=axis))
+    for t, weight in enumerate(_kaiser_kernel(taps)):
+        # отсчет 2i + 1 + t дополненного массива для каждого выходного i
+        result += weight * numpy.take(padded, numpy.arange(count) * 2 + 1 + t, axis=axis)
+    return result
+
+
+def build_mipmaps(img_data, filter='box'):
+    """Полная цепочка mip-уровней до 1x1, нулевой уровень - исходный массив
+
+    filter - 'box' (среднее 2x2, быстро) или 'kaiser' (sinc с окном Кайзера, меньше наложения)
+    """
+    levels = [img_data]
+    while levels[-1].shape[0] > 1 or levels[-1].shape[1] > 1:
+        levels.append(halve(levels[-1], filter))
+    return levels
+
+
+def mipmap_cache_path(cache_dir, filename, resize=False, filter='box'):
+    """Имя файла кэша: зависит от пути, времени изменения исходника и параметров"""
+    path = os.path.abspath(filename)
+    key = "%s|%s|%s|%s" % (path, os.path.getmtime(path), bool(resize), filter)
+    name = "%s.%s.tex" % (os.path.basename(path), hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+    return os.path.join(cache_dir, name)
+
+
+def load_levels(filename, resize=False, mipmaps=False, filter='box', cache_dir=None):
+    """Декодирует файл и возвращает список уровней для upload_levels
+
+    Файлы .tex (texture_container) не декодируются, а открываются через memmap как есть.
+    Если задан cache_dir, цепочка mip-уровней сохраняется на диск в контейнер, а при следующем
+    запуске открывается через memmap: декодирование и фильтрация пропускаются.
+    """
+    if filename.endswith('.tex'):
+        return texture_container.read(filename).levels
+    cache_path = None
+    if mipmaps and cache_dir is not None:
+        cache_path = mipmap_cache_path(cache_dir, filename, resize, filter)
+        if os.path.exists(cache_path):
+            return texture_container.read(cache_path).levels
+    img_data = load_image(filename, resize=resize)
+    if not mipmaps:
+        return [img_data]
+    levels = build_mipmaps(img_data, filter)
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        texture_container.write(cache_path, levels)
+    return levels
+
+
+# фильтр уменьшения при наличии mip-уровней
+MIPMAP_MIN_FILTERS = {
+    GL_NEAREST: GL_NEAREST_MIPMAP_NEAREST,
+    GL_LINEAR: GL_LINEAR_MIPMAP_LINEAR,
+}
+
+
+def upload(img_data, wrap=GL_CLAMP, filter=GL_LINEAR):
+    """Создает текстуру OpenGL из массива (h, w, каналы) и возвращает ее id
+
+    Повторяет шаги TextureHelper.load, но параметры повторения и фильтры задаются аргументами.
+    """
+    return upload_levels([img_data], wrap, filter)
+
+
+def upload_levels(levels, wrap=GL_CLAMP, filter=GL_LINEAR):
+    """Создает текстуру и загружает каждый уровень цепочки через glTexImage2D"""
+    channels = levels[0].shape[2]
+    gl_format = GL_FORMATS[channels]
+    texture_id = glGenTextures(1)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glBindTexture(GL_TEXTURE_2D, texture_id)
+    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, wrap)
+    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, wrap)
+    glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, filter)
+    if len(levels) > 1:
+        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, MIPMAP_MIN_FILTERS.get(filter, filter))
+    else:
+        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, filter)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(levels) - 1)
+    for i, level in enumerate(levels):
+        height, width = level.shape[:2]
+        glTexImage2D(GL_TEXTURE_2D, i, gl_format, width, height, 0, gl_format, GL_UNSIGNED_BYTE, level)
+    glBindTexture(GL_TEXTURE_2D, 0)
+    return texture_id
+
+
+def upload_array(layers, wrap=GL_CLAMP, filter=GL_LINEAR):
+    """Создает массив текстур (GL_TEXTURE_2D_ARRAY) из слоев одинакового размера (h, w, каналы)
+
+    Все слои загружаются одним вызовом glTexImage3D; в шейдере слой выбирается третьей
+    координатой (sampler2DArray), поэтому объекты с разными текстурами рисуются без смены текстуры.
+    """
+    data = numpy.ascontiguousarray(numpy.stack(layers), numpy.uint8)
+    count, height, width, channels = data.shape
+    gl_format = GL_FORMATS[channels]
+    texture_id = glGenTextures(1)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glBindTexture(GL_TEXTURE_2D_ARRAY, texture_id)
+    glTexParameterf(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_S, wrap)
+    glTexParameterf(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_T, wrap)
+    glTexParameterf(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MAG_FILTER, filter)
+    glTexParameterf(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MIN_FILTER, MIPMAP_MIN_FILTERS.get(filter, filter))
+    glTexImage3D(GL_TEXTURE_2D_ARRAY, 0, gl_format, width, height, count, 0, gl_format, GL_UNSIGNED_BYTE, data)
+    glGenerateMipmap(GL_TEXTURE_2D_ARRAY)
+    glBindTexture(GL_TEXTURE_2D_ARRAY, 0)
+    return texture_id
@@ -0,0 +1,197 @@
+"""
+Матрицы преобразований на numpy вместо gluPerspective|gluLookAt|glRotatef
+
+Все функции возвращают матрицы 4x4 float32 в привычной математической записи
+(по строкам, вектор умножается справа: M @ v), поэтому в OpenGL их нужно передавать
+транспонированными: glUniformMatrix4fv(..., GL_TRUE, m) или glLoadMatrixf(m.T).
+Модуль не использует OpenGL и работает без контекста.
+"""
+
+import math
+
+import numpy
+
+
+def identity():
+    return numpy.identity(4, numpy.float32)
+
+
+def perspective(fov, aspect, near, far):
+    """Матрица перспективы, как gluPerspective (fov - вертикальный угол в градусах)"""
+    f = 1.0 / math.tan(math.radians(fov) / 2.0)
+    m = numpy.zeros((4, 4), numpy.float32)
+    m[0, 0] = f / aspect
+    m[1, 1] = f
+    m[2, 2] = (far + near) / (near - far)
+    m[2, 3] = 2.0 * far * near / (near - far)
+    m[3, 2] = -1.0
+    return m
+
+
+def look_at(eye, target, up):
+    """Матрица вида, как gluLookAt"""
+    eye = numpy.asarray(eye, numpy.float64)
+    forward = numpy.asarray(target, numpy.float64) - eye
+    forward /= numpy.linalg.norm(forward)
+    side = numpy.cross(forward, up)
+    side /= numpy.linalg.norm(side)
+    up = numpy.cross(side, forward)
+    m = numpy.identity(4)
+    m[0, :3] = side
+    m[1, :3] = up
+    m[2, :3] = -forward
+    m[:3, 3] = -m[:3, :3] @ eye
+    return m.astype(numpy.float32)
+
+
+def translate(x, y, z):
+    """Матрица переноса, как glTranslatef"""
+    m = identity()
+    m[:3, 3] = (x, y, z)
+    return m
+
+
+def scale(x, y, z):
+    """Матрица масштабирования, как glScalef"""
+    return numpy.diag(numpy.array((x, y, z, 1.0), numpy.float32))
+
+
+def rotate(angle, x, y, z):
+    """Матрица поворота на angle градусов вокруг оси (x, y, z), как glRotatef"""
+    axis = numpy.array((x, y, z), numpy.float64)
+    x, y, z = axis / numpy.linalg.norm(axis)
+    c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    t = 1.0 - c
+    m = identity()
+    m[:3, :3] = (
+        (t * x * x + c, t * x * y - s * z, t * x * z + s * y),
+        (t * x * y + s * z, t * y * y + c, t * y * z - s * x),
+        (t * x * z - s * y, t * y * z + s * x, t * z * z + c),
+    )
+    return m
+
+
+def rotate_batch(angle, axis):
+    """rotate для массива углов (N,) и осей (N, 3) или одной оси (3,), возвращает (N, 4, 4)"""
+    angle = numpy.radians(numpy.asarray(angle, numpy.float64))
+    axis = numpy.asarray(axis, numpy.float64)
+    axis = axis / numpy.linalg.norm(axis, axis=-1, keepdims=True)
+    axis = numpy.broadcast_to(axis, angle.shape + (3,))
+    x, y, z = axis[..., 0], axis[..., 1], axis[..., 2]
+    c, s = numpy.cos(angle), numpy.sin(angle)
+    t = 1.0 - c
+    m = numpy.zeros(angle.shape + (4, 4), numpy.float32)
+    m[..., 0, 0] = t * x * x + c
+    m[..., 0, 1] = t * x * y - s * z
+    m[..., 0, 2] = t * x * z + s * y
+    m[..., 1, 0] = t * x * y + s * z
+    m[..., 1, 1] = t * y * y + c
+    m[..., 1, 2] = t * y * z - s * x
+    m[..., 2, 0] = t * x * z - s * y
+    m[..., 2, 1] = t * y * z + s * x
+    m[..., 2, 2] = t * z * z + c
+    m[..., 3, 3] = 1.0
+    return m
+
+
+def quaternion_batch(angle, axis):
+    """Кватернионы (w, x, y, z) поворотов на angle градусов вокруг осей, возвращает (N, 4)"""
+    angle = numpy.radians(numpy.asarray(angle, numpy.float64)) / 2.0
+    axis = numpy.asarray(axis, numpy.float64)
+    axis = axis / numpy.linalg.norm(axis, axis=-1, keepdims=True)
+    q = numpy.empty(numpy.broadcast(angle[..., None], axis).shape[:-1] + (4,), numpy.float32)
+    q[..., 0] = numpy.cos(angle)
+    q[..., 1:] = axis * numpy.sin(angle)[..., None]
+    return q
+
+
+def trs_batch(translations, rotations, scales):
+    """Матрицы T @ R @ S из переносов (N, 3), кватернионов (N, 4) и масштабов (N, 3), возвращает (N, 4, 4)"""
+    rotations = numpy.asarray(rotations, numpy.float32)
+    w, x, y, z = rotations[..., 0], rotations[..., 1], rotations[..., 2], rotations[..., 3]
+    m = numpy.zeros(rotations.shape[:-1] + (4, 4), numpy.float32)
+    m[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    m[..., 0, 1] = 2 * (x * y - w * z)
+    m[..., 0, 2] = 2 * (x * z + w * y)
+    m[..., 1, 0] = 2 * (x * y + w * z)
+    m[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    m[..., 1, 2] = 2 * (y * z - w * x)
+    m[..., 2, 0] = 2 * (x * z - w * y)
+    m[..., 2, 1] = 2 * (y * z + w * x)
+    m[..., 2, 2] = 1 - 2 * (x * x + y * y)
+    # масштаб умножается справа: столбцы поворота умножаются на масштаб по осям
+    m[..., :3, :3] *= numpy.asarray(scales, numpy.float32)[..., None, :]
+    m[..., :3, 3] = translations
+    m[..., 3, 3] = 1.0
+    return m
+
+
+def perspective_batch(fov, aspect, near, far):
+    """perspective для массивов параметров длины N, возвращает (N, 4, 4)"""
+    fov, aspect, near, far = numpy.broadcast_arrays(*(numpy.asarray(x, numpy.float64) for x in (fov, aspect, near, far)))
+    f = 1.0 / numpy.tan(numpy.radians(fov) / 2.0)
+    m = numpy.zeros(fov.shape + (4, 4), numpy.float32)
+    m[..., 0, 0] = f / aspect
+    m[..., 1, 1] = f
+    m[..., 2, 2] = (far + near) / (near - far)
+    m[..., 2, 3] = 2.0 * far * near / (near - far)
+    m[..., 3, 2] = -1.0
+    return m
+
+
+def look_at_batch(eye, target, up):
+    """look_at для массивов (N, 3), возвращает (N, 4, 4)"""
+    eye = numpy.asarray(eye, numpy.float64)
+    forward = numpy.asarray(target, numpy.float64) - eye
+    forward /= numpy.linalg.norm(forward, axis=-1, keepdims=True)
+    side = numpy.cross(forward, up)
+    side /= numpy.linalg.norm(side, axis=-1, keepdims=True)
+    up = numpy.cross(side, forward)
+    m = numpy.zeros(eye.shape[:-1] + (4, 4))
+    m[..., 0, :3] = side
+    m[..., 1, :3] = up
+    m[..., 2, :3] = -forward
+    m[..., :3, 3] = -numpy.einsum('...ij,...j->...i', m[..., :3, :3], eye)
+    m[..., 3, 3] = 1.0
+    return m.astype(numpy.float32)
+
+
+class MatrixStack(object):
+    """Стек матриц, как glPushMatrix|glPopMatrix, но на CPU
+
+    Как и в OpenGL, операции умножают текущую матрицу справа: translate затем rotate
+    дает top = T @ R.
+    """
+
+    def __init__(self):
+        self.stack = [identity()]
+
+    @property
+    def top(self):
+        return self.stack[-1]
+
+    def push(self):
+        self.stack.append(self.stack[-1].copy())
+
+    def pop(self):
+        if len(self.stack) == 1:
+            raise IndexError("matrix stack underflow")
+        return self.stack.pop()
+
+    def load(self, m):
+        self.stack[-1] = numpy.array(m, numpy.float32)
+
+    def load_identity(self):
+        self.stack[-1] = identity()
+
+    def mult(self, m):
+        self.stack[-1] = self.stack[-1] @ m
+
+    def translate(self, x, y, z):
+        self.mult(translate(x, y, z))
+
+    def rotate(self, angle, x, y, z):
+        self.mult(rotate(angle, x, y, z))
+
+    def scale(self, x, y, z):
+        self.mult(scale(x, y, z))
@@ -1,6 +1,9 @@
 #version 150 compatibility
 
 uniform float time;
+uniform mat4 projection;
+uniform mat4 view;
+uniform mat4 model;
 
 in vec4 position;
 in vec2 uv;
@@ -14,5 +17,5 @@ void main()
    p.y += sin(time*p.y);
    p.x += cos(time*p.x);
    p.z += sin(time*p.z);
-   gl_Position = gl_ModelViewProjectionMatrix * vec4(p, position.w);
+   gl_Position = projection * view * model * vec4(p, position.w);
 }
\ No newline at end of file